@@ -0,0 +1 @@
+"""Benchmark di WeFlai: eseguire dalla root del progetto con `python -m benchmarks.<nome>`."""
@@ -0,0 +1,188 @@
+"""
+Prenotazioni concorrenti sullo stesso volo (weflai.tools.inventory).
+
+Crea un volo di prova con `--posti` posti e lancia `--utenti` prenotazioni in
+parallelo (thread, engine con pool di weflai.tools.database). Ogni utente
+ripete la chiamata `--ripetizioni` volte con la stessa chiave, come un agente
+che ritenta il tool. Alla fine verifica sul DB:
+- prenotazioni create = min(utenti, posti), nessuna chiave duplicata
+- posti_disponibili = max(posti - utenti, 0) e coerente con le prenotazioni
+e riporta throughput e latenze p50/p95 delle chiamate.
+
+Richiede la migrazione dei posti (seat_inventory). Il volo di prova e le sue
+prenotazioni vengono rimossi alla fine, salvo --keep.
+
+Uso: python -m benchmarks.booking_race [--utenti 200] [--posti 50] [--ripetizioni 2] [--json out.json]
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+
+class Attempt(NamedTuple):
+    utente: int
+    esito: str                       # "ok", "replay", "esaurito", "errore"
+    id_prenotazione: Optional[int]
+    seconds: float
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def create_flight(posti: int) -> int:
+    """Volo di prova tra i primi due aeroporti, con `posti` posti."""
+    from weflai.tools import database
+
+    with database.get_engine().begin() as conn:
+        return conn.execute(text("""
+            INSERT INTO we_flai.voli (compagnia, id_apt_ptz, id_apt_arr, data_ptz, data_arr,
+                                      ora_ptz, ora_arr, prezzo, posti_totali)
+            SELECT 'BENCH RACE', a.id_aeroporto, b.id_aeroporto, current_date + 365, current_date + 365,
+                   '06:00', '07:00', 1.00, :posti
+            FROM (SELECT id_aeroporto FROM we_flai.aeroporti ORDER BY id_aeroporto LIMIT 1) a,
+                 (SELECT id_aeroporto FROM we_flai.aeroporti ORDER BY id_aeroporto OFFSET 1 LIMIT 1) b
+            RETURNING id_volo
+        """), {"posti": posti}).scalar_one()
+
+
+def drop_flight(id_volo: int) -> None:
+    from weflai.tools import database
+
+    with database.get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM we_flai.prenotazioni WHERE id_volo = :v"), {"v": id_volo})
+        conn.execute(text("DELETE FROM we_flai.voli WHERE id_volo = :v"), {"v": id_volo})
+
+
+def _booker(id_volo: int, utente: int, ripetizioni: int, start: threading.Event) -> list[Attempt]:
+    from weflai.tools import database, inventory
+
+    nome, cognome, mail = "Utente", f"Race{utente}", f"race{utente}@bench.invalid"
+    chiave = inventory.idempotency_key(id_volo, nome, cognome, mail)
+    start.wait()
+    attempts = []
+    for _ in range(ripetizioni):
+        t0 = time.perf_counter()
+        try:
+            booking = inventory.reserve(id_volo, f"DOCRACE{utente}", nome, cognome, mail, chiave)
+            esito, id_prenotazione = ("replay" if booking.replayed else "ok"), booking.id_prenotazione
+        except database.FlightFullError:
+            esito, id_prenotazione = "esaurito", None
+        except Exception as e:
+            logger.warning(f"Utente {utente}: {e}")
+            esito, id_prenotazione = "errore", None
+        attempts.append(Attempt(utente, esito, id_prenotazione, time.perf_counter() - t0))
+    return attempts
+
+
+def check(id_volo: int, utenti: int, posti: int, attempts: list[Attempt]) -> list[str]:
+    """Invarianti violate (lista vuota = tutto corretto)."""
+    from weflai.tools import database
+
+    with database.get_engine().connect() as conn:
+        prenotazioni, chiavi = conn.execute(text(
+            "SELECT count(*), count(DISTINCT chiave_idempotenza) FROM we_flai.prenotazioni WHERE id_volo = :v"
+        ), {"v": id_volo}).one()
+        disponibili, totali = conn.execute(text(
+            "SELECT posti_disponibili, posti_totali FROM we_flai.voli WHERE id_volo = :v"
+        ), {"v": id_volo}).one()
+
+    problems = []
+    expected = min(utenti, posti)
+    if prenotazioni != expected:
+        problems.append(f"prenotazioni {prenotazioni}, attese {expected}")
+    if chiavi != prenotazioni:
+        problems.append(f"chiavi duplicate: {prenotazioni - chiavi}")
+    if disponibili != max(posti - utenti, 0):
+        problems.append(f"posti_disponibili {disponibili}, attesi {max(posti - utenti, 0)}")
+    if disponibili != totali - prenotazioni:
+        problems.append(f"contatore incoerente: {totali} - {prenotazioni} != {disponibili}")
+    # Ogni utente vede sempre la stessa prenotazione, qualunque sia la ripetizione
+    ids: dict[int, set] = {}
+    for a in attempts:
+        if a.id_prenotazione is not None:
+            ids.setdefault(a.utente, set()).add(a.id_prenotazione)
+    multiple = [u for u, found in ids.items() if len(found) > 1]
+    if multiple:
+        problems.append(f"utenti con più prenotazioni: {multiple[:5]}")
+    if any(a.esito == "errore" for a in attempts):
+        problems.append(f"errori: {sum(a.esito == 'errore' for a in attempts)}")
+    return problems
+
+
+def race(utenti: int, posti: int, ripetizioni: int = 2, workers: Optional[int] = None,
+         keep: bool = False) -> dict:
+    from weflai.tools import database
+
+    id_volo = create_flight(posti)
+    start = threading.Event()
+    workers = workers or min(utenti, database.POOL_SIZE + database.MAX_OVERFLOW)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_booker, id_volo, u, ripetizioni, start) for u in range(utenti)]
+            t0 = time.perf_counter()
+            start.set()
+            attempts = [a for f in futures for a in f.result()]
+            wall = time.perf_counter() - t0
+        problems = check(id_volo, utenti, posti, attempts)
+    finally:
+        if not keep:
+            drop_flight(id_volo)
+
+    seconds = [a.seconds for a in attempts]
+    return {
+        "id_volo": id_volo,
+        "utenti": utenti,
+        "posti": posti,
+        "ripetizioni": ripetizioni,
+        "workers": workers,
+        "esiti": {e: sum(a.esito == e for a in attempts) for e in ("ok", "replay", "esaurito", "errore")},
+        "wall_s": round(wall, 3),
+        "chiamate_al_s": round(len(attempts) / wall, 1) if wall else 0.0,
+        "p50_ms": round(1000 * _percentile(seconds, 0.50), 2),
+        "p95_ms": round(1000 * _percentile(seconds, 0.95), 2),
+        "mean_ms": round(1000 * statistics.fmean(seconds), 2) if seconds else 0.0,
+        "problemi": problems,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prenotazioni concorrenti sullo stesso volo")
+    parser.add_argument("--utenti", type=int, default=200, help="prenotazioni concorrenti (una per utente)")
+    parser.add_argument("--posti", type=int, default=50, help="capacità del volo di prova")
+    parser.add_argument("--ripetizioni", type=int, default=2, help="chiamate per utente con la stessa chiave")
+    parser.add_argument("--workers", type=int, help="thread (default: connessioni del pool)")
+    parser.add_argument("--keep", action="store_true", help="non rimuove volo e prenotazioni di prova")
+    parser.add_argument("--json", help="scrive il risultato in questo file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    result = race(args.utenti, args.posti, args.ripetizioni, args.workers, args.keep)
+    print(f"volo {result['id_volo']}: {result['utenti']} utenti x {result['ripetizioni']}, "
+          f"{result['posti']} posti, {result['workers']} thread")
+    print(f"esiti: {result['esiti']}")
+    print(f"{result['chiamate_al_s']} chiamate/s, p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if result["problemi"]:
+        print("INVARIANTI VIOLATE: " + "; ".join(result["problemi"]))
+        sys.exit(1)
+    print("OK: nessun overbooking, nessun duplicato")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Generatore deterministico di dati per i benchmark.
+
+Scala `Script WeFlai.sql` allo schema usato dall'applicazione (we_flai, nomi
+minuscoli): aeroporti e compagnie vengono letti dallo script, voli e
+prenotazioni generati con un seme fisso (stessi argomenti -> stessi dati).
+Il caricamento usa COPY in streaming, quindi regge milioni di righe.
+
+Uso:
+    python -m benchmarks.datagen --voli 1000000 --prenotazioni 3000000 --reset
+    python -m benchmarks.datagen --voli 50000 --out seed.sql      # script per psql
+"""
+import argparse
+import io
+import logging
+import random
+import re
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+SQL_SCRIPT = Path(__file__).resolve().parent.parent / "Script WeFlai.sql"
+
+_RE_AIRPORT = re.compile(r"\('([A-Z]{3})','([^']*)','([^']*)'\)")
+_RE_COMPANY = re.compile(r"\('([^']+)',\d+,\d+,DATE")
+_RE_TIME = re.compile(r"TIME '(\d{2}:\d{2})',TIME")
+
+EUROPA = {"Francia", "Paesi Bassi", "Germania", "Spagna", "Svizzera", "Austria", "Regno Unito"}
+
+NOMI = ["Mario", "Luca", "Giulia", "Francesca", "Marco", "Sara", "Alessandro", "Chiara",
+        "Davide", "Elena", "Matteo", "Martina", "Andrea", "Valentina", "Paolo", "Anna"]
+COGNOMI = ["Rossi", "Russo", "Ferrari", "Esposito", "Bianchi", "Romano", "Colombo", "Ricci",
+           "Marino", "Greco", "Bruno", "Gallo", "Conti", "Costa", "Giordano", "Mancini"]
+
+# Stessa struttura (vincoli e indici) dello script, con i nomi minuscoli dell'applicazione
+SCHEMA_DDL = """
+CREATE SCHEMA IF NOT EXISTS we_flai;
+
+CREATE TABLE IF NOT EXISTS we_flai.aeroporti (
+  id_aeroporto BIGSERIAL PRIMARY KEY,
+  cod_iata     CHAR(3) NOT NULL UNIQUE CHECK (cod_iata ~ '^[A-Z]{3}$'),
+  citta        TEXT NOT NULL,
+  paese        TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS we_flai.voli (
+  id_volo    BIGSERIAL PRIMARY KEY,
+  compagnia  TEXT NOT NULL,
+  id_apt_ptz BIGINT NOT NULL REFERENCES we_flai.aeroporti(id_aeroporto) ON UPDATE CASCADE ON DELETE RESTRICT,
+  id_apt_arr BIGINT NOT NULL REFERENCES we_flai.aeroporti(id_aeroporto) ON UPDATE CASCADE ON DELETE RESTRICT,
+  data_ptz   DATE NOT NULL,
+  data_arr   DATE NOT NULL,
+  ora_ptz    TIME NOT NULL,
+  ora_arr    TIME NOT NULL,
+  prezzo     NUMERIC(10,2) NOT NULL CHECK (prezzo >= 0),
+  CHECK (id_apt_ptz <> id_apt_arr),
+  CHECK (data_arr >= data_ptz)
+);
+
+CREATE TABLE IF NOT EXISTS we_flai.prenotazioni (
+  id_prenotazione BIGSERIAL PRIMARY KEY,
+  id_volo         BIGINT NOT NULL REFERENCES we_flai.voli(id_volo) ON UPDATE CASCADE ON DELETE RESTRICT,
+  id_documento    TEXT NOT NULL,
+  nome_utente     TEXT NOT NULL,
+  cognome_utente  TEXT NOT NULL,
+  mail_utente     TEXT NOT NULL CHECK (mail_utente ~* '^[A-Z0-9._%+-]+@[A-Z0-9.-]+\\.[A-Z]{2,}$')
+);
+"""
+
+INDEX_DDL = """
+CREATE INDEX IF NOT EXISTS idx_voli_tratta_data ON we_flai.voli (id_apt_ptz, id_apt_arr, data_ptz);
+CREATE INDEX IF NOT EXISTS idx_prenotazioni_id_volo ON we_flai.prenotazioni (id_volo);
+CREATE INDEX IF NOT EXISTS idx_prenotazioni_mail ON we_flai.prenotazioni (mail_utente);
+"""
+
+
+def parse_seed_script(path: Path = SQL_SCRIPT) -> tuple[list[tuple[str, str, str]], list[str], list[str]]:
+    """Aeroporti (iata, città, paese), compagnie e orari di partenza dello script originale."""
+    text = path.read_text(encoding="utf-8")
+    airports = list(dict.fromkeys(_RE_AIRPORT.findall(text)))
+    companies = sorted(set(_RE_COMPANY.findall(text)))
+    slots = sorted(set(_RE_TIME.findall(text)))
+    return airports, companies, slots
+
+
+class Generator:
+    """Righe COPY (tab-separated) di voli e prenotazioni, deterministiche dato il seme."""
+
+    def __init__(self, airports: list[tuple[str, str, str]], companies: list[str], slots: list[str],
+                 start: date, days: int, seed: int = 42):
+        self.airports = airports
+        self.companies = companies
+        self.slots = slots
+        self.start = start
+        self.days = days
+        self.seed = seed
+        # Le tratte nazionali ed europee sono più frequenti delle intercontinentali
+        self.weights = [4 if paese == "Italia" else 2 if paese in EUROPA else 1 for _, _, paese in airports]
+
+    def _duration(self, a: int, b: int, rng: random.Random) -> int:
+        """Minuti di volo: brevi in Italia, medi in Europa, lunghi altrimenti."""
+        if min(self.weights[a], self.weights[b]) == 1:
+            return rng.randint(480, 960)
+        if self.weights[a] == 4 and self.weights[b] == 4:
+            return rng.randint(55, 110)
+        return rng.randint(100, 200)
+
+    def flights(self, count: int) -> Iterator[str]:
+        rng = random.Random(self.seed)
+        n = len(self.airports)
+        indexes = range(n)
+        for _ in range(count):
+            a, b = rng.choices(indexes, self.weights, k=2)
+            while b == a:
+                b = rng.choices(indexes, self.weights)[0]
+            day = self.start + timedelta(days=rng.randrange(self.days))
+            hour, minute = map(int, rng.choice(self.slots).split(":"))
+            departure = datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute)
+            minutes = self._duration(a, b, rng)
+            arrival = departure + timedelta(minutes=minutes)
+            price = round(39 + minutes * rng.uniform(0.6, 1.4), 2)
+            yield (f"{rng.choice(self.companies)}\t{a + 1}\t{b + 1}\t{day.isoformat()}\t"
+                   f"{arrival.date().isoformat()}\t{departure:%H:%M}\t{arrival:%H:%M}\t{price:.2f}\n")
+
+    def bookings(self, count: int, first_flight: int, flights: int) -> Iterator[str]:
+        rng = random.Random(self.seed + 1)
+        for i in range(count):
+            nome, cognome = rng.choice(NOMI), rng.choice(COGNOMI)
+            id_volo = first_flight + rng.randrange(flights)
+            mail = f"{nome}.{cognome}{i}@example.com".lower()
+            yield f"{id_volo}\tDOC{i:09d}\t{nome}\t{cognome}\t{mail}\n"
+
+
+class _LineReader(io.RawIOBase):
+    """File-like sopra un iteratore di righe, per copy_expert senza materializzare i dati."""
+
+    def __init__(self, lines: Iterator[str]):
+        self._lines = lines
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        while len(self._buffer) < len(target):
+            chunk = "".join(line for _, line in zip(range(1000), self._lines))
+            if not chunk:
+                break
+            self._buffer += chunk.encode()
+        n = min(len(target), len(self._buffer))
+        target[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+_COPY_VOLI = ("COPY we_flai.voli (compagnia, id_apt_ptz, id_apt_arr, data_ptz, data_arr, ora_ptz, ora_arr, prezzo) "
+              "FROM STDIN")
+_COPY_PRENOTAZIONI = ("COPY we_flai.prenotazioni (id_volo, id_documento, nome_utente, cognome_utente, mail_utente) "
+                      "FROM STDIN")
+
+
+def _airport_rows(airports) -> str:
+    return "".join(f"{i + 1}\t{iata}\t{citta}\t{paese}\n" for i, (iata, citta, paese) in enumerate(airports))
+
+
+def load(generator: Generator, voli: int, prenotazioni: int, reset: bool = False,
+         db_uri: Optional[str] = None) -> None:
+    """Crea lo schema (se serve) e carica i dati con COPY in un'unica transazione."""
+    import psycopg2
+
+    from weflai.tools import availability, database, inventory
+
+    conn = psycopg2.connect(db_uri or database.DB_URI)
+    try:
+        with conn, conn.cursor() as cur:
+            if reset:
+                cur.execute("DROP SCHEMA IF EXISTS we_flai CASCADE")
+            cur.execute(SCHEMA_DDL)
+            # I trigger di indice e posti lavorerebbero riga per riga durante COPY: si ricalcola tutto alla fine
+            cur.execute(availability.DROP_DDL + inventory.BULK_LOAD_DDL)
+            cur.execute("SELECT count(*) FROM we_flai.aeroporti")
+            if cur.fetchone()[0] == 0:
+                cur.copy_expert("COPY we_flai.aeroporti (id_aeroporto, cod_iata, citta, paese) FROM STDIN",
+                                io.StringIO(_airport_rows(generator.airports)))
+                cur.execute("SELECT setval('we_flai.aeroporti_id_aeroporto_seq', (SELECT max(id_aeroporto) FROM we_flai.aeroporti))")
+
+            t0 = time.perf_counter()
+            cur.execute("SELECT coalesce(max(id_volo), 0) FROM we_flai.voli")
+            first_flight = cur.fetchone()[0] + 1
+            cur.copy_expert(_COPY_VOLI, _LineReader(generator.flights(voli)))
+            logger.info(f"voli: {voli} righe in {time.perf_counter() - t0:.1f}s")
+
+            t0 = time.perf_counter()
+            cur.copy_expert(_COPY_PRENOTAZIONI, _LineReader(generator.bookings(prenotazioni, first_flight, voli)))
+            logger.info(f"prenotazioni: {prenotazioni} righe in {time.perf_counter() - t0:.1f}s")
+
+            cur.execute(INDEX_DDL)
+            t0 = time.perf_counter()
+            cur.execute(inventory.SEATS_DDL + availability.INDEX_DDL + availability.REBUILD_SQL)
+            logger.info(f"disponibilita_tratte: ricostruita in {time.perf_counter() - t0:.1f}s")
+        # ANALYZE fuori dalla transazione di caricamento, con statistiche aggiornate per il planner
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE we_flai.aeroporti, we_flai.voli, we_flai.prenotazioni, we_flai.disponibilita_tratte")
+    finally:
+        conn.close()
+
+
+def write_script(generator: Generator, voli: int, prenotazioni: int, out) -> None:
+    """Script per psql (DDL + COPY FROM stdin) su schema vuoto."""
+    from weflai.tools import availability, inventory
+
+    out.write("BEGIN;\n" + SCHEMA_DDL + "\n")
+    out.write("COPY we_flai.aeroporti (id_aeroporto, cod_iata, citta, paese) FROM stdin;\n")
+    out.write(_airport_rows(generator.airports) + "\\.\n")
+    out.write("SELECT setval('we_flai.aeroporti_id_aeroporto_seq', (SELECT max(id_aeroporto) FROM we_flai.aeroporti));\n")
+    out.write(_COPY_VOLI.replace("STDIN", "stdin") + ";\n")
+    out.writelines(generator.flights(voli))
+    out.write("\\.\n" + _COPY_PRENOTAZIONI.replace("STDIN", "stdin") + ";\n")
+    out.writelines(generator.bookings(prenotazioni, 1, voli))
+    out.write("\\.\n" + INDEX_DDL + inventory.SEATS_DDL + availability.INDEX_DDL + availability.REBUILD_SQL
+              + "COMMIT;\n")
+    out.write("ANALYZE we_flai.aeroporti, we_flai.voli, we_flai.prenotazioni, we_flai.disponibilita_tratte;\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera voli e prenotazioni per i benchmark")
+    parser.add_argument("--voli", type=int, default=100_000)
+    parser.add_argument("--prenotazioni", type=int, default=300_000)
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2026, 2, 1), help="primo giorno di volo")
+    parser.add_argument("--days", type=int, default=365, help="giorni coperti dai voli")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="ricrea lo schema we_flai da zero")
+    parser.add_argument("--db-uri", help="default: WEFLAI_DB_URI")
+    parser.add_argument("--out", help="scrive uno script per psql invece di caricare ('-' = stdout)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    airports, companies, slots = parse_seed_script()
+    generator = Generator(airports, companies, slots, args.start, args.days, args.seed)
+    if args.out:
+        out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+        try:
+            write_script(generator, args.voli, args.prenotazioni, out)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    else:
+        load(generator, args.voli, args.prenotazioni, args.reset, args.db_uri)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Server finto con l'API di Ollama, deterministico, per i benchmark.
+
+Risponde a /api/generate, /api/chat (anche in streaming NDJSON), /api/embed,
+/api/embeddings, /api/show, /api/tags e /api/version. Le risposte di testo
+vengono da uno script JSON di regole, provate in ordine sul prompt:
+
+    {"rules": [{"name": "...", "match": "<regex>", "response": "<template>",
+                "model": "<regex>", "ttft": 0.2, "per_token": 0.01}],
+     "models": {"<regex>": {"ttft": 0.02, "per_token": 0.002}},
+     "default": "Thought: ...\\nFinal Answer: ..."}
+
+`response` può usare i gruppi della regex (\\1, \\g<nome>); `model`, se
+presente, limita la regola ai modelli richiesti che la soddisfano (es. le
+risposte di un modello piccolo). Latenza simulata: ttft prima del primo
+token, più per_token per ogni token (parola) successivo; i valori della
+regola prevalgono su quelli del modello ("models"), che prevalgono su quelli
+del server. Gli embedding sono vettori pseudo-casuali derivati dall'hash del
+testo, normalizzati.
+
+Uso: python -m benchmarks.fake_ollama [--port 11500] [--script benchmarks/scripts/weflai.json]
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+DEFAULT_SCRIPT = Path(__file__).parent / "scripts" / "weflai.json"
+EMBED_DIM = 1024
+CONTEXT_LENGTH = 8192
+
+
+class Rule:
+    def __init__(self, spec: dict):
+        self.name = spec.get("name") or spec["match"][:40]
+        self.pattern = re.compile(spec["match"], re.DOTALL)
+        self.response = spec["response"]
+        self.model = re.compile(spec["model"]) if spec.get("model") else None
+        self.ttft: Optional[float] = spec.get("ttft")
+        self.per_token: Optional[float] = spec.get("per_token")
+
+
+class Script:
+    def __init__(self, path: Path):
+        spec = json.loads(Path(path).read_text(encoding="utf-8"))
+        self.rules = [Rule(r) for r in spec.get("rules", [])]
+        self.models = {re.compile(k): v for k, v in spec.get("models", {}).items()}
+        self.default = spec.get("default", "Final Answer: OK")
+
+    def reply(self, prompt: str, model: str = "") -> tuple[Optional[Rule], str]:
+        for rule in self.rules:
+            if rule.model is not None and not rule.model.search(model):
+                continue
+            match = rule.pattern.search(prompt)
+            if match:
+                return rule, match.expand(rule.response)
+        return None, self.default
+
+    def latency(self, model: str) -> dict:
+        for pattern, latency in self.models.items():
+            if pattern.search(model):
+                return latency
+        return {}
+
+
+class FakeOllama:
+    """Stato condiviso dal server: script, latenze e contatori per regola."""
+
+    def __init__(self, script: Path = DEFAULT_SCRIPT, ttft: float = 0.05, per_token: float = 0.0):
+        self.script = Script(script)
+        self.ttft = ttft
+        self.per_token = per_token
+        self._lock = threading.Lock()
+        self.calls: dict[str, int] = {}
+        self.models: dict[str, int] = {}
+        self.embeddings = 0
+
+    def _count(self, name: str, model: str) -> None:
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.models[model] = self.models.get(model, 0) + 1
+
+    def complete(self, prompt: str, model: str = "") -> tuple[list[str], float, float]:
+        """Token della risposta e latenze (ttft, per_token) da applicare."""
+        rule, text = self.script.reply(prompt, model)
+        self._count(rule.name if rule else "<default>", model)
+        latency = self.script.latency(model)
+        ttft = rule.ttft if rule and rule.ttft is not None else latency.get("ttft", self.ttft)
+        per_token = rule.per_token if rule and rule.per_token is not None else latency.get("per_token", self.per_token)
+        return re.findall(r"\S+\s*|\s+", text) or [""], ttft, per_token
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(EMBED_DIM).astype(np.float32)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        with self._lock:
+            self.embeddings += len(texts)
+        return vectors
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {"calls": dict(self.calls), "models": dict(self.models), "embeddings": self.embeddings}
+
+
+def _prompt_from_messages(messages: list[dict]) -> str:
+    return "\n".join(f"{m.get('role', '')}: {m.get('content', '')}" for m in messages)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def make_handler(fake: FakeOllama):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _json(self, payload: dict, status: int = 200) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._json({"models": [{"name": name, "model": name}
+                                       for name in ("llama3.1:8b", "llama3.2:3b", "bge-m3")]})
+            elif self.path == "/api/version":
+                self._json({"version": "0.0.0-fake"})
+            elif self.path == "/api/_stats":
+                self._json(fake.summary())
+            else:
+                self._json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            request = self._body()
+            if self.path == "/api/generate":
+                self._complete(request, request.get("prompt", ""), chat=False)
+            elif self.path == "/api/chat":
+                self._complete(request, _prompt_from_messages(request.get("messages", [])), chat=True)
+            elif self.path == "/api/embed":
+                texts = request.get("input", [])
+                texts = [texts] if isinstance(texts, str) else texts
+                # prompt_eval_count come Ollama: senza, litellm fallisce nel calcolo dell'usage
+                self._json({"model": request.get("model"), "embeddings": fake.embed(texts),
+                            "prompt_eval_count": sum(len(t.split()) for t in texts)})
+            elif self.path == "/api/embeddings":
+                self._json({"embedding": fake.embed([request.get("prompt", "")])[0]})
+            elif self.path == "/api/show":
+                self._json({"model_info": {"llama.context_length": CONTEXT_LENGTH},
+                            "template": "", "capabilities": ["completion"]})
+            else:
+                self._json({"error": "not found"}, 404)
+
+        def _chunk(self, request: dict, text: str, chat: bool, done: bool, **extra) -> dict:
+            payload = {"model": request.get("model"), "created_at": _now(), "done": done, **extra}
+            if chat:
+                payload["message"] = {"role": "assistant", "content": text}
+            else:
+                payload["response"] = text
+            return payload
+
+        def _complete(self, request: dict, prompt: str, chat: bool) -> None:
+            t0 = time.perf_counter()
+            tokens, ttft, per_token = fake.complete(prompt, request.get("model", ""))
+            counts = {"prompt_eval_count": len(prompt.split()), "eval_count": len(tokens), "done_reason": "stop"}
+            time.sleep(ttft)
+            if not request.get("stream", False):
+                time.sleep(per_token * (len(tokens) - 1))
+                counts["total_duration"] = int((time.perf_counter() - t0) * 1e9)
+                self._json(self._chunk(request, "".join(tokens), chat, True, **counts))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(per_token)
+                self._write_chunk(self._chunk(request, token, chat, False))
+            counts["total_duration"] = int((time.perf_counter() - t0) * 1e9)
+            self._write_chunk(self._chunk(request, "", chat, True, **counts))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, payload: dict) -> None:
+            data = json.dumps(payload).encode() + b"\n"
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start(port: int = 0, script: Path = DEFAULT_SCRIPT, ttft: float = 0.05,
+          per_token: float = 0.0, host: str = "127.0.0.1") -> tuple[ThreadingHTTPServer, FakeOllama]:
+    """Avvia il server in un thread daemon; port 0 = porta libera (server.server_port)."""
+    fake = FakeOllama(script, ttft, per_token)
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server, fake
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server Ollama finto per i benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--script", type=Path, default=DEFAULT_SCRIPT)
+    parser.add_argument("--ttft", type=float, default=0.05, help="secondi prima del primo token")
+    parser.add_argument("--per-token", type=float, default=0.0, help="secondi per token successivo")
+    args = parser.parse_args()
+    server, fake = start(args.port, args.script, args.ttft, args.per_token, args.host)
+    print(f"Fake Ollama su http://{args.host}:{server.server_port} (script {args.script})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(json.dumps(fake.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
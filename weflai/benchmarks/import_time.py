@@ -0,0 +1,85 @@
+"""
+Tempo di avvio della CLI.
+
+1. `python -X importtime -c "import <modulo>"`: tempo cumulativo di import e
+   moduli più costosi.
+2. Tempo dal lancio di `kickoff` alla comparsa del menu (stdout), misurato
+   su un processo reale a cui poi si risponde "5" (Esci).
+
+Uso: python -m benchmarks.import_time [--module weflai.main] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MENU_PROMPT = b"Seleziona operazione"
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    env["PYTHONUNBUFFERED"] = "1"
+    return env
+
+
+def import_profile(module: str, top: int = 10) -> tuple[float, list[tuple[int, str]]]:
+    """Tempo totale di import (s) e i `top` moduli con tempo proprio maggiore (µs)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, env=_env(), check=True,
+    )
+    rows = []
+    total_us = 0
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(self_us), name))
+        if name == module:
+            total_us = int(cumulative_us)
+    rows.sort(reverse=True)
+    return total_us / 1e6, rows[:top]
+
+
+def time_to_menu() -> float:
+    """Secondi dal lancio di kickoff alla stampa del prompt del menu."""
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-c", "from weflai.main import kickoff; kickoff()"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=_env(),
+    )
+    buffer = b""
+    while MENU_PROMPT not in buffer:
+        chunk = proc.stdout.read1(4096)
+        if not chunk:
+            raise RuntimeError("kickoff terminato prima di mostrare il menu")
+        buffer += chunk
+    elapsed = time.perf_counter() - t0
+    proc.communicate(b"5\n", timeout=120)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="weflai.main")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    total, heaviest = import_profile(args.module)
+    print(f"import {args.module}: {total * 1000:.0f} ms")
+    for self_us, name in heaviest:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    samples = [time_to_menu() for _ in range(args.runs)]
+    print(
+        f"kickoff -> menu: mediana {statistics.median(samples) * 1000:.0f} ms, "
+        f"max {max(samples) * 1000:.0f} ms su {args.runs} esecuzioni"
+    )
+
+
+if __name__ == "__main__":
+    main()
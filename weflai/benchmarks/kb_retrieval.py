@@ -0,0 +1,136 @@
+"""
+Qualità e latenza della ricerca nel regolamento (weflai.tools.pdf_index).
+
+Per ogni modalità (vector, bm25, hybrid e, con WEFLAI_KB_RERANK_MODEL,
+hybrid+rerank) lancia le domande di un insieme fisso e misura:
+- hit@1 e recall@k: domande con un risultato pertinente al primo posto /
+  tra i primi k
+- MRR@k: media di 1 / posizione del primo risultato pertinente
+- latenza p50/p95 della ricerca (embedding della query compreso)
+
+Un risultato è pertinente se contiene tutti i termini "expect" della domanda
+(benchmarks/scripts/kb_questions.json). Senza --ollama-url gli embedding
+vengono da fake_ollama: vettori pseudo-casuali, quindi la modalità vector
+misura solo la latenza e la fusione vale quanto il BM25; l'indice si
+costruisce in una cartella temporanea per non mescolarsi a quello vero.
+
+Uso: python -m benchmarks.kb_retrieval [--ollama-url http://localhost:11434] [--k 4] [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import unicodedata
+from pathlib import Path
+from typing import Optional
+
+from benchmarks import fake_ollama
+
+DEFAULT_QUESTIONS = Path(__file__).parent / "scripts" / "kb_questions.json"
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).split())
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def relevant(result: dict, expect: list[str]) -> bool:
+    text = _fold(f"{result.get('section') or ''}\n{result['text']}")
+    return all(_fold(term) in text for term in expect)
+
+
+def evaluate(index, questions: list[dict], mode: str, k: int, rerank: bool) -> dict:
+    hits1 = hitsk = 0
+    reciprocal, seconds, misses = [], [], []
+    for q in questions:
+        t0 = time.perf_counter()
+        results = index.search(q["question"], k=k, mode=mode, rerank=rerank)
+        seconds.append(time.perf_counter() - t0)
+        position = next((i for i, r in enumerate(results, start=1) if relevant(r, q["expect"])), None)
+        hits1 += position == 1
+        hitsk += position is not None
+        reciprocal.append(1.0 / position if position else 0.0)
+        if position is None:
+            misses.append(q["question"])
+    n = len(questions)
+    return {
+        "hit@1": round(hits1 / n, 3),
+        f"recall@{k}": round(hitsk / n, 3),
+        f"mrr@{k}": round(statistics.fmean(reciprocal), 3),
+        "p50_ms": round(1000 * _percentile(seconds, 0.50), 2),
+        "p95_ms": round(1000 * _percentile(seconds, 0.95), 2),
+        "mancate": misses,
+    }
+
+
+def run(questions_path: Path, k: int, ollama_url: Optional[str], index_dir: Optional[str]) -> dict:
+    server = None
+    if ollama_url is None:
+        server, _ = fake_ollama.start()
+        ollama_url = f"http://127.0.0.1:{server.server_port}"
+        index_dir = index_dir or tempfile.mkdtemp(prefix="weflai-kb-")
+    # Il registro legge OLLAMA_BASE_URL all'import
+    os.environ["OLLAMA_BASE_URL"] = ollama_url
+    from weflai.tools import pdf_index, reranker
+
+    questions = json.loads(questions_path.read_text(encoding="utf-8"))["questions"]
+    index = pdf_index.PDFIndex(index_dir=index_dir or pdf_index.INDEX_DIR)
+    t0 = time.perf_counter()
+    index.search("warmup", k=1, mode="bm25")
+    build_s = time.perf_counter() - t0
+
+    modes = [("vector", "vector", False), ("bm25", "bm25", False), ("hybrid", "hybrid", False)]
+    if reranker.get() is not None:
+        modes.append(("hybrid+rerank", "hybrid", True))
+    try:
+        results = {name: evaluate(index, questions, mode, k, rerank) for name, mode, rerank in modes}
+    finally:
+        if server is not None:
+            server.shutdown()
+    return {
+        "domande": len(questions),
+        "k": k,
+        "embedding": "fake" if server is not None else ollama_url,
+        "chunk": len(index._chunks),
+        "caricamento_s": round(build_s, 2),
+        "modalita": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qualità e latenza della ricerca nel regolamento")
+    parser.add_argument("--questions", type=Path, default=DEFAULT_QUESTIONS)
+    parser.add_argument("--k", type=int, default=4, help="risultati per domanda (come pdf_search)")
+    parser.add_argument("--ollama-url", help="Ollama vero per gli embedding; default: fake_ollama in-process")
+    parser.add_argument("--index-dir", help="cartella dell'indice (default: temporanea con fake_ollama)")
+    parser.add_argument("--json", help="scrive il risultato in questo file")
+    args = parser.parse_args()
+
+    result = run(args.questions, args.k, args.ollama_url, args.index_dir)
+    k = result["k"]
+    print(f"{result['domande']} domande, {result['chunk']} chunk, embedding {result['embedding']}, "
+          f"indice pronto in {result['caricamento_s']}s")
+    print(f"{'modalità':<15} {'hit@1':>6} {f'recall@{k}':>9} {f'mrr@{k}':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, r in result["modalita"].items():
+        print(f"{name:<15} {r['hit@1']:>6.2f} {r[f'recall@{k}']:>9.2f} {r[f'mrr@{k}']:>7.2f} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f}")
+    for name, r in result["modalita"].items():
+        if r["mancate"]:
+            print(f"{name}: mancate {len(r['mancate'])}: " + "; ".join(r["mancate"]), file=sys.stderr)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
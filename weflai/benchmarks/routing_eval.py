@@ -0,0 +1,365 @@
+"""
+Confronto offline delle politiche di routing dei task (weflai.routing).
+
+Rigioca un insieme di richieste etichettate (prenotazioni, cancellazioni,
+domande sui prezzi) con ogni politica (tiered, large, small) e riporta per
+politica:
+- accuratezza per task: output conforme all'etichetta (regex sull'intero
+  output) e, per inserimento e cancellazione, verificato sul DB
+- accuratezza per richiesta: tutti i task etichettati corretti
+- token LLM (CrewOutput.token_usage) e tempo: totale, p50 e p95 per richiesta
+- livelli che hanno prodotto gli output e rifiuti (weflai_task_routing_total)
+
+Le etichette vengono dal DB di datagen con il seme, come benchmarks.scenarios:
+il volo più economico tra le due città nel giorno, la
+prenotazione da cancellare, il prezzo minimo. Ogni replay parte dagli stessi
+dati: passeggeri con mail @routing-eval.test, prenotazione da cancellare
+creata prima del replay (l'etichetta usa il segnaposto {id_prenotazione}),
+prenotazioni di prova cancellate dopo ogni richiesta. Le crew si avviano
+direttamente (senza flow né cache delle risposte), con un canale che conferma
+sempre.
+
+Senza --ollama-url i modelli sono serviti da fake_ollama con lo script
+weflai.json più scripts/routing_small.json: il modello piccolo è più veloce e
+a volte risponde fuori formato o sbaglia, così escalation e accuratezza si
+vedono anche senza Ollama.
+
+Prerequisito: python -m benchmarks.datagen --reset (o un DB equivalente).
+
+Uso: python -m benchmarks.routing_eval [--requests 30] [--policies tiered,large,small]
+     [--save richieste.json | --load richieste.json] [--json out.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from benchmarks import fake_ollama
+from benchmarks.datagen import NOMI
+from benchmarks.scenarios import BenchChannel, _sample_ids, percentile
+
+SMALL_SCRIPT = Path(__file__).parent / "scripts" / "routing_small.json"
+MAIL_DOMAIN = "routing-eval.test"
+KINDS = ("booking", "cancellation", "info")
+
+_SYLLABLES = ["ber", "to", "li", "van", "ca", "do", "ri", "mon", "ta", "ser", "gi", "no", "pel", "la"]
+
+
+class Labeled(NamedTuple):
+    kind: str
+    query: str
+    # task -> regex attesa sull'output; {id_prenotazione} = prenotazione creata dal setup
+    expect: dict[str, str]
+    mail: str = ""
+    # Prenotazione da creare prima del replay (cancellazioni): id_volo, nome, cognome
+    setup: Optional[dict] = None
+
+
+class Replay(NamedTuple):
+    kind: str
+    correct: dict[str, bool]
+    seconds: float
+    tokens: int
+    prompt_tokens: int
+    error: str = ""
+
+
+# --- richieste etichettate dai dati ---
+
+def _surname(rng: random.Random) -> str:
+    # Cognome inventato: per nome e cognome la prenotazione di prova è l'unica
+    return "".join(rng.choice(_SYLLABLES) for _ in range(3)).capitalize()
+
+
+def _routes(count: int, rng: random.Random) -> list[tuple]:
+    """Tratte e giorni con almeno un volo: (città partenza, città arrivo, data, id_volo, prezzo) più economico."""
+    from weflai.tools import database
+
+    ids = _sample_ids("voli", "id_volo", count, rng)
+    return [tuple(row) for row in database.run_query(
+        "SELECT DISTINCT ON (v.id_volo) a1.citta, a2.citta, v.data_ptz, c.id_volo, c.prezzo "
+        "FROM we_flai.voli v "
+        "JOIN we_flai.aeroporti a1 ON a1.id_aeroporto = v.id_apt_ptz "
+        "JOIN we_flai.aeroporti a2 ON a2.id_aeroporto = v.id_apt_arr "
+        "CROSS JOIN LATERAL (SELECT w.id_volo, w.prezzo FROM we_flai.voli w "
+        "  JOIN we_flai.aeroporti b1 ON b1.id_aeroporto = w.id_apt_ptz "
+        "  JOIN we_flai.aeroporti b2 ON b2.id_aeroporto = w.id_apt_arr "
+        "  WHERE b1.citta = a1.citta AND b2.citta = a2.citta AND w.data_ptz = v.data_ptz "
+        "  ORDER BY w.prezzo, w.id_volo LIMIT 1) c "
+        "WHERE v.id_volo = ANY(:ids) ORDER BY v.id_volo",
+        {"ids": ids},
+    ).rows]
+
+
+def booking_set(count: int, rng: random.Random) -> list[Labeled]:
+    requests = []
+    for i, (partenza, arrivo, data, id_volo, _) in enumerate(_routes(count, rng)):
+        nome, cognome = rng.choice(NOMI), _surname(rng)
+        mail = f"{nome}.{cognome}.{i}@{MAIL_DOMAIN}".lower()
+        requests.append(Labeled(
+            "booking", f"Prenota per {nome} {cognome} {mail} da {partenza} a {arrivo} il {data}",
+            {"search_flight_task": str(id_volo),
+             "confirm_selection_task": rf"CONFERMATO\|{id_volo}",
+             "insert_booking_task": r"\d+"},
+            mail=mail,
+        ))
+    return requests
+
+
+def cancellation_set(count: int, rng: random.Random) -> list[Labeled]:
+    requests = []
+    for i, (_, _, _, id_volo, _) in enumerate(_routes(count, rng)):
+        nome, cognome = rng.choice(NOMI), _surname(rng)
+        mail = f"{nome}.{cognome}.c{i}@{MAIL_DOMAIN}".lower()
+        query = rng.choice([f"Cancella la prenotazione di {nome} {cognome}",
+                            f"Vorrei annullare il volo prenotato per {nome} {cognome}",
+                            "Cancella la prenotazione numero {id_prenotazione}"])
+        requests.append(Labeled(
+            "cancellation", query,
+            {"find_booking_to_cancel_task": "{id_prenotazione}",
+             "delete_booking_task": r"(?is).*\b{id_prenotazione}\b.*cancellat.*"},
+            mail=mail,
+            setup={"id_volo": id_volo, "nome": nome, "cognome": cognome},
+        ))
+    return requests
+
+
+def info_set(count: int, rng: random.Random) -> list[Labeled]:
+    return [
+        Labeled("info", f"Quanto costa il volo più economico da {partenza} a {arrivo} il {data}?",
+                {"answer_info_task": rf"(?is).*\b{int(prezzo)}(?:[.,]\d+)?\b.*"})
+        for partenza, arrivo, data, _, prezzo in _routes(count, rng)
+    ]
+
+
+def build_set(count: int, seed: int) -> list[Labeled]:
+    """Metà prenotazioni, un quarto cancellazioni, un quarto domande, in ordine casuale."""
+    rng = random.Random(seed)
+    bookings, cancellations = count // 2, count // 4
+    requests = (booking_set(bookings, rng) + cancellation_set(cancellations, rng)
+                + info_set(count - bookings - cancellations, rng))
+    rng.shuffle(requests)
+    return requests
+
+
+def save_set(requests: list[Labeled], path: Path) -> None:
+    path.write_text(json.dumps([r._asdict() for r in requests], indent=2, ensure_ascii=False, default=str),
+                    encoding="utf-8")
+
+
+def load_set(path: Path) -> list[Labeled]:
+    return [Labeled(**item) for item in json.loads(path.read_text(encoding="utf-8"))]
+
+
+# --- replay ---
+
+def _cleanup(mail: str) -> None:
+    from weflai.cancellation import CancelFilter, cancel_bookings
+
+    if mail:
+        cancel_bookings(CancelFilter(mail=mail), motivo="routing_eval", output=io.StringIO())
+
+
+def _setup(request: Labeled) -> dict[str, str]:
+    """Crea la prenotazione da cancellare; valori per i segnaposto delle etichette."""
+    from weflai.tools import inventory
+
+    if request.setup is None:
+        return {}
+    booking = inventory.reserve(request.setup["id_volo"], "DOCEVAL", request.setup["nome"],
+                                request.setup["cognome"], request.mail, chiave=uuid.uuid4().hex)
+    return {"id_prenotazione": str(booking.id_prenotazione)}
+
+
+def _verified(request: Labeled, task: str, output: str, values: dict[str, str]) -> bool:
+    """Controlli sul DB oltre al formato: la prenotazione esiste (inserimento) o non più (cancellazione)."""
+    from weflai.tools import database
+
+    if request.kind == "booking" and task == "insert_booking_task":
+        return int(output) in {row.id_prenotazione for row in database.find_ticket_rows(mail=request.mail)}
+    if request.kind == "cancellation" and task == "delete_booking_task":
+        return database.get_ticket_row(int(values["id_prenotazione"])) is None
+    return True
+
+
+def replay(request: Labeled, policy: str, n: int) -> Replay:
+    from weflai import crew_pool, routing
+    from weflai.interaction import use_channel
+    from weflai.tools import inventory, sql_cache
+
+    _cleanup(request.mail)
+    values = _setup(request)
+    query = request.query.format(**values) if values else request.query
+    outputs: dict[str, str] = {}
+    error, tokens, prompt_tokens = "", 0, 0
+
+    crew = crew_pool.get_crew(request.kind)
+    crew.task_callback = lambda output: outputs.__setitem__(output.name, output.raw)
+    t0 = time.perf_counter()
+    with use_channel(BenchChannel()), routing.use_policy(policy), \
+            inventory.idempotency_scope(f"routing-eval:{policy}:{n}"), sql_cache.run_scope(f"eval {n}"):
+        try:
+            result = crew.kickoff(inputs={"query": query})
+            tokens = result.token_usage.total_tokens
+            prompt_tokens = result.token_usage.prompt_tokens
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - t0
+
+    correct = {}
+    for task, expect in request.expect.items():
+        output = outputs.get(task, "").strip().strip("`'\"").strip()
+        pattern = expect.format(**values) if values else expect
+        correct[task] = (re.fullmatch(pattern, output, re.DOTALL) is not None
+                         and _verified(request, task, output, values))
+    _cleanup(request.mail)
+    return Replay(request.kind, correct, seconds, tokens, prompt_tokens, error)
+
+
+def _routing_counts() -> dict[tuple[str, str, str], float]:
+    from weflai import telemetry
+
+    return {(dict(key)["task"], dict(key)["tier"], dict(key)["outcome"]): value
+            for key, value in dict(telemetry.metrics.task_routing.values).items()}
+
+
+def evaluate(requests: list[Labeled], policy: str) -> dict:
+    before = _routing_counts()
+    replays = [replay(request, policy, n) for n, request in enumerate(requests)]
+    after = _routing_counts()
+    routing = {}
+    for (task, tier, outcome), value in sorted(after.items()):
+        delta = value - before.get((task, tier, outcome), 0)
+        if delta:
+            routing.setdefault(task, {})[f"{tier}:{outcome}"] = int(delta)
+
+    tasks: dict[str, list[bool]] = {}
+    for r in replays:
+        for task, ok in r.correct.items():
+            tasks.setdefault(task, []).append(ok)
+    seconds = [r.seconds for r in replays]
+    n = len(replays)
+    return {
+        "policy": policy,
+        "requests": n,
+        "request_accuracy": sum(all(r.correct.values()) for r in replays) / n if n else 0.0,
+        "task_accuracy": {task: sum(oks) / len(oks) for task, oks in sorted(tasks.items())},
+        "by_kind": {kind: sum(all(r.correct.values()) for r in replays if r.kind == kind)
+                    for kind in KINDS},
+        "tokens": sum(r.tokens for r in replays),
+        "prompt_tokens": sum(r.prompt_tokens for r in replays),
+        "tokens_per_request": sum(r.tokens for r in replays) / n if n else 0.0,
+        "seconds": {"total": sum(seconds), "p50": percentile(seconds, 0.50), "p95": percentile(seconds, 0.95)},
+        "routing": routing,
+        "errors": [r.error for r in replays if r.error],
+    }
+
+
+# --- report ---
+
+def print_report(results: list[dict], requests: list[Labeled], file=sys.stdout) -> None:
+    counts = {kind: sum(r.kind == kind for r in requests) for kind in KINDS}
+    print(f"\n📊 Routing: {len(requests)} richieste "
+          f"({', '.join(f'{counts[k]} {k}' for k in KINDS)})", file=file)
+    print(f"  {'politica':<8} {'richieste ok':>12} {'token/req':>10} {'totale s':>9} {'p50 ms':>8} {'p95 ms':>8}",
+          file=file)
+    for result in results:
+        s = result["seconds"]
+        print(f"  {result['policy']:<8} {result['request_accuracy'] * 100:>11.1f}% "
+              f"{result['tokens_per_request']:>10.0f} {s['total']:>9.1f} {s['p50'] * 1000:>8.0f} "
+              f"{s['p95'] * 1000:>8.0f}", file=file)
+    tasks = sorted({task for result in results for task in result["task_accuracy"]})
+    print("\n  accuratezza per task", file=file)
+    for task in tasks:
+        cells = "  ".join(f"{r['policy']} {r['task_accuracy'].get(task, 0.0) * 100:5.1f}%" for r in results)
+        print(f"  - {task:<28} {cells}", file=file)
+    print("\n  livelli (livello:esito)", file=file)
+    for result in results:
+        print(f"  {result['policy']}", file=file)
+        for task, tiers in result["routing"].items():
+            print(f"    - {task:<28} {', '.join(f'{k} {v}' for k, v in tiers.items())}", file=file)
+        if result["errors"]:
+            print(f"    ⚠️  {len(result['errors'])} errori, il primo: {result['errors'][0]}", file=file)
+
+
+def _merged_script(base: Path, small: Path) -> Path:
+    """Regole del modello piccolo prima di quelle comuni, in un file temporaneo per fake_ollama."""
+    base_spec = json.loads(base.read_text(encoding="utf-8"))
+    small_spec = json.loads(small.read_text(encoding="utf-8"))
+    spec = {**base_spec,
+            "rules": small_spec.get("rules", []) + base_spec.get("rules", []),
+            "models": {**base_spec.get("models", {}), **small_spec.get("models", {})}}
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump(spec, f)
+    return Path(f.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--policies", default="tiered,large,small", help="politiche da confrontare, in ordine")
+    parser.add_argument("--load", type=Path, help="insieme etichettato salvato con --save (invece del DB)")
+    parser.add_argument("--save", type=Path, help="salva l'insieme etichettato generato")
+    parser.add_argument("--ollama-url", help="Ollama (vero o finto) già avviato; default: fake_ollama in-process")
+    parser.add_argument("--script", type=Path, default=fake_ollama.DEFAULT_SCRIPT)
+    parser.add_argument("--small-script", type=Path, default=SMALL_SCRIPT,
+                        help="regole e latenze del modello piccolo per fake_ollama")
+    parser.add_argument("--quiet", action="store_true", help="nasconde l'output verboso delle crew")
+    parser.add_argument("--json", type=Path, help="salva il risultato in JSON")
+    args = parser.parse_args()
+
+    fake = None
+    if args.ollama_url:
+        os.environ["OLLAMA_BASE_URL"] = args.ollama_url
+    else:
+        server, fake = fake_ollama.start(script=_merged_script(args.script, args.small_script))
+        os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    # Prima di importare weflai: registry e telemetry leggono l'ambiente all'import
+    os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+    os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+
+    from weflai import routing
+    from weflai.interaction import install_human_input_hook
+
+    policies = [p.strip() for p in args.policies.split(",") if p.strip()]
+    unknown = [p for p in policies if p not in routing.POLICIES]
+    if unknown:
+        parser.error(f"politiche sconosciute: {', '.join(unknown)} (ammesse {', '.join(routing.POLICIES)})")
+    install_human_input_hook()
+
+    requests = load_set(args.load) if args.load else build_set(args.requests, args.seed)
+    if args.save:
+        save_set(requests, args.save)
+    results = []
+    output = io.StringIO() if args.quiet else None
+    for policy in policies:
+        calls_before = dict(fake.summary()["models"]) if fake else {}
+        with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+            result = evaluate(requests, policy)
+        if fake:
+            result["llm_calls"] = {model: n - calls_before.get(model, 0)
+                                   for model, n in fake.summary()["models"].items()
+                                   if n - calls_before.get(model, 0)}
+        results.append(result)
+
+    print_report(results, requests)
+    if fake:
+        for result in results:
+            print(f"  chiamate LLM {result['policy']:<8} {json.dumps(result['llm_calls'])}")
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps({"seed": args.seed, "results": results}, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
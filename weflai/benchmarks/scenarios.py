@@ -0,0 +1,435 @@
+"""
+Scenari di carico su WeFlaiFlow e InfoCrew, con LLM finto e DB popolato da datagen.
+
+Ogni richiesta è un kickoff completo (flow, crew, tool, DB) con un canale che
+risponde "" alle domande (conferme human_input comprese). Le richieste sono
+costruite da campioni del DB scelti con il seme: stessi dati e stesso seme ->
+stesse richieste. Report: throughput, latenze p50/p95/p99/max, time-to-first-byte
+della risposta (primo chunk in streaming, altrimenti la risposta completa), query DB per
+richiesta (span "db" di weflai.telemetry), transazioni lato server
+(pg_stat_database), chiamate LLM, token di prompt per richiesta, token dei
+risultati SQL per chiamata (compatti e come str() grezzo) e tasso di successo.
+
+Prerequisito: python -m benchmarks.datagen --reset (o un DB equivalente).
+
+Uso:
+    python -m benchmarks.scenarios booking --requests 200 --concurrency 8
+    python -m benchmarks.scenarios mix --json out.json --baseline main.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+from benchmarks import fake_ollama
+from benchmarks.datagen import COGNOMI, NOMI
+
+SCENARIOS = ("booking", "cancellation", "info", "mix")
+
+INFO_QUESTIONS = [
+    "Quanto pesa al massimo il bagaglio a mano?",
+    "Posso portare liquidi in cabina?",
+    "Come funziona il check-in online?",
+    "Quali documenti servono per l'imbarco?",
+    "Che voli ci sono nei prossimi giorni?",
+    "Quali sono gli orari dei voli più economici?",
+    "Qual è il prezzo medio dei voli?",
+    "Posso portare un animale domestico?",
+]
+
+
+class Request(NamedTuple):
+    kind: str
+    query: str
+
+
+class Outcome(NamedTuple):
+    kind: str
+    ok: bool
+    seconds: float
+    ttfb: float
+
+
+class BenchChannel:
+    """Canale che registra i messaggi e conferma sempre (risposta vuota)."""
+
+    def __init__(self):
+        self.lines: list[str] = []
+        self.first_chunk: Optional[float] = None
+
+    def say(self, text: str) -> None:
+        self.lines.append(text)
+
+    def ask(self, prompt: str) -> str:
+        return ""
+
+    def stream(self, chunk: str) -> None:
+        if self.first_chunk is None:
+            self.first_chunk = time.perf_counter()
+        self.lines.append(chunk)
+
+    def stream_end(self) -> None:
+        pass
+
+    def heard(self, text: str) -> bool:
+        return any(text in line for line in self.lines)
+
+
+# --- richieste dai dati ---
+
+def _sample_ids(table: str, key: str, count: int, rng: random.Random) -> list[int]:
+    from weflai.tools import database
+
+    low, high = database.run_query(f"SELECT min({key}), max({key}) FROM we_flai.{table}").rows[0]
+    if low is None:
+        raise RuntimeError(f"we_flai.{table} è vuota: eseguire prima python -m benchmarks.datagen")
+    return [rng.randint(low, high) for _ in range(count)]
+
+
+def booking_requests(count: int, rng: random.Random) -> list[Request]:
+    from weflai.tools import database
+
+    ids = _sample_ids("voli", "id_volo", count, rng)
+    rows = database.run_query(
+        "SELECT a1.citta, a2.citta, v.data_ptz FROM we_flai.voli v "
+        "JOIN we_flai.aeroporti a1 ON a1.id_aeroporto = v.id_apt_ptz "
+        "JOIN we_flai.aeroporti a2 ON a2.id_aeroporto = v.id_apt_arr "
+        "WHERE v.id_volo = ANY(:ids) ORDER BY v.id_volo",
+        {"ids": ids},
+    ).rows
+    requests = []
+    for i in range(count):
+        partenza, arrivo, data = rows[i % len(rows)]
+        nome, cognome = rng.choice(NOMI), rng.choice(COGNOMI)
+        mail = f"{nome}.{cognome}.bench{i}@example.com".lower()
+        requests.append(Request("booking", f"Prenota per {nome} {cognome} {mail} da {partenza} a {arrivo} il {data}"))
+    return requests
+
+
+def cancellation_requests(count: int, rng: random.Random) -> list[Request]:
+    from weflai.tools import database
+
+    ids = _sample_ids("prenotazioni", "id_prenotazione", count, rng)
+    rows = database.run_query(
+        "SELECT nome_utente, cognome_utente FROM we_flai.prenotazioni WHERE id_prenotazione = ANY(:ids)",
+        {"ids": ids},
+    ).rows or [(rng.choice(NOMI), rng.choice(COGNOMI))]
+    return [Request("cancellation", "Cancella la prenotazione di {} {}".format(*rows[i % len(rows)]))
+            for i in range(count)]
+
+
+def info_requests(count: int, rng: random.Random) -> list[Request]:
+    return [Request("info", rng.choice(INFO_QUESTIONS)) for _ in range(count)]
+
+
+def build_requests(scenario: str, count: int, seed: int) -> list[Request]:
+    rng = random.Random(seed)
+    if scenario == "booking":
+        return booking_requests(count, rng)
+    if scenario == "cancellation":
+        return cancellation_requests(count, rng)
+    if scenario == "info":
+        return info_requests(count, rng)
+    # mix: 50% prenotazioni, 20% cancellazioni, 30% informazioni, in ordine casuale
+    bookings = count // 2
+    cancellations = count // 5
+    requests = (booking_requests(bookings, rng) + cancellation_requests(cancellations, rng)
+                + info_requests(count - bookings - cancellations, rng))
+    rng.shuffle(requests)
+    return requests
+
+
+# --- esecuzione ---
+
+def run_request(request: Request, use_cache: bool = True) -> Outcome:
+    from weflai.interaction import use_channel
+
+    channel = BenchChannel()
+    t0 = time.perf_counter()
+    ok = False
+    with use_channel(channel):
+        try:
+            if request.kind == "info":
+                if use_cache:
+                    from weflai.crews.info_crew.response_cache import cached_kickoff
+
+                    answer = cached_kickoff(request.query)
+                else:
+                    from weflai import crew_pool
+
+                    answer = crew_pool.get_crew("info").kickoff(inputs={"query": request.query}).raw
+                ok = bool(answer.strip())
+            else:
+                from weflai.flow import WeFlaiFlow
+
+                flow = WeFlaiFlow()
+                flow.kickoff(inputs={"user_intent": request.kind, "user_query": request.query})
+                if request.kind == "booking":
+                    ok = flow.state.final_ticket is not None
+                else:
+                    ok = channel.heard("ESITO OPERAZIONE") and not channel.heard("non riuscita")
+        except Exception as e:
+            channel.say(f"eccezione: {e}")
+    seconds = time.perf_counter() - t0
+    # Senza streaming la risposta compare solo a richiesta completata
+    ttfb = channel.first_chunk - t0 if channel.first_chunk is not None else seconds
+    return Outcome(request.kind, ok, seconds, ttfb)
+
+
+def db_span_count() -> int:
+    """Span chiusi con stage=db finora (query eseguite dall'applicazione)."""
+    from weflai import telemetry
+
+    values = dict(telemetry.metrics.spans.values)
+    return int(sum(v for key, v in values.items() if dict(key).get("stage") == "db"))
+
+
+def token_totals() -> tuple[int, int, int]:
+    """Token di prompt LLM e token stimati dei risultati SQL (compatti, grezzi) finora (weflai.telemetry)."""
+    from weflai import telemetry
+
+    prompt = sum(v for key, v in dict(telemetry.metrics.llm_tokens.values).items()
+                 if dict(key).get("kind") == "prompt")
+    results = dict(telemetry.metrics.tool_result_tokens.values)
+    compact = sum(v for key, v in results.items() if dict(key).get("kind") == "result")
+    raw = sum(v for key, v in results.items() if dict(key).get("kind") == "raw")
+    return int(prompt), int(compact), int(raw)
+
+
+def sql_result_calls() -> int:
+    from weflai import telemetry
+
+    values = dict(telemetry.metrics.spans.values)
+    return int(sum(v for key, v in values.items()
+                   if dict(key).get("stage") == "tool" and dict(key).get("name") == "execute_sql_tool"))
+
+
+def build_totals() -> tuple[float, int]:
+    """Secondi e numero di consegne di crew (span stage=build di weflai.crew_pool) finora."""
+    from weflai import telemetry
+
+    series = dict(telemetry.metrics.stage_seconds.series)
+    seconds, count = 0.0, 0
+    for key, (_, total, n) in series.items():
+        if dict(key).get("stage") == "build":
+            seconds += total
+            count += n
+    return seconds, count
+
+
+def server_transactions() -> Optional[int]:
+    """Commit + rollback del database secondo pg_stat_database (aggiornato in modo asincrono)."""
+    from weflai.tools import database
+
+    try:
+        database.run_query("SELECT pg_stat_clear_snapshot()")
+        return int(database.run_query(
+            "SELECT xact_commit + xact_rollback FROM pg_stat_database WHERE datname = current_database()"
+        ).rows[0][0])
+    except Exception:
+        return None
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(requests: list[Request], concurrency: int, use_cache: bool,
+                 llm_calls: Callable[[], int]) -> dict:
+    xacts_before = server_transactions()
+    queries_before = db_span_count()
+    build_before = build_totals()
+    llm_before = llm_calls()
+    tokens_before = token_totals()
+    sql_calls_before = sql_result_calls()
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="weflai-bench") as executor:
+        outcomes = list(executor.map(lambda r: run_request(r, use_cache), requests))
+    elapsed = time.perf_counter() - t0
+    queries = db_span_count() - queries_before
+    build_seconds, builds = (after - before for after, before in zip(build_totals(), build_before))
+    prompt_tokens, result_tokens, raw_tokens = (after - before for after, before in zip(token_totals(), tokens_before))
+    sql_calls = sql_result_calls() - sql_calls_before
+
+    # pg_stat_database riceve le statistiche dai backend con un certo ritardo
+    time.sleep(1.0)
+    xacts_after = server_transactions()
+    latencies = [o.seconds for o in outcomes]
+    ttfbs = [o.ttfb for o in outcomes]
+    n = len(outcomes)
+    by_kind = {}
+    for kind in sorted({o.kind for o in outcomes}):
+        subset = [o for o in outcomes if o.kind == kind]
+        by_kind[kind] = {
+            "requests": len(subset),
+            "ok": sum(o.ok for o in subset),
+            "p50": percentile([o.seconds for o in subset], 0.50),
+            "p95": percentile([o.seconds for o in subset], 0.95),
+            "ttfb_p50": percentile([o.ttfb for o in subset], 0.50),
+        }
+    return {
+        "requests": n,
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "throughput_rps": n / elapsed if elapsed else 0.0,
+        "success_rate": sum(o.ok for o in outcomes) / n if n else 0.0,
+        "latency_s": {
+            "mean": statistics.fmean(latencies) if latencies else 0.0,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies, default=0.0),
+        },
+        "ttfb_s": {
+            "p50": percentile(ttfbs, 0.50),
+            "p95": percentile(ttfbs, 0.95),
+        },
+        "db_queries_per_request": queries / n if n else 0.0,
+        "db_xacts_per_request": ((xacts_after - xacts_before) / n
+                                 if n and xacts_before is not None and xacts_after is not None else None),
+        "crew_build_ms": build_seconds / builds * 1000 if builds else None,
+        "llm_calls_per_request": (llm_calls() - llm_before) / n if n else 0.0,
+        "llm_prompt_tokens_per_request": prompt_tokens / n if n else 0.0,
+        "sql_result_tokens_per_call": {
+            "compact": result_tokens / sql_calls if sql_calls else None,
+            "raw": raw_tokens / sql_calls if sql_calls else None,
+        },
+        "by_kind": by_kind,
+    }
+
+
+# --- report ---
+
+def print_report(scenario: str, result: dict, file=sys.stdout) -> None:
+    latency = result["latency_s"]
+    print(f"\n📊 Scenario {scenario}: {result['requests']} richieste, concorrenza {result['concurrency']}", file=file)
+    print(f"  throughput      {result['throughput_rps']:.2f} req/s ({result['elapsed_s']:.1f}s)", file=file)
+    print(f"  successo        {result['success_rate'] * 100:.1f}%", file=file)
+    print(f"  latenza (ms)    p50 {latency['p50'] * 1000:.0f}  p95 {latency['p95'] * 1000:.0f}  "
+          f"p99 {latency['p99'] * 1000:.0f}  max {latency['max'] * 1000:.0f}", file=file)
+    if "ttfb_s" in result:
+        print(f"  ttfb (ms)       p50 {result['ttfb_s']['p50'] * 1000:.0f}  p95 {result['ttfb_s']['p95'] * 1000:.0f}",
+              file=file)
+    print(f"  query DB/req    {result['db_queries_per_request']:.1f}", file=file)
+    if result["db_xacts_per_request"] is not None:
+        print(f"  xact server/req {result['db_xacts_per_request']:.1f}", file=file)
+    if result.get("crew_build_ms") is not None:
+        print(f"  costruzione crew {result['crew_build_ms']:.2f} ms", file=file)
+    print(f"  chiamate LLM/req {result['llm_calls_per_request']:.1f}", file=file)
+    if "llm_prompt_tokens_per_request" in result:
+        print(f"  token prompt/req {result['llm_prompt_tokens_per_request']:.0f}", file=file)
+    sql_tokens = result.get("sql_result_tokens_per_call") or {}
+    if sql_tokens.get("compact") is not None:
+        print(f"  token risultato SQL/chiamata {sql_tokens['compact']:.0f} (str() grezzo {sql_tokens['raw']:.0f})",
+              file=file)
+    for kind, stats in result["by_kind"].items():
+        print(f"  - {kind:<13} {stats['ok']}/{stats['requests']} ok, "
+              f"p50 {stats['p50'] * 1000:.0f} ms, p95 {stats['p95'] * 1000:.0f} ms, "
+              f"ttfb p50 {stats.get('ttfb_p50', 0.0) * 1000:.0f} ms", file=file)
+
+
+def compare(result: dict, baseline: dict, tolerance: float, file=sys.stdout) -> bool:
+    """Confronta con un risultato salvato; False se p95 o throughput peggiorano oltre la tolleranza."""
+    checks = [
+        ("throughput_rps", result["throughput_rps"], baseline["throughput_rps"], True),
+        ("latency p95", result["latency_s"]["p95"], baseline["latency_s"]["p95"], False),
+        ("latency p99", result["latency_s"]["p99"], baseline["latency_s"]["p99"], False),
+        ("db_queries_per_request", result["db_queries_per_request"], baseline["db_queries_per_request"], False),
+        ("llm_calls_per_request", result["llm_calls_per_request"], baseline["llm_calls_per_request"], False),
+    ]
+    if "ttfb_s" in result and "ttfb_s" in baseline:
+        checks.append(("ttfb p95", result["ttfb_s"]["p95"], baseline["ttfb_s"]["p95"], False))
+    if "llm_prompt_tokens_per_request" in result and "llm_prompt_tokens_per_request" in baseline:
+        checks.append(("llm_prompt_tokens/req", result["llm_prompt_tokens_per_request"],
+                       baseline["llm_prompt_tokens_per_request"], False))
+    ok = True
+    print("\n🔎 Confronto con la baseline:", file=file)
+    for name, current, reference, higher_is_better in checks:
+        delta = (current - reference) / reference if reference else 0.0
+        worse = -delta if higher_is_better else delta
+        flag = "❌" if worse > tolerance else "✓"
+        ok = ok and worse <= tolerance
+        print(f"  {flag} {name:<24} {reference:10.3f} -> {current:10.3f} ({delta:+.1%})", file=file)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=2, help="richieste iniziali escluse dalle misure")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-cache", action="store_true", help="InfoCrew senza cache semantica")
+    parser.add_argument("--ollama-url", help="Ollama (vero o finto) già avviato; default: fake_ollama in-process")
+    parser.add_argument("--script", type=Path, default=fake_ollama.DEFAULT_SCRIPT)
+    parser.add_argument("--ttft", type=float, default=0.05, help="latenza simulata al primo token (s)")
+    parser.add_argument("--per-token", type=float, default=0.0, help="latenza simulata per token (s)")
+    parser.add_argument("--quiet", action="store_true", help="nasconde l'output verboso delle crew")
+    parser.add_argument("--no-stream", action="store_true", help="LLM senza streaming (confronto del ttfb)")
+    parser.add_argument("--raw-results", action="store_true",
+                        help="risultati SQL come str() delle righe (confronto dei token di prompt)")
+    parser.add_argument("--json", type=Path, help="salva il risultato in JSON")
+    parser.add_argument("--baseline", type=Path, help="JSON di un'esecuzione precedente da confrontare")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="peggioramento ammesso rispetto alla baseline")
+    args = parser.parse_args()
+
+    fake = None
+    if args.ollama_url:
+        os.environ["OLLAMA_BASE_URL"] = args.ollama_url
+    else:
+        server, fake = fake_ollama.start(script=args.script, ttft=args.ttft, per_token=args.per_token)
+        os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    # Prima di importare weflai: registry e telemetry leggono l'ambiente all'import
+    os.environ.setdefault("WEFLAI_TRACE_FILE", f"traces/bench-{args.scenario}.jsonl")
+    os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+    os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+    if args.no_stream:
+        os.environ["WEFLAI_STREAM"] = "0"
+    if args.raw_results:
+        os.environ["WEFLAI_SQL_RESULT_FORMAT"] = "raw"
+
+    from weflai import crew_pool
+    from weflai.interaction import install_human_input_hook
+
+    install_human_input_hook()
+    # Come il server: crew già pronte (WEFLAI_CREW_POOL_SIZE=0 per misurare la costruzione inline)
+    crew_pool.prewarm()
+    llm_calls = (lambda: sum(fake.summary()["calls"].values())) if fake else (lambda: 0)
+
+    requests = build_requests(args.scenario, args.requests + args.warmup, args.seed)
+    output = io.StringIO() if args.quiet else None
+    with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+        for request in requests[:args.warmup]:
+            run_request(request, not args.no_cache)
+        result = run_scenario(requests[args.warmup:], args.concurrency, not args.no_cache, llm_calls)
+    result.update(scenario=args.scenario, seed=args.seed, ttft=args.ttft, per_token=args.per_token,
+                  stream=not args.no_stream, raw_results=args.raw_results)
+
+    print_report(args.scenario, result)
+    if fake:
+        print(f"  regole LLM      {json.dumps(fake.summary()['calls'], ensure_ascii=False)}")
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if not compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Scrittura e ricerca nell'archivio dei biglietti (weflai.ticket_store).
+
+Genera `--biglietti` TicketOutput sintetici (passeggeri e voli ripetuti, date
+su un anno) e li scrive da `--writer` thread, ognuno in attesa dell'fsync
+come il flow, in due modalità:
+- group commit (un fsync per tutti i biglietti in coda)
+- fsync per biglietto (gruppi da 1), come riferimento
+Poi sull'archivio scritto con group commit misura la latenza p50/p95 delle
+ricerche per id_prenotazione, passeggero e volo, la scansione di un mese per
+data del volo e il throughput dell'export. Tutto in cartelle temporanee
+sotto --dir (default la cartella corrente: /tmp è spesso in RAM e lì
+l'fsync non costa nulla), rimosse alla fine.
+
+Uso: python -m benchmarks.ticket_store [--biglietti 5000] [--writer 8] [--ricerche 1000] [--dir .]
+     [--json out.json]
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from weflai.models import TicketOutput
+from weflai.ticket_store import BATCH, TicketStore
+
+_NOMI = ["Mario", "Giulia", "Luca", "Sara", "Marco", "Anna", "Paolo", "Elena", "Giorgio", "Chiara"]
+_COGNOMI = ["Rossi", "Bianchi", "Verdi", "Russo", "Ferrari", "Esposito", "Romano", "Colombo", "Ricci", "Greco"]
+_TRATTE = [("FCO", "LIN", "Roma", "Milano"), ("LIN", "FCO", "Milano", "Roma"), ("NAP", "TRN", "Napoli", "Torino"),
+           ("CTA", "BLQ", "Catania", "Bologna"), ("PMO", "VCE", "Palermo", "Venezia")]
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def make_tickets(n: int, seed: int = 7) -> list[TicketOutput]:
+    rng = random.Random(seed)
+    start = date(2026, 1, 1)
+    tickets = []
+    for i in range(1, n + 1):
+        ptz, arr, citta_ptz, citta_arr = rng.choice(_TRATTE)
+        tickets.append(TicketOutput(
+            id_prenotazione=i,
+            id_volo=rng.randint(1, max(n // 20, 1)),
+            passeggero=f"{rng.choice(_NOMI)} {rng.choice(_COGNOMI)}",
+            compagnia="ITA Airways",
+            partenza_iata=ptz,
+            arrivo_iata=arr,
+            tratta=f"{citta_ptz} - {citta_arr}",
+            data=(start + timedelta(days=rng.randrange(365))).isoformat(),
+            orario_partenza="08:30",
+            orario_arrivo="09:40",
+        ))
+    return tickets
+
+
+def write(tickets: list[TicketOutput], writers: int, batch: int, directory: str) -> tuple[TicketStore, dict]:
+    store = TicketStore(tempfile.mkdtemp(prefix="weflai-tickets-", dir=directory), batch=batch)
+    latencies: list[float] = []
+
+    def append(ticket: TicketOutput) -> None:
+        t0 = time.perf_counter()
+        store.append(ticket)
+        latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        list(executor.map(append, tickets))
+    elapsed = time.perf_counter() - t0
+    return store, {
+        "gruppo_max": batch,
+        "biglietti_s": round(len(tickets) / elapsed, 1),
+        "append_p50_ms": round(1000 * _percentile(latencies, 0.50), 2),
+        "append_p95_ms": round(1000 * _percentile(latencies, 0.95), 2),
+        "segmenti": len(store.segments()),
+    }
+
+
+def _timed(fn, args_list: list) -> dict:
+    seconds, found = [], 0
+    for args in args_list:
+        t0 = time.perf_counter()
+        result = fn(*args)
+        seconds.append(time.perf_counter() - t0)
+        found += len(result) if isinstance(result, list) else result is not None
+    return {
+        "p50_ms": round(1000 * _percentile(seconds, 0.50), 3),
+        "p95_ms": round(1000 * _percentile(seconds, 0.95), 3),
+        "risultati_medi": round(found / len(args_list), 1),
+    }
+
+
+def lookups(store: TicketStore, tickets: list[TicketOutput], n: int, seed: int = 11) -> dict:
+    rng = random.Random(seed)
+    sample = [rng.choice(tickets) for _ in range(n)]
+    result = {
+        "id_prenotazione": _timed(store.get, [(t.id_prenotazione,) for t in sample]),
+        "passeggero": _timed(store.by_passenger, [(t.passeggero,) for t in sample]),
+        "volo": _timed(store.by_flight, [(t.id_volo,) for t in sample]),
+    }
+    months = [(f"2026-{m:02d}-01", f"2026-{m:02d}-31") for m in range(1, 13)]
+    result["mese"] = _timed(lambda dal, al: list(store.scan(dal, al)), months)
+
+    t0 = time.perf_counter()
+    exported = sum(1 for _ in store.export())
+    result["export_biglietti_s"] = round(exported / (time.perf_counter() - t0), 1)
+
+    t0 = time.perf_counter()
+    reopened = TicketStore(str(store.directory))
+    reopened.get(tickets[0].id_prenotazione)
+    result["riapertura_ms"] = round(1000 * (time.perf_counter() - t0), 2)
+    reopened.close()
+    return result
+
+
+def run(n: int, writers: int, searches: int, directory: str) -> dict:
+    tickets = make_tickets(n)
+    result = {"biglietti": n, "writer": writers, "scrittura": {}}
+    stores = []
+    try:
+        for name, batch in (("fsync per biglietto", 1), ("group commit", BATCH)):
+            store, stats = write(tickets, writers, batch, directory)
+            stores.append(store)
+            result["scrittura"][name] = stats
+        result["ricerca"] = lookups(stores[-1], tickets, searches)
+    finally:
+        for store in stores:
+            store.close()
+            shutil.rmtree(store.directory, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrittura e ricerca nell'archivio dei biglietti")
+    parser.add_argument("--biglietti", type=int, default=5000)
+    parser.add_argument("--writer", type=int, default=8, help="thread che emettono biglietti in parallelo")
+    parser.add_argument("--ricerche", type=int, default=1000, help="ricerche per tipo")
+    parser.add_argument("--dir", default=".", help="dove creare le cartelle temporanee (fsync su quel disco)")
+    parser.add_argument("--json", help="scrive il risultato in questo file")
+    args = parser.parse_args()
+
+    result = run(args.biglietti, args.writer, args.ricerche, args.dir)
+    print(f"{result['biglietti']} biglietti, {result['writer']} writer")
+    for name, s in result["scrittura"].items():
+        print(f"  {name:<20} {s['biglietti_s']:>9.1f} biglietti/s  append p50 {s['append_p50_ms']:.2f} ms  "
+              f"p95 {s['append_p95_ms']:.2f} ms  segmenti {s['segmenti']}")
+    r = result["ricerca"]
+    for name in ("id_prenotazione", "passeggero", "volo", "mese"):
+        print(f"  ricerca per {name:<16} p50 {r[name]['p50_ms']:.3f} ms  p95 {r[name]['p95_ms']:.3f} ms  "
+              f"risultati medi {r[name]['risultati_medi']}")
+    print(f"  export {r['export_biglietti_s']:.1f} biglietti/s, riapertura {r['riapertura_ms']:.2f} ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
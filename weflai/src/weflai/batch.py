@@ -0,0 +1,262 @@
+# weflai/batch.py
+"""
+Prenotazioni in blocco (gruppi, agenzie) senza passare dal menu né dagli agenti.
+
+Input CSV o JSONL, una prenotazione per riga, con i campi:
+    nome, cognome, mail, partenza, arrivo, data[, documento]
+(partenza/arrivo: città o codice IATA; data: YYYY-MM-DD, 01/02, "domani", ...)
+
+Il file viene letto a finestre: le righe di una finestra sono raggruppate per
+(partenza, arrivo, data), così una sola ricerca volo serve tutti i passeggeri
+del gruppo, e ogni gruppo viene inserito con un INSERT multi-riga ... RETURNING
+in una transazione; se il volo si esaurisce, le righe rimaste passano al
+volo successivo della stessa ricerca. I biglietti (TicketOutput) escono in
+streaming come JSONL; un errore su una riga viene riportato su quella riga
+senza fermare il batch.
+I biglietti emessi finiscono anche nell'archivio weflai.ticket_store.
+
+Uso: batch_book prenotazioni.csv [-o biglietti.jsonl] [--concurrency 8]
+"""
+import argparse
+import csv
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+from itertools import islice
+from typing import IO, Iterator, Optional
+
+from pydantic import BaseModel
+
+from weflai.registry import get_tickets
+from weflai.tools import database, flight_search
+from weflai.tools.flight_search import FlightMatch, FlightQuery
+from weflai.tools.ticket_builder import ticket_from_flight
+
+logger = logging.getLogger(__name__)
+
+_RE_MAIL = re.compile(r"^[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}$", re.IGNORECASE)
+
+GroupKey = tuple[tuple[str, ...], tuple[str, ...], date]
+
+
+class BookingRequest(BaseModel):
+    """Una riga valida del file di input."""
+
+    row: int
+    nome: str
+    cognome: str
+    mail: str
+    documento: str
+
+
+class BatchStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.ok = 0
+        self.failed = 0
+        self.searches = 0
+
+    def add(self, ok: int = 0, failed: int = 0, searches: int = 0):
+        with self._lock:
+            self.ok += ok
+            self.failed += failed
+            self.searches += searches
+
+
+def read_rows(path: str) -> Iterator[tuple[int, dict]]:
+    """Righe del file (CSV o JSONL, dall'estensione) numerate da 1, lette in streaming."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson", ".json")):
+            for n, line in enumerate(f, start=1):
+                if line.strip():
+                    try:
+                        yield n, json.loads(line)
+                    except ValueError as e:
+                        yield n, {"_errore": f"JSON non valido: {e}"}
+        else:
+            for n, record in enumerate(csv.DictReader(f), start=1):
+                yield n, record
+
+
+def parse_row(n: int, raw: dict, stamp: str) -> tuple[GroupKey, BookingRequest]:
+    """Valida una riga e ne calcola la chiave di gruppo; ValueError se non valida."""
+    if "_errore" in raw:
+        raise ValueError(raw["_errore"])
+    fields = {k.strip().lower(): (v or "").strip() for k, v in raw.items() if k}
+    if not fields.get("nome") and fields.get("passeggero"):
+        fields["nome"], _, fields["cognome"] = fields["passeggero"].partition(" ")
+
+    missing = [k for k in ("nome", "cognome", "mail", "partenza", "arrivo", "data") if not fields.get(k)]
+    if missing:
+        raise ValueError(f"campi mancanti: {', '.join(missing)}")
+    if not _RE_MAIL.match(fields["mail"]):
+        raise ValueError(f"mail non valida: {fields['mail']}")
+
+    partenza = flight_search.resolve_place(fields["partenza"])
+    arrivo = flight_search.resolve_place(fields["arrivo"])
+    if not partenza or not arrivo:
+        raise ValueError(f"località sconosciuta: {fields['partenza'] if not partenza else fields['arrivo']}")
+    travel_date = flight_search.parse_date(fields["data"])
+    if travel_date is None:
+        raise ValueError(f"data non valida: {fields['data']}")
+
+    request = BookingRequest(
+        row=n,
+        nome=fields["nome"],
+        cognome=fields["cognome"],
+        mail=fields["mail"],
+        documento=fields.get("documento") or f"DOC{stamp}{n:06d}",
+    )
+    return (tuple(sorted(partenza)), tuple(sorted(arrivo)), travel_date), request
+
+
+class BatchBooker:
+    """Risolve i voli per gruppo (con cache) e inserisce le prenotazioni."""
+
+    def __init__(self, output: IO[str], concurrency: int = 8, window: int = 1000):
+        self.output = output
+        self.concurrency = concurrency
+        self.window = window
+        self.stats = BatchStats()
+        self._write_lock = threading.Lock()
+        self._flights: dict[GroupKey, Optional[FlightMatch]] = {}
+        self._flights_lock = threading.Lock()
+
+    def _emit(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        with self._write_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def _fail(self, row: int, error: str) -> None:
+        self.stats.add(failed=1)
+        self._emit({"row": row, "status": "error", "error": error})
+
+    def _resolve(self, key: GroupKey) -> Optional[FlightMatch]:
+        with self._flights_lock:
+            if key in self._flights:
+                return self._flights[key]
+        partenza, arrivo, travel_date = key
+        match = flight_search.find_flight(
+            FlightQuery(partenza=list(partenza), arrivo=list(arrivo), data=travel_date)
+        )
+        self.stats.add(searches=1)
+        with self._flights_lock:
+            self._flights[key] = match
+        return match
+
+    def _forget(self, key: GroupKey, match: FlightMatch) -> None:
+        """Volo esaurito: la prossima _resolve del gruppo cerca di nuovo (la ricerca esclude i voli pieni)."""
+        with self._flights_lock:
+            if self._flights.get(key) is match:
+                del self._flights[key]
+
+    def process_group(self, key: GroupKey, requests: list[BookingRequest]) -> None:
+        full: set[int] = set()
+        while requests:
+            try:
+                match = self._resolve(key)
+            except Exception as e:
+                for request in requests:
+                    self._fail(request.row, f"ricerca volo fallita: {e}")
+                return
+            if match is None or match.id_volo in full:
+                error = "ERRORE_VOLO_NON_TROVATO" if match is None else f"volo {match.id_volo} esaurito"
+                for request in requests:
+                    self._fail(request.row, error)
+                return
+            requests = self._book(match, requests)
+            if requests:
+                # Volo esaurito a metà gruppo: le righe rimaste passano al volo successivo
+                full.add(match.id_volo)
+                self._forget(key, match)
+
+    def _book(self, match: FlightMatch, requests: list[BookingRequest]) -> list[BookingRequest]:
+        """Prenota le righe sul volo; restituisce quelle rimaste senza posto."""
+        values = [(match.id_volo, r.documento, r.nome, r.cognome, r.mail) for r in requests]
+        try:
+            ids = database.insert_bookings(values)
+        except Exception as e:
+            # Il gruppo è atomico: si ripiega riga per riga per isolare quella che fallisce
+            # (con il volo quasi pieno: si occupano i posti rimasti)
+            logger.warning(f"Insert di gruppo fallito ({len(requests)} righe), ripiego per riga: {e}")
+            for i, (request, value) in enumerate(zip(requests, values)):
+                try:
+                    self._emit_ticket(match, request, database.insert_booking(*value))
+                except database.FlightFullError:
+                    return requests[i:]
+                except Exception as row_error:
+                    self._fail(request.row, f"inserimento fallito: {row_error}")
+            return []
+        for request, id_prenotazione in zip(requests, ids):
+            self._emit_ticket(match, request, id_prenotazione)
+        return []
+
+    def _emit_ticket(self, match: FlightMatch, request: BookingRequest, id_prenotazione: int) -> None:
+        try:
+            ticket = ticket_from_flight(match, f"{request.nome} {request.cognome}", id_prenotazione)
+        except Exception as e:
+            self._fail(request.row, f"biglietto non valido (prenotazione {id_prenotazione}): {e}")
+            return
+        self.stats.add(ok=1)
+        # Nell'archivio dei biglietti (weflai.ticket_store) con group commit, senza attendere l'fsync
+        get_tickets().append(ticket, wait=False)
+        self._emit({"row": request.row, "status": "ok", "ticket": ticket.model_dump()})
+
+    def run(self, path: str) -> BatchStats:
+        stamp = time.strftime("%Y%m%d%H%M%S")
+        rows = read_rows(path)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="weflai-batch") as executor:
+            while True:
+                window = list(islice(rows, self.window))
+                if not window:
+                    break
+                groups: dict[GroupKey, list[BookingRequest]] = {}
+                for n, raw in window:
+                    self.stats.rows += 1
+                    try:
+                        key, request = parse_row(n, raw, stamp)
+                    except ValueError as e:
+                        self._fail(n, str(e))
+                        continue
+                    groups.setdefault(key, []).append(request)
+                futures = [executor.submit(self.process_group, k, reqs) for k, reqs in groups.items()]
+                for future in as_completed(futures):
+                    future.result()
+        get_tickets().flush()
+        return self.stats
+
+
+def run():
+    """Entry point: batch_book <file>"""
+    parser = argparse.ArgumentParser(description="Prenotazioni in blocco da CSV/JSONL")
+    parser.add_argument("input", help="file CSV o JSONL di prenotazioni")
+    parser.add_argument("-o", "--output", help="file JSONL dei biglietti (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=8, help="gruppi elaborati in parallelo")
+    parser.add_argument("--window", type=int, default=1000, help="righe lette e raggruppate per volta")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    t0 = time.perf_counter()
+    try:
+        stats = BatchBooker(output, args.concurrency, args.window).run(args.input)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - t0
+    print(
+        f"📦 Batch completato in {elapsed:.1f}s: righe {stats.rows}, ok {stats.ok}, "
+        f"errori {stats.failed}, ricerche volo {stats.searches}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,253 @@
+# weflai/cancellation.py
+"""
+Cancellazioni di prenotazioni in blocco, senza agenti.
+
+Filtri combinabili (in AND, almeno uno obbligatorio): lista di id_prenotazione,
+id_volo, intervallo di date di partenza, mail del passeggero. Le prenotazioni
+selezionate vengono spostate in we_flai.prenotazioni_cancellate con un'unica
+istruzione per blocco:
+
+    WITH bersaglio AS (SELECT ... LIMIT n FOR UPDATE OF p),
+         cancellate AS (DELETE ... USING bersaglio RETURNING ...)
+    INSERT INTO we_flai.prenotazioni_cancellate SELECT ... FROM cancellate
+
+Ogni blocco (WEFLAI_CANCEL_CHUNK righe, default 500) è una transazione a sé:
+i lock sulle prenotazioni durano quanto un blocco, non quanto l'intera
+operazione, e un errore a metà lascia archiviati i blocchi già completati.
+Il trigger dei posti (weflai.tools.inventory) restituisce i posti ai voli.
+
+Il report è JSONL, una riga per prenotazione cancellata (più una per ogni id
+richiesto e non trovato), con l'id dell'operazione registrato anche
+nell'archivio.
+
+Uso: cancel_bookings --volo 123 [--motivo "volo soppresso"] [-o report.jsonl] [--dry-run]
+     cancel_bookings --dal 2026-03-01 --al 2026-03-03 --mail mario.rossi@example.com
+     cancel_bookings --ids 10 11 12
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import date
+from typing import IO, NamedTuple, Optional
+
+from sqlalchemy import text
+
+from weflai import telemetry
+from weflai.tools import database, sql_cache
+from weflai.tools.database import BookingRow
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv("WEFLAI_CANCEL_CHUNK", "500"))
+
+ARCHIVE_DDL = """
+CREATE TABLE IF NOT EXISTS we_flai.prenotazioni_cancellate (
+  id_prenotazione BIGINT PRIMARY KEY,
+  id_volo         BIGINT NOT NULL,
+  id_documento    TEXT NOT NULL,
+  nome_utente     TEXT NOT NULL,
+  cognome_utente  TEXT NOT NULL,
+  mail_utente     TEXT NOT NULL,
+  cancellata_il   TIMESTAMPTZ NOT NULL DEFAULT now(),
+  motivo          TEXT NOT NULL DEFAULT '',
+  operazione      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_prenotazioni_cancellate_volo ON we_flai.prenotazioni_cancellate (id_volo);
+CREATE INDEX IF NOT EXISTS idx_prenotazioni_cancellate_operazione ON we_flai.prenotazioni_cancellate (operazione);
+"""
+
+_archive_ready = False
+_archive_lock = threading.Lock()
+
+
+class CancelFilter(NamedTuple):
+    """Criteri di selezione delle prenotazioni da cancellare (in AND)."""
+    ids: tuple[int, ...] = ()
+    voli: tuple[int, ...] = ()
+    dal: Optional[date] = None
+    al: Optional[date] = None
+    mail: Optional[str] = None
+
+    def is_empty(self) -> bool:
+        return not (self.ids or self.voli or self.dal or self.al or self.mail)
+
+    def where(self) -> tuple[str, str, dict]:
+        """JOIN, condizioni e parametri SQL; le date si riferiscono alla partenza del volo."""
+        conditions, params = ["p.id_prenotazione > :dopo"], {}
+        if self.ids:
+            conditions.append("p.id_prenotazione = ANY(:ids)")
+            params["ids"] = list(self.ids)
+        if self.voli:
+            conditions.append("p.id_volo = ANY(:voli)")
+            params["voli"] = list(self.voli)
+        if self.mail:
+            conditions.append("p.mail_utente = :mail")
+            params["mail"] = self.mail
+        if self.dal:
+            conditions.append("v.data_ptz >= :dal")
+            params["dal"] = self.dal
+        if self.al:
+            conditions.append("v.data_ptz <= :al")
+            params["al"] = self.al
+        join = "JOIN we_flai.voli v ON v.id_volo = p.id_volo" if self.dal or self.al else ""
+        return join, " AND ".join(conditions), params
+
+
+class CancelStats(NamedTuple):
+    operazione: str
+    cancellate: int
+    non_trovate: int
+    blocchi: int
+    seconds: float
+
+
+def _operation_id() -> str:
+    return f"canc-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def ensure_archive() -> None:
+    """Crea la tabella di archivio se manca (una volta per processo)."""
+    global _archive_ready
+    if _archive_ready:
+        return
+    with _archive_lock:
+        if not _archive_ready:
+            with database.get_engine().begin() as conn:
+                conn.execution_options(no_parameters=True).exec_driver_sql(ARCHIVE_DDL)
+            _archive_ready = True
+
+
+def count(filters: CancelFilter) -> int:
+    """Prenotazioni che una cancellazione con questi filtri coinvolgerebbe."""
+    join, where, params = filters.where()
+    with database.get_engine().connect() as conn:
+        return conn.execute(
+            text(f"SELECT count(*) FROM we_flai.prenotazioni p {join} WHERE {where}"), {**params, "dopo": 0}
+        ).scalar_one()
+
+
+def cancel_chunk(filters: CancelFilter, operazione: str, motivo: str = "", dopo: int = 0,
+                 limit: int = CHUNK_SIZE) -> list[BookingRow]:
+    """Archivia e cancella fino a `limit` prenotazioni con id > `dopo`, in una transazione."""
+    join, where, params = filters.where()
+    sql = text(f"""
+        WITH bersaglio AS (
+            SELECT p.id_prenotazione
+            FROM we_flai.prenotazioni p {join}
+            WHERE {where}
+            ORDER BY p.id_prenotazione
+            LIMIT :limit
+            FOR UPDATE OF p
+        ), cancellate AS (
+            DELETE FROM we_flai.prenotazioni p
+            USING bersaglio b
+            WHERE p.id_prenotazione = b.id_prenotazione
+            RETURNING p.id_prenotazione, p.id_volo, p.id_documento, p.nome_utente, p.cognome_utente,
+                      p.mail_utente
+        )
+        INSERT INTO we_flai.prenotazioni_cancellate
+            (id_prenotazione, id_volo, id_documento, nome_utente, cognome_utente, mail_utente,
+             motivo, operazione)
+        SELECT c.*, :motivo, :operazione FROM cancellate c
+        RETURNING id_prenotazione, id_volo, id_documento, nome_utente, cognome_utente, mail_utente
+    """)
+    with database.get_engine().begin() as conn:
+        rows = conn.execute(sql, {**params, "dopo": dopo, "limit": limit,
+                                  "motivo": motivo, "operazione": operazione}).all()
+    if rows:
+        sql_cache.invalidate(("prenotazioni", "prenotazioni_cancellate", "voli"))
+    return sorted((BookingRow(*row) for row in rows), key=lambda r: r.id_prenotazione)
+
+
+def cancel_bookings(filters: CancelFilter, motivo: str = "", output: Optional[IO[str]] = None,
+                    chunk_size: int = CHUNK_SIZE) -> CancelStats:
+    """
+    Cancella a blocchi tutte le prenotazioni che soddisfano i filtri, scrivendo
+    il report JSONL su `output`. ValueError senza filtri.
+    """
+    if filters.is_empty():
+        raise ValueError("specificare almeno un filtro (id, volo, date o mail)")
+    ensure_archive()
+    operazione = _operation_id()
+    t0 = time.perf_counter()
+
+    def emit(record: dict) -> None:
+        if output is not None:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+    cancelled, chunks, dopo = set(), 0, 0
+    while True:
+        with telemetry.span("cancel_chunk", "db", operazione=operazione, dopo=dopo):
+            rows = cancel_chunk(filters, operazione, motivo, dopo, chunk_size)
+        if not rows:
+            break
+        chunks += 1
+        for row in rows:
+            cancelled.add(row.id_prenotazione)
+            emit({
+                "status": "cancelled",
+                "operazione": operazione,
+                "id_prenotazione": row.id_prenotazione,
+                "id_volo": row.id_volo,
+                "passeggero": f"{row.nome_utente} {row.cognome_utente}",
+                "mail": row.mail_utente,
+            })
+        dopo = rows[-1].id_prenotazione
+        logger.info(f"{operazione}: blocco {chunks}, {len(rows)} prenotazioni (totale {len(cancelled)})")
+
+    missing = [i for i in dict.fromkeys(filters.ids) if i not in cancelled]
+    for id_prenotazione in missing:
+        emit({"status": "not_found", "operazione": operazione, "id_prenotazione": id_prenotazione})
+    return CancelStats(operazione, len(cancelled), len(missing), chunks, time.perf_counter() - t0)
+
+
+def cancel_one(id_prenotazione: int, motivo: str = "richiesta utente") -> Optional[BookingRow]:
+    """Cancella (archiviandola) una singola prenotazione; None se non esiste."""
+    ensure_archive()
+    rows = cancel_chunk(CancelFilter(ids=(id_prenotazione,)), _operation_id(), motivo, limit=1)
+    return rows[0] if rows else None
+
+
+def run():
+    """Entry point: cancel_bookings --volo/--ids/--dal/--al/--mail"""
+    parser = argparse.ArgumentParser(description="Cancellazione di prenotazioni in blocco")
+    parser.add_argument("--ids", type=int, nargs="+", default=[], help="id_prenotazione da cancellare")
+    parser.add_argument("--volo", type=int, nargs="+", default=[], help="id_volo (tutte le sue prenotazioni)")
+    parser.add_argument("--dal", type=date.fromisoformat, help="data di partenza minima (YYYY-MM-DD)")
+    parser.add_argument("--al", type=date.fromisoformat, help="data di partenza massima (YYYY-MM-DD)")
+    parser.add_argument("--mail", help="mail del passeggero")
+    parser.add_argument("--motivo", default="", help="motivo registrato nell'archivio")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="prenotazioni per transazione")
+    parser.add_argument("-o", "--output", help="report JSONL (default: stdout)")
+    parser.add_argument("--dry-run", action="store_true", help="conta le prenotazioni senza cancellarle")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    filters = CancelFilter(tuple(args.ids), tuple(args.volo), args.dal, args.al, args.mail)
+    if filters.is_empty():
+        parser.error("specificare almeno un filtro (--ids, --volo, --dal/--al, --mail)")
+    if args.dry_run:
+        print(f"🔎 Prenotazioni che verrebbero cancellate: {count(filters)}", file=sys.stderr)
+        return
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        stats = cancel_bookings(filters, args.motivo, output, args.chunk)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(
+        f"🗑️  Operazione {stats.operazione} completata in {stats.seconds:.1f}s: cancellate {stats.cancellate} "
+        f"in {stats.blocchi} blocchi, id non trovati {stats.non_trovate}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    run()
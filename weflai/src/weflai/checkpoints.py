@@ -0,0 +1,279 @@
+# weflai/checkpoints.py
+"""
+Checkpoint durevoli delle richieste del flow, in SQLite.
+
+Una prenotazione passa da task lenti (LLM) e dalla conferma dell'utente: se
+fallisce dopo (inserimento, costruzione del biglietto), ripeterla da capo
+rifà tutto. Qui ogni richiesta registra lo scope di idempotenza usato e
+l'output di ogni task completato; un nuovo tentativo della stessa richiesta
+riparte dal primo task non completato (weflai.flow.handle_booking) con lo
+stesso scope, così una prenotazione già scritta viene ritrovata e non duplicata.
+
+La richiesta è identificata da sessione + giorno + intento + testo
+normalizzato: un'altra sessione con lo stesso testo non riprende (e non
+conferma) la prenotazione di qualcun altro, e una data relativa ("domani")
+ripetuta il giorno dopo è una richiesta nuova. Lo stato del flow non si salva:
+intento e testo sono già nella chiave, il resto si ricalcola.
+
+Scritture sul percorso caldo: solo append, accodate in memoria e scritte da
+un thread in un'unica transazione ogni WEFLAI_CHECKPOINT_FLUSH_MS ms
+(default 200) o ogni BATCH record; flush() le attende (prima di ogni lettura e
+all'uscita, al massimo WEFLAI_CHECKPOINT_WAIT_S secondi, default 10). Il record "done" chiude il tentativo: una richiesta conclusa
+non viene più ripresa.
+
+GC: all'avvio del writer e con `checkpoints --gc` si cancellano i tentativi
+conclusi e le richieste senza attività da WEFLAI_CHECKPOINT_TTL secondi
+(default 24 ore).
+
+File: WEFLAI_CHECKPOINT_DB (default checkpoints/weflai.sqlite).
+"""
+import argparse
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import date
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("WEFLAI_CHECKPOINT_DB", "checkpoints/weflai.sqlite")
+FLUSH_MS = int(os.getenv("WEFLAI_CHECKPOINT_FLUSH_MS", "200"))
+TTL = float(os.getenv("WEFLAI_CHECKPOINT_TTL", str(24 * 3600)))
+# Attesa massima di flush() (anche all'uscita): un writer bloccato non ferma il flow
+WAIT_S = float(os.getenv("WEFLAI_CHECKPOINT_WAIT_S", "10"))
+BATCH = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+  id      INTEGER PRIMARY KEY AUTOINCREMENT,
+  request TEXT NOT NULL,
+  kind    TEXT NOT NULL,
+  name    TEXT NOT NULL DEFAULT '',
+  payload TEXT NOT NULL DEFAULT '',
+  created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_checkpoints_request ON checkpoints (request, id);
+"""
+
+# Tipi di record (i record "state" delle versioni precedenti vengono ignorati)
+SCOPE, TASK, DONE = "scope", "task", "done"
+
+
+class Record(NamedTuple):
+    request: str
+    kind: str
+    name: str
+    payload: str
+    created: float
+
+
+class Checkpoint(NamedTuple):
+    """Tentativo aperto di una richiesta: scope e output dei task completati."""
+    request: str
+    scope: Optional[str]
+    tasks: dict[str, str]
+    updated: float
+
+
+def request_key(intent: str, query: str, session: str, day: Optional[date] = None) -> str:
+    """Chiave della richiesta: stessa sessione, stesso giorno, stesso intento e stesso testo (minuscolo, spazi singoli)."""
+    normalized = " ".join(query.lower().split())
+    day = day or date.today()
+    return hashlib.sha256(f"{session}\n{day.isoformat()}\n{intent}\n{normalized}".encode()).hexdigest()[:32]
+
+
+class CheckpointStore:
+    def __init__(self, path: str = DB_PATH, flush_ms: int = FLUSH_MS, ttl: float = TTL, wait_s: float = WAIT_S):
+        self.path = path
+        self.flush_ms = flush_ms
+        self.ttl = ttl
+        self.wait_s = wait_s
+        # Record da scrivere e, da flush(), eventi segnalati quando i record accodati prima sono scritti
+        self._queue: "queue.Queue[Record | threading.Event]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._start_lock:
+            if self._writer is None:
+                with closing(self._connect()) as conn:
+                    self._gc(conn, self.ttl)
+                self._writer = threading.Thread(target=self._write_loop, name="weflai-checkpoints", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _write_loop(self) -> None:
+        conn = None
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_ms / 1000
+            # Un flush() in attesa chiude subito il gruppo
+            while len(batch) < BATCH and not isinstance(batch[-1], threading.Event):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            records = [item for item in batch if isinstance(item, Record)]
+            try:
+                if records:
+                    # Connessione aperta (o riaperta dopo un errore) dal writer stesso: un errore non lo ferma
+                    conn = conn or self._connect()
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO checkpoints (request, kind, name, payload, created) VALUES (?, ?, ?, ?, ?)",
+                            records,
+                        )
+            except Exception as e:
+                logger.warning(f"Checkpoint non scritti ({len(records)} record): {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+            finally:
+                for item in batch:
+                    if isinstance(item, threading.Event):
+                        item.set()
+
+    def append(self, request: str, kind: str, name: str = "", payload: str = "") -> None:
+        self._ensure_writer()
+        self._queue.put(Record(request, kind, name, payload, time.time()))
+
+    def flush(self) -> bool:
+        """Attende (al massimo WEFLAI_CHECKPOINT_WAIT_S secondi) che i record accodati siano scritti; False se scade."""
+        if self._writer is None:
+            return True
+        written = threading.Event()
+        self._queue.put(written)
+        if written.wait(self.wait_s):
+            return True
+        state = "attivo" if self._writer.is_alive() else "fermo"
+        logger.warning(f"Checkpoint ancora in coda dopo {self.wait_s:g} s (writer {state})")
+        return False
+
+    def load(self, request: str) -> Optional[Checkpoint]:
+        """Tentativo aperto della richiesta (dopo l'ultimo "done"), None se assente o scaduto."""
+        self.flush()
+        if not Path(self.path).exists():
+            return None
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT kind, name, payload, created FROM checkpoints WHERE request = ? AND id > "
+                "coalesce((SELECT max(id) FROM checkpoints WHERE request = ? AND kind = ?), 0) ORDER BY id",
+                (request, request, DONE),
+            ).fetchall()
+        if not rows or rows[-1][3] < time.time() - self.ttl:
+            return None
+        scope, tasks = None, {}
+        for kind, name, payload, _ in rows:
+            if kind == SCOPE:
+                scope = payload
+            elif kind == TASK:
+                tasks[name] = payload
+        return Checkpoint(request, scope, tasks, rows[-1][3])
+
+    @staticmethod
+    def _gc(conn: sqlite3.Connection, ttl: float) -> int:
+        with conn:
+            expired = conn.execute(
+                "DELETE FROM checkpoints WHERE request IN "
+                "(SELECT request FROM checkpoints GROUP BY request HAVING max(created) < ?)",
+                (time.time() - ttl,),
+            ).rowcount
+            finished = conn.execute(
+                "DELETE FROM checkpoints WHERE id <= (SELECT max(d.id) FROM checkpoints d "
+                "WHERE d.request = checkpoints.request AND d.kind = ?)",
+                (DONE,),
+            ).rowcount
+        return expired + finished
+
+    def gc(self, ttl: Optional[float] = None) -> int:
+        """Cancella tentativi conclusi e richieste scadute; restituisce i record rimossi."""
+        self.flush()
+        with closing(self._connect()) as conn:
+            return self._gc(conn, self.ttl if ttl is None else ttl)
+
+
+class Attempt:
+    """Tentativo di una richiesta: output già noti da un tentativo precedente e registrazione dei nuovi."""
+
+    def __init__(self, store: CheckpointStore, request: str, previous: Optional[Checkpoint]):
+        self.store = store
+        self.request = request
+        self.resumed = previous is not None and bool(previous.tasks)
+        self.tasks: dict[str, str] = dict(previous.tasks) if previous else {}
+        self.scope: Optional[str] = previous.scope if previous else None
+
+    def set_scope(self, scope: str) -> str:
+        """Scope di idempotenza del tentativo: quello registrato, se c'è, altrimenti `scope`."""
+        if self.scope is None:
+            self.scope = scope
+            self.store.append(self.request, SCOPE, payload=scope)
+        return self.scope
+
+    def task_done(self, output) -> None:
+        """Callback per Crew.task_callback: registra l'output del task appena completato."""
+        if output.name:
+            self.tasks[output.name] = output.raw
+            self.store.append(self.request, TASK, output.name, output.raw)
+
+    def finish(self) -> None:
+        """Richiesta conclusa (con o senza prenotazione): non verrà più ripresa."""
+        self.store.append(self.request, DONE)
+
+
+def begin(intent: str, query: str, session: str) -> Attempt:
+    """Tentativo della richiesta nella sessione `session`, che riprende quello aperto se esiste."""
+    from weflai.registry import get_checkpoints
+
+    store = get_checkpoints()
+    request = request_key(intent, query, session)
+    return Attempt(store, request, store.load(request))
+
+
+def run():
+    """Entry point: checkpoints [--gc] [--ttl SECONDI]"""
+    parser = argparse.ArgumentParser(description="Checkpoint delle richieste di WeFlaiFlow")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--gc", action="store_true", help="cancella tentativi conclusi e richieste scadute")
+    parser.add_argument("--ttl", type=float, default=TTL, help="secondi di inattività prima della scadenza")
+    args = parser.parse_args()
+
+    store = CheckpointStore(args.db, ttl=args.ttl)
+    if args.gc:
+        print(f"🧹 Record rimossi: {store.gc()}")
+    if not Path(args.db).exists():
+        print("Nessun checkpoint.")
+        return
+    with closing(store._connect()) as conn:
+        rows = conn.execute(
+            "SELECT request, count(*) FILTER (WHERE kind = ?), max(created) FROM checkpoints "
+            "GROUP BY request ORDER BY max(created) DESC",
+            (TASK,),
+        ).fetchall()
+    print(f"Richieste con checkpoint: {len(rows)}")
+    for request, tasks, updated in rows:
+        print(f"  {request}  task completati {tasks}  ultimo aggiornamento "
+              f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(updated))}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,192 @@
+# weflai/crew_pool.py
+"""
+Crew pronte all'uso, costruite fuori dal percorso della richiesta.
+
+Costruire una crew significa rileggere agents.yaml e tasks_*.yaml, creare
+Agent e Task e collegarli: pochi millisecondi, ma pagati da ogni richiesta.
+Qui ogni tipo di crew ha una piccola riserva di istanze già costruite:
+acquire() ne consegna una (mai riusata: stato di agenti, task e memoria è
+sempre pulito) e un thread in background ne costruisce un'altra per
+rimpiazzarla. Gli YAML vengono letti una sola volta per processo.
+
+La durata di acquire() è lo span "build" (weflai.telemetry): con la riserva
+piena è il costo di un pop, altrimenti quello della costruzione completa.
+"""
+import atexit
+import copy
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Optional
+
+from weflai import telemetry
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("WEFLAI_CREW_POOL_SIZE", "2"))
+
+# Un solo thread daemon costruisce le crew: non rallenta l'uscita del processo
+_requests: queue.SimpleQueue = queue.SimpleQueue()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+_building_lock = threading.Lock()
+_stopping = threading.Event()
+
+
+@lru_cache(maxsize=None)
+def _read_yaml(path: str) -> dict:
+    import yaml
+
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def _load_yaml_once(path) -> dict:
+    # CrewBase modifica la configurazione (agent/context diventano oggetti): copia per istanza
+    return copy.deepcopy(_read_yaml(str(path)))
+
+
+def cache_configs(crew_class):
+    """Sostituisce il caricamento YAML di una classe @CrewBase con quello in cache."""
+    crew_class.load_yaml = staticmethod(_load_yaml_once)
+    return crew_class
+
+
+def _worker_loop() -> None:
+    while True:
+        pool = _requests.get()
+        with _building_lock:
+            if not _stopping.is_set():
+                pool._build_one()
+
+
+@atexit.register
+def _stop_worker() -> None:
+    # Un thread daemon interrotto a metà di un import durante lo spegnimento fa abortire l'interprete
+    _stopping.set()
+    if _building_lock.acquire(timeout=10):
+        _building_lock.release()
+
+
+def _schedule(pool: "CrewPool") -> None:
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_worker_loop, name="weflai-crew-pool", daemon=True)
+            _worker.start()
+    _requests.put(pool)
+
+
+class CrewPool:
+    """Riserva di crew già costruite di un tipo, rabboccata in background."""
+
+    def __init__(self, name: str, factory: Callable, size: int = POOL_SIZE):
+        self.name = name
+        self.factory = factory
+        self.size = size
+        self._ready: deque = deque()
+        self._lock = threading.Lock()
+        self._building = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _build_one(self) -> None:
+        try:
+            crew = self.factory()
+        except Exception as e:
+            logger.warning(f"Costruzione crew {self.name} in background fallita: {e}")
+            crew = None
+        with self._lock:
+            self._building -= 1
+            if crew is not None:
+                self._ready.append(crew)
+
+    def fill(self) -> None:
+        """Porta la riserva a `size` crew, costruendo quelle mancanti in background."""
+        with self._lock:
+            missing = self.size - len(self._ready) - self._building
+            self._building += max(missing, 0)
+        for _ in range(missing):
+            _schedule(self)
+
+    def acquire(self):
+        with telemetry.span(self.name, "build") as span:
+            with self._lock:
+                crew = self._ready.popleft() if self._ready else None
+                if crew is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            span.attributes["crew.pooled"] = crew is not None
+            if crew is None:
+                crew = self.factory()
+        self.fill()
+        return crew
+
+    def stats(self) -> str:
+        return f"{self.name}: pronte {len(self._ready)}, hit {self.hits}, miss {self.misses}"
+
+
+# --- crew dell'applicazione ---
+
+def _booking():
+    from weflai.crews.booking_crew.booking_crew import BookingCrew
+    return cache_configs(BookingCrew)().crew()
+
+
+def _booking_direct():
+    # id_volo segnaposto: quello vero si imposta all'acquire (set_flight)
+    from weflai.crews.booking_crew.booking_crew import BookingCrew
+    return cache_configs(BookingCrew)(id_volo=0).crew()
+
+
+def _cancellation():
+    from weflai.crews.cancellation_crew.cancellation_crew import CancellationCrew
+    return cache_configs(CancellationCrew)().crew()
+
+
+def _info():
+    from weflai.crews.info_crew.info_crew import InfoCrew
+    return cache_configs(InfoCrew)().crew()
+
+
+_pools = {
+    "booking": CrewPool("booking", _booking),
+    "booking_direct": CrewPool("booking_direct", _booking_direct),
+    "cancellation": CrewPool("cancellation", _cancellation),
+    "info": CrewPool("info", _info),
+}
+
+
+def get_crew(name: str):
+    """Una crew nuova del tipo `name` (booking, booking_direct, cancellation, info)."""
+    return _pools[name].acquire()
+
+
+def booking_crew(id_volo: Optional[int] = None, completed: Optional[dict[str, str]] = None):
+    """
+    BookingCrew pronta; con id_volo la ricerca del volo è già precompilata, con
+    `completed` anche i task di un tentativo precedente (weflai.checkpoints).
+    """
+    outputs = dict(completed or {})
+    if id_volo is not None:
+        outputs.setdefault("search_flight_task", str(id_volo))
+    crew = get_crew("booking_direct" if id_volo is not None else "booking")
+    if not outputs:
+        return crew
+    from weflai.crews.booking_crew.booking_crew import prefill
+
+    return prefill(crew, outputs)
+
+
+def prewarm(names: Optional[list[str]] = None) -> None:
+    """Riempie in background le riserve indicate (default: tutte)."""
+    for name in names or list(_pools):
+        _pools[name].fill()
+
+
+def stats() -> str:
+    return "; ".join(pool.stats() for pool in _pools.values())
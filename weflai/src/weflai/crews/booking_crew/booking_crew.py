@@ -1,8 +1,41 @@
-from crewai import Agent, Crew, Process, Task, LLM
-from crewai.project import CrewBase, agent, crew, task
+from crewai import Agent, Crew, Process, Task
+from crewai.project import CrewBase, agent, before_kickoff, crew, task
+from crewai.tasks.task_output import TaskOutput
 # Assicurati che questi import puntino ai tuoi file reali
-from weflai.tools.db_tools import execute_sql_tool 
-from weflai.models import TicketOutput
+from weflai.tools.db_tools import book_seat_tool, cheapest_flight_tool, execute_sql_tool_for
+from weflai import routing
+from weflai.registry import get_llm
+from weflai.tools.schema_catalog import schema_prompt
+
+
+def prefill(crew: Crew, outputs: dict[str, str]) -> Crew:
+    """
+    Precompila l'output dei task già eseguiti (per nome) e li toglie dalla
+    crew: i task successivi li ricevono tramite context, come se li avesse
+    appena prodotti l'agente. Serve per il volo già trovato e per riprendere
+    una prenotazione da un checkpoint (weflai.checkpoints).
+    """
+    known = {}
+    for task_ in crew.tasks:
+        known[task_.name] = task_
+        # context NOT_SPECIFIED (non una lista) per i task senza context esplicito
+        for previous in task_.context if isinstance(task_.context, list) else []:
+            known.setdefault(previous.name, previous)
+    for name, raw in outputs.items():
+        task_ = known.get(name)
+        if task_ is not None:
+            task_.output = TaskOutput(description=task_.description, name=name, raw=raw, agent=task_.agent.role)
+    crew.tasks = [task_ for task_ in crew.tasks if task_.name not in outputs]
+    return crew
+
+
+def set_flight(crew: Crew, id_volo: int) -> Crew:
+    """
+    Precompila l'output di search_flight_task (già tolto dai task della crew)
+    con il volo scelto.
+    """
+    return prefill(crew, {"search_flight_task": str(id_volo)})
+
 
 @CrewBase
 class BookingCrew():
@@ -10,41 +43,41 @@ class BookingCrew():
 
     agents_config = 'config/agents.yaml'
     tasks_config = 'config/tasks_booking.yaml'
+    # Modello per task ed escalation (weflai.routing)
+    routing_config = 'config/routing.yaml'
 
-    # LLM Configuration
-    ollama_llm = LLM(
-        model="ollama/llama3.1:8b",
-        base_url="http://localhost:11434"
-    )
+    def __init__(self, id_volo: int | None = None):
+        # id_volo già risolto dal motore deterministico (weflai.tools.flight_search):
+        # in quel caso search_flight_task non viene eseguito dall'LLM
+        self.id_volo = id_volo
+
+    @before_kickoff
+    def add_schema(self, inputs):
+        # Schema del DB nei prompt degli agenti ({schema}), dal catalogo in cache
+        return {**inputs, "schema": schema_prompt()}
 
     @agent
     def flight_analyst(self) -> Agent:
-        return Agent(
+        return routing.RoutedAgent(
             config=self.agents_config['flight_analyst'],
             # RIMOSSO: tables_schema_tool e list_tables_tool. 
             # Ha già lo schema nella backstory, non deve perdere tempo a cercarlo.
-            tools=[execute_sql_tool], 
-            llm=self.ollama_llm,
+            # La ricerca passa dall'indice di disponibilità (cheapest_flight_tool), non da SQL scritto a mano.
+            tools=[cheapest_flight_tool, execute_sql_tool_for("flight_analyst")],
+            llm=get_llm(),
+            routes=routing.load(self.base_directory / self.routing_config),
             verbose=True,
             allow_delegation=False
         )
 
     @agent
     def booking_manager(self) -> Agent:
-        return Agent(
+        return routing.RoutedAgent(
             config=self.agents_config['booking_manager'],
-            tools=[execute_sql_tool],
-            llm=self.ollama_llm,
-            verbose=True,
-            allow_delegation=False
-        )
-
-    @agent
-    def customer_experience_agent(self) -> Agent:
-        return Agent(
-            config=self.agents_config['customer_experience_agent'],
-            tools=[execute_sql_tool],
-            llm=self.ollama_llm,
+            # Scrittura con controllo dei posti e chiave di idempotenza (weflai.tools.inventory)
+            tools=[book_seat_tool, execute_sql_tool_for("booking_manager")],
+            llm=get_llm(),
+            routes=routing.load(self.base_directory / self.routing_config),
             verbose=True,
             allow_delegation=False
         )
@@ -58,6 +91,7 @@ class BookingCrew():
         return Task(
             config=self.tasks_config['confirm_selection_task'],
             agent=self.flight_analyst(),
+            context=[self.search_flight_task()],
             human_input=True,
             # Questo assicura che l'input umano sia l'unica cosa che conta qui
     )
@@ -70,25 +104,22 @@ class BookingCrew():
             context=[self.search_flight_task(), self.confirm_selection_task()]
         )
 
-    @task
-    def generate_JSON_ticket_task(self) -> Task:
-        return Task(
-            config=self.tasks_config['generate_JSON_ticket_task'],
-            context=[self.insert_booking_task()], # Gli serve solo l'ID prenotazione
-            output_pydantic=TicketOutput,
-            output_file='ticket_emesso.json'
-        )
-
     @crew
     def crew(self) -> Crew:
-        return Crew(
-            agents=[self.flight_analyst(), self.booking_manager(), self.customer_experience_agent()],
-            tasks=[
-                self.search_flight_task(), 
-                self.confirm_selection_task(), 
-                self.insert_booking_task(), 
-                self.generate_JSON_ticket_task()
-            ],
+        tasks = [
+            self.search_flight_task(), 
+            self.confirm_selection_task(), 
+            self.insert_booking_task()
+            # Il biglietto non è un task: lo costruisce weflai.tools.ticket_builder
+            # dall'id_prenotazione restituito da insert_booking_task
+        ]
+        if self.id_volo is not None:
+            # Volo già trovato: la ricerca non viene eseguita (vedi set_flight)
+            tasks.pop(0)
+        crew = Crew(
+            agents=[self.flight_analyst(), self.booking_manager()],
+            tasks=tasks,
             process=Process.sequential,
             verbose=True
-        )
\ No newline at end of file
+        )
+        return set_flight(crew, self.id_volo) if self.id_volo is not None else crew
\ No newline at end of file
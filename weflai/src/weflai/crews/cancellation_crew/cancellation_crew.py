@@ -1,6 +1,9 @@
-from crewai import Agent, Crew, Process, Task, LLM
-from crewai.project import CrewBase, agent, crew, task
-from weflai.tools.db_tools import execute_sql_tool
+from crewai import Agent, Crew, Process, Task
+from crewai.project import CrewBase, agent, before_kickoff, crew, task
+from weflai.tools.db_tools import cancel_booking_tool, execute_sql_tool_for
+from weflai import routing
+from weflai.registry import get_llm
+from weflai.tools.schema_catalog import schema_prompt
 
 @CrewBase
 class CancellationCrew():
@@ -8,27 +11,32 @@ class CancellationCrew():
 
     agents_config = 'config/agents.yaml'
     tasks_config = 'config/tasks_cancellation.yaml'
+    # Modello per task ed escalation (weflai.routing)
+    routing_config = 'config/routing.yaml'
 
-    ollama_llm = LLM(
-        model="ollama/llama3.1:8b",
-        base_url="http://localhost:11434"
-    )
+    @before_kickoff
+    def add_schema(self, inputs):
+        # Schema del DB nei prompt degli agenti ({schema}), dal catalogo in cache
+        return {**inputs, "schema": schema_prompt()}
 
     @agent
     def flight_analyst(self) -> Agent:
-        return Agent(
+        return routing.RoutedAgent(
             config=self.agents_config['flight_analyst'],
-            tools=[execute_sql_tool], # Anche qui, niente schema tool
-            llm=self.ollama_llm,
+            tools=[execute_sql_tool_for("flight_analyst")], # Anche qui, niente schema tool
+            llm=get_llm(),
+            routes=routing.load(self.base_directory / self.routing_config),
             verbose=True
         )
 
     @agent
     def booking_manager(self) -> Agent:
-        return Agent(
+        return routing.RoutedAgent(
             config=self.agents_config['booking_manager'],
-            tools=[execute_sql_tool],
-            llm=self.ollama_llm,
+            # Cancellazione con archivio (weflai.cancellation), niente DELETE scritte dall'LLM
+            tools=[cancel_booking_tool],
+            llm=get_llm(),
+            routes=routing.load(self.base_directory / self.routing_config),
             verbose=True
         )
 
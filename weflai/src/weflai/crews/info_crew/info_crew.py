@@ -1,8 +1,11 @@
-from crewai import Agent, Crew, Process, Task,LLM
-from crewai.project import CrewBase, agent, crew, task
+from crewai import Agent, Crew, Process, Task
+from crewai.project import CrewBase, agent, before_kickoff, crew, task
 # Importiamo sia DB tool che RAG tool
-from weflai.tools.db_tools import execute_sql_tool, list_tables_tool
+from weflai.tools.db_tools import cheapest_flight_tool, execute_sql_tool_for, list_tables_tool
 from weflai.tools.rag_tools import pdf_tool
+from weflai import routing
+from weflai.registry import get_llm
+from weflai.tools.schema_catalog import schema_prompt
 
 @CrewBase
 class InfoCrew():
@@ -10,20 +13,22 @@ class InfoCrew():
 
     agents_config = 'config/agents.yaml'
     tasks_config = 'config/tasks_info.yaml'
+    # Modello per task ed escalation (weflai.routing)
+    routing_config = 'config/routing.yaml'
 
-    # --- 1. DEFINISCI L'LLM QUI ---
-    ollama_llm = LLM(
-        model="ollama/llama3.1:8b",
-        base_url="http://localhost:11434"
-    )
+    @before_kickoff
+    def add_schema(self, inputs):
+        # Schema del DB nei prompt degli agenti ({schema}), dal catalogo in cache
+        return {**inputs, "schema": schema_prompt()}
 
     @agent
     def info_rag_agent(self) -> Agent:
-        return Agent(
+        return routing.RoutedAgent(
             config=self.agents_config['info_rag_agent'],
             # Questo agente ha accesso a entrambi i mondi (DB e PDF)
-            tools=[execute_sql_tool, list_tables_tool, pdf_tool],
-            llm=self.ollama_llm,
+            tools=[cheapest_flight_tool, execute_sql_tool_for("info_rag_agent"), list_tables_tool, pdf_tool],
+            llm=get_llm(),
+            routes=routing.load(self.base_directory / self.routing_config),
             verbose=True
         )
 
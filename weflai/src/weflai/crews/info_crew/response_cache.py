@@ -0,0 +1,290 @@
+# weflai/crews/info_crew/response_cache.py
+"""
+Cache semantica delle risposte di InfoCrew.
+
+Le domande dei clienti sono spesso quasi identiche ("quanto pesa il bagaglio
+a mano?", "bagaglio a mano peso massimo"): prima di avviare la crew si cerca
+una risposta già data per la stessa domanda normalizzata o, solo per le
+risposte tratte dal regolamento, per una domanda con embedding (bge-m3)
+abbastanza simile. Le risposte dal DB valgono solo per la stessa domanda:
+"voli Roma-Milano domani" e "voli Roma-Napoli domani" hanno embedding quasi
+uguali ma risposte diverse.
+
+Invalidazione:
+- risposte ottenute dal PDF: quando cambia l'hash di knowledge_base/regolamento.pdf
+- risposte ottenute dal DB: quando cambia il contatore di modifiche
+  (pg_stat_user_tables) delle tabelle lette, es. voli. Postgres aggiorna
+  quei contatori in modo asincrono (a fine transazione, con un ritardo fino
+  a PGSTAT_MIN_INTERVAL) e qui si rileggono al massimo ogni
+  version_check_interval: una scrittura appena avvenuta può ancora servire
+  una risposta vecchia per qualche secondo. Per questo le risposte dal DB
+  hanno anche un TTL breve (WEFLAI_INFO_CACHE_DB_TTL, default 60 s)
+- in ogni caso: TTL ed evizione LRU oltre max_entries
+
+I contatori si leggono fuori dal lock della cache: una lookup non aspetta
+le query a Postgres delle altre.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from pydantic import BaseModel, ConfigDict, Field
+
+from weflai.tools import database, sql_cache
+from weflai.tools.pdf_index import PDF_PATH, embed_texts
+
+logger = logging.getLogger(__name__)
+
+# Tool della crew -> sorgente della risposta
+_TOOL_SOURCES = {"execute_sql_tool": "db", "list_tables_tool": "db", "cheapest_flight_tool": "db"}
+# Tabelle lette dai tool che non ricevono SQL (l'indice di disponibilità dipende da entrambe)
+_TOOL_TABLES = {"cheapest_flight_tool": {"voli", "prenotazioni"}}
+_RE_TABLES = re.compile(r"\b(?:from|join|into|update)\s+([\w\".]+)", re.IGNORECASE)
+
+
+class CachedAnswer(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    query: str
+    answer: str
+    embedding: Optional[np.ndarray] = None
+    sources: set[str] = Field(default_factory=set)
+    pdf_hash: Optional[str] = None
+    table_versions: dict[str, int] = Field(default_factory=dict)
+    created_at: float = Field(default_factory=time.monotonic)
+    elapsed: float = 0.0
+
+
+def normalize_query(query: str) -> str:
+    """Minuscolo, senza accenti né punteggiatura, spazi singoli."""
+    query = unicodedata.normalize("NFKD", query)
+    query = "".join(c for c in query if not unicodedata.combining(c))
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return re.sub(r"\s+", " ", query).strip()
+
+
+def tables_in_sql(sql: str) -> set[str]:
+    """Nomi (senza schema) delle tabelle citate in una query."""
+    return {name.replace('"', "").split(".")[-1].lower() for name in _RE_TABLES.findall(sql)}
+
+
+class InfoResponseCache:
+    """Cache LRU/TTL con lookup esatto sul testo normalizzato e per similarità coseno."""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 24 * 3600,
+                 db_ttl_seconds: float = 60, similarity_threshold: float = 0.92,
+                 version_check_interval: float = 2.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_ttl_seconds = db_ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.version_check_interval = version_check_interval
+
+        self._entries: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self._lock = threading.Lock()
+        self._versions_lock = threading.Lock()
+        self._pdf_stat: Optional[tuple[float, int]] = None
+        self._pdf_hash: Optional[str] = None
+        self._table_versions: dict[str, int] = {}
+        self._versions_checked_at = 0.0
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    # --- fingerprint delle sorgenti ---
+
+    def pdf_hash(self) -> Optional[str]:
+        """sha256 del PDF, ricalcolato solo quando cambiano mtime o dimensione."""
+        try:
+            stat = os.stat(PDF_PATH)
+        except OSError:
+            return None
+        key = (stat.st_mtime, stat.st_size)
+        if key != self._pdf_stat:
+            with open(PDF_PATH, "rb") as f:
+                self._pdf_hash = hashlib.sha256(f.read()).hexdigest()
+            self._pdf_stat = key
+        return self._pdf_hash
+
+    def table_versions(self, tables: set[str]) -> dict[str, int]:
+        """Contatori di modifica delle tabelle, riletti al massimo ogni version_check_interval."""
+        now = time.monotonic()
+        with self._versions_lock:
+            known = dict(self._table_versions)
+            checked_at = self._versions_checked_at
+        if tables - known.keys() or now - checked_at > self.version_check_interval:
+            # Query fuori dal lock: due thread possono rileggere insieme, nessuno aspetta l'altro
+            try:
+                fresh = database.table_change_counters(sorted(tables | known.keys()))
+            except Exception as e:
+                logger.warning(f"Versioni tabelle non disponibili: {e}")
+                return {}
+            with self._versions_lock:
+                self._table_versions.update(fresh)
+                self._versions_checked_at = now
+            known.update(fresh)
+        return {t: known[t] for t in tables if t in known}
+
+    # --- embedding ---
+
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            return embed_texts([text])[0]
+        except Exception as e:
+            logger.warning(f"Embedding non disponibile, solo match esatto: {e}")
+            return None
+
+    # --- validità ---
+
+    def _is_valid(self, entry: CachedAnswer, now: float) -> bool:
+        # Può interrogare il DB (table_versions): da chiamare fuori da self._lock
+        ttl = self.db_ttl_seconds if "db" in entry.sources else self.ttl_seconds
+        if now - entry.created_at > ttl:
+            return False
+        if "pdf" in entry.sources and entry.pdf_hash != self.pdf_hash():
+            return False
+        if entry.table_versions:
+            current = self.table_versions(set(entry.table_versions))
+            if current != entry.table_versions:
+                return False
+        return True
+
+    # --- API ---
+
+    def lookup(self, query: str, embedding: Optional[np.ndarray] = None) -> Optional[CachedAnswer]:
+        key = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and not self._is_valid(entry, now):
+            self._discard(entry)
+            entry = None
+        semantic = False
+        if entry is None and embedding is not None:
+            entry = self._nearest(embedding, now)
+            semantic = entry is not None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_key = normalize_query(entry.query)
+            if entry_key in self._entries:
+                self._entries.move_to_end(entry_key)
+            self.hits += 1
+            self.semantic_hits += semantic
+            self.saved_seconds += entry.elapsed
+            return entry
+
+    def _discard(self, entry: CachedAnswer) -> None:
+        key = normalize_query(entry.query)
+        with self._lock:
+            # Solo se nel frattempo nessuno l'ha sostituita
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def _nearest(self, embedding: np.ndarray, now: float) -> Optional[CachedAnswer]:
+        # Solo risposte dal regolamento: quelle dal DB dipendono da città, date e id della domanda
+        with self._lock:
+            candidates = [e for e in self._entries.values() if e.embedding is not None and e.sources == {"pdf"}]
+        if not candidates:
+            return None
+        scores = np.stack([e.embedding for e in candidates]) @ embedding
+        for i in np.argsort(-scores):
+            if scores[i] < self.similarity_threshold:
+                break
+            if self._is_valid(candidates[i], now):
+                return candidates[i]
+            self._discard(candidates[i])
+        return None
+
+    def store(self, query: str, answer: str, sources: set[str], tables: set[str],
+              elapsed: float, embedding: Optional[np.ndarray] = None) -> None:
+        entry = CachedAnswer(
+            query=query,
+            answer=answer,
+            embedding=embedding,
+            sources=sources,
+            pdf_hash=self.pdf_hash() if "pdf" in sources else None,
+            elapsed=elapsed,
+        )
+        if tables:
+            entry.table_versions = self.table_versions(tables)
+        with self._lock:
+            key = normalize_query(query)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, source: Optional[str] = None) -> int:
+        """Rimuove tutte le risposte (o solo quelle di una sorgente: "pdf"/"db")."""
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if source is None or source in e.sources]
+            for k in keys:
+                del self._entries[k]
+            return len(keys)
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        ratio = 100.0 * self.hits / total if total else 0.0
+        return (
+            f"hit {self.hits}/{total} ({ratio:.1f}%, di cui semantici {self.semantic_hits}), "
+            f"miss {self.misses}, latenza risparmiata {self.saved_seconds:.1f}s, voci {len(self._entries)}"
+        )
+
+
+cache = InfoResponseCache(
+    max_entries=int(os.getenv("WEFLAI_INFO_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("WEFLAI_INFO_CACHE_TTL", str(24 * 3600))),
+    db_ttl_seconds=float(os.getenv("WEFLAI_INFO_CACHE_DB_TTL", "60")),
+    similarity_threshold=float(os.getenv("WEFLAI_INFO_CACHE_THRESHOLD", "0.92")),
+)
+
+
+def _sources_from_crew(crew) -> tuple[set[str], set[str]]:
+    """Sorgenti (pdf/db) e tabelle lette, ricavate dai tool usati dagli agenti."""
+    sources, tables = set(), set()
+    for agent in crew.agents:
+        for tool_result in agent.tools_results or []:
+            tool_name = tool_result.get("tool_name", "")
+            source = _TOOL_SOURCES.get(tool_name, "pdf" if "pdf" in tool_name.lower() else None)
+            if source:
+                sources.add(source)
+            args = tool_result.get("tool_args") or {}
+            if tool_name == "execute_sql_tool" and isinstance(args, dict):
+                tables |= tables_in_sql(str(args.get("query", "")))
+            tables |= _TOOL_TABLES.get(tool_name, set())
+    return sources, tables
+
+
+def cached_kickoff(query: str) -> str:
+    """InfoCrew().crew().kickoff con la cache semantica davanti."""
+    embedding = cache.embed(normalize_query(query))
+    entry = cache.lookup(query, embedding)
+    if entry is not None:
+        logger.info(f"⚡ Risposta info dalla cache ({cache.summary()})")
+        return entry.answer
+
+    from weflai import crew_pool
+
+    t0 = time.perf_counter()
+    crew = crew_pool.get_crew("info")
+    with sql_cache.run_scope("info"):
+        result = crew.kickoff(inputs={"query": query})
+    elapsed = time.perf_counter() - t0
+
+    sources, tables = _sources_from_crew(crew)
+    if sources:
+        # Risposte senza tool non sono ancorate a dati: non si salvano
+        cache.store(query, result.raw, sources, tables, elapsed, embedding)
+    logger.info(f"Risposta info calcolata in {elapsed:.1f}s ({cache.summary()})")
+    return result.raw
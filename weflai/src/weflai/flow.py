@@ -0,0 +1,212 @@
+# weflai/flow.py
+# CrewAI Flow Imports
+from crewai.flow.flow import Flow, listen, start, router
+
+# Project Imports
+from weflai import cancellation, checkpoints, crew_pool, intent, streaming, telemetry, ticket_store
+from weflai.models import WeFlaiState
+from weflai import interaction
+from weflai.interaction import say
+from weflai.menu import read_user_intent
+from weflai.tools import database, flight_search, inventory, sql_cache, ticket_builder
+
+# Span di step, crew, task, tool e chiamate LLM dall'event bus di crewAI
+telemetry.install_crewai_listener()
+
+_YES = {"si", "sì", "s", "yes", "y", "confermo", "conferma", "ok"}
+
+
+def _confirmed(answer: str) -> bool:
+    """Solo un sì esplicito: risposta vuota o qualsiasi altro testo valgono no."""
+    return answer.strip().strip(".!").lower() in _YES
+
+
+class WeFlaiFlow(Flow[WeFlaiState]):
+
+    @start()
+    def get_user_intent(self):
+        # Intento già raccolto (es. menu mostrato da kickoff prima di caricare crewAI)
+        if self.state.user_intent:
+            return
+        self.state.user_intent, self.state.user_query = read_user_intent()
+
+    @router(get_user_intent)
+    def route_request(self):
+        # Testo libero: regole e classificatore locale, LLM solo se la confidenza è bassa
+        if self.state.user_intent not in intent.INTENTS:
+            result = intent.classify(self.state.user_query)
+            self.state.user_intent = result.intent
+            self.state.intent_confidence = result.confidence
+            self.state.intent_source = result.source
+            if result.source != "llm" and result.confidence < intent.threshold_for(result.intent):
+                # Né regole, né classificatore, né LLM sono convinti: meglio chiedere che avviare la crew sbagliata
+                return "unclear"
+            say(f"\n🧭 Intento riconosciuto: {result.intent} ({result.source}, confidenza {result.confidence:.2f})")
+        return self.state.user_intent
+
+    @listen("booking")
+    def handle_booking(self):
+        attempt = None
+        try:
+            # Checkpoint della richiesta: un nuovo tentativo nella stessa sessione riparte dal primo task non
+            # completato (da terminale l'utente è uno solo: sessione "console")
+            attempt = checkpoints.begin("booking", self.state.user_query, self.state.session_id or "console")
+            if attempt.resumed:
+                say(f"\n♻️  Riprendo la prenotazione interrotta (già completati: {', '.join(attempt.tasks)})")
+
+            # Prenotazione già scritta da un tentativo precedente: resta solo il biglietto
+            booked = attempt.tasks.get("insert_booking_task")
+            if booked is None:
+                booking_crew = self._booking_crew(attempt.tasks)
+                if booking_crew is None:
+                    attempt.finish()
+                    return
+
+            if booked is None:
+                say(f"\n🚀 Avvio Booking Crew per: '{self.state.user_query}'")
+                booking_crew.task_callback = attempt.task_done
+                # Kickoff della Crew: le prenotazioni ripetute nella stessa richiesta hanno la stessa chiave
+                # (il turno si fissa qui: la conferma dell'utente durante la crew ne apre uno nuovo;
+                # un tentativo ripreso riusa lo scope registrato nel checkpoint)
+                scope = attempt.set_scope(f"flow:{self.flow_id}:{interaction.turn_started_ns()}")
+                with inventory.idempotency_scope(scope), sql_cache.run_scope(f"booking {self.flow_id}"):
+                    booked = booking_crew.kickoff(inputs={"query": self.state.user_query}).raw
+            
+            # La crew restituisce l'id_prenotazione: il biglietto si legge dal DB, ma solo per una prenotazione
+            # creata da book_seat_tool in questa richiesta (un numero inventato o l'id_volo ripetuto dall'agente
+            # mostrerebbero e archivierebbero il biglietto di un altro passeggero)
+            id_prenotazione = ticket_builder.parse_booking_id(booked)
+            ticket = None
+            if id_prenotazione is not None:
+                if attempt.scope is not None and inventory.booked_in_scope(id_prenotazione, attempt.scope):
+                    ticket = ticket_builder.build_ticket(id_prenotazione)
+                else:
+                    booked = f"prenotazione {id_prenotazione} non registrata in questa richiesta, biglietto non emesso"
+            if ticket is not None:
+                self.state.final_ticket = ticket
+                say("\n" + "✅"*20)
+                say(" BIGLIETTO EMESSO CON SUCCESSO ")
+                say("✅"*20)
+                say(self.state.final_ticket.model_dump_json(indent=4))
+                # Archivio append-only (weflai.ticket_store): nessuna sovrascrittura tra sessioni
+                try:
+                    ticket_store.archive(ticket)
+                except OSError as e:
+                    say(f"\n⚠️  Biglietto emesso ma non archiviato: {e}")
+            else:
+                # Caso in cui la Crew restituisce testo (es. "Volo non trovato")
+                say(f"\n⚠️  RISULTATO: {booked}")
+            attempt.finish()
+                
+        except Exception as e:
+            say(f"\n❌ ERRORE CRITICO DURANTE LA PRENOTAZIONE: {e}")
+            if attempt is not None and attempt.tasks:
+                say("   Ripeti la stessa richiesta per riprendere dall'ultimo passo completato.")
+
+    def _booking_crew(self, completed: dict[str, str]):
+        """BookingCrew per la richiesta, con i task già completati precompilati; None se non c'è un volo."""
+        if "search_flight_task" in completed:
+            return crew_pool.booking_crew(completed=completed)
+        try:
+            # Percorso veloce: parsing deterministico + query SQL, senza LLM
+            flight_query, match = flight_search.search(self.state.user_query)
+        except database.SchemaNotReady as e:
+            # Anche la crew fallirebbe all'inserimento: meglio dirlo subito
+            say(f"\n❌ Database non pronto per le prenotazioni: {e}")
+            return None
+        except Exception as e:
+            say(f"\n⚠️  Ricerca diretta non disponibile ({e}), passo alla crew.")
+            flight_query, match = None, None
+
+        if flight_query is not None and match is None:
+            say("\n⚠️  RISULTATO: ERRORE_VOLO_NON_TROVATO (nessun volo entro ±3 giorni)")
+            return None
+
+        if match is not None:
+            say(f"\n⚡ Volo individuato: {match.describe()}")
+            return crew_pool.booking_crew(match.id_volo, completed)
+        # Richiesta ambigua: decide l'agente
+        return crew_pool.booking_crew(completed=completed)
+
+    @listen("cancellation")
+    def handle_cancellation(self):
+        # Numero di prenotazione esplicito: cancellazione diretta, la crew serve solo a interpretare il testo.
+        # Il testo può citare il numero senza chiedere la cancellazione ("quanto costa cancellare la 123?"):
+        # si mostra la prenotazione e si cancella solo con un sì esplicito
+        lookup = ticket_builder.parse_lookup(self.state.user_query)
+        if lookup.id_prenotazione is not None:
+            try:
+                ticket = database.get_ticket_row(lookup.id_prenotazione)
+                if ticket is None:
+                    say("\n✅ ESITO OPERAZIONE:")
+                    say(f"Prenotazione {lookup.id_prenotazione} non trovata: nessuna cancellazione.")
+                    return
+                answer = interaction.ask(
+                    f"\n🗑️  Prenotazione {ticket.id_prenotazione} di {ticket.nome_utente} {ticket.cognome_utente}: "
+                    f"volo {ticket.id_volo} {ticket.citta_partenza} -> {ticket.citta_arrivo} del "
+                    f"{ticket.data_ptz.isoformat()} alle {ticket.ora_ptz.strftime('%H:%M')}.\n"
+                    f"Confermi la cancellazione? (sì/no): "
+                )
+                if not _confirmed(answer):
+                    say("\n↩️  Nessuna cancellazione.")
+                    return
+                row = cancellation.cancel_one(lookup.id_prenotazione)
+            except Exception as e:
+                say(f"\n❌ ERRORE CANCELLAZIONE: {e}")
+                return
+            say("\n✅ ESITO OPERAZIONE:")
+            if row is None:
+                say(f"Prenotazione {lookup.id_prenotazione} non trovata: nessuna cancellazione.")
+            else:
+                say(f"Prenotazione {row.id_prenotazione} di {row.nome_utente} {row.cognome_utente} "
+                    f"(volo {row.id_volo}) cancellata.")
+            return
+
+        say(f"\n🗑️  Avvio Cancellation Crew per: '{self.state.user_query}'")
+        try:
+            with sql_cache.run_scope(f"cancellation {self.flow_id}"):
+                result = crew_pool.get_crew("cancellation").kickoff(inputs={"query": self.state.user_query})
+            say("\n✅ ESITO OPERAZIONE:")
+            say(result.raw)
+        except Exception as e:
+            say(f"\n❌ ERRORE CANCELLAZIONE: {e}")
+
+    @listen("info")
+    def handle_info(self):
+        from weflai.crews.info_crew.response_cache import cached_kickoff
+
+        say(f"\n💡 Avvio Info Crew per: '{self.state.user_query}'")
+        try:
+            answer = cached_kickoff(self.state.user_query)
+            # Già mostrata token per token (weflai.streaming): niente doppione
+            if not streaming.take_shown(answer):
+                say("\n" + answer)
+        except Exception as e:
+            say(f"\n❌ ERRORE INFORMAZIONI: {e}")
+
+    @listen("status")
+    def handle_status(self):
+        # Lookup diretto sul DB (numero, mail o nome): nessuna crew
+        try:
+            tickets = ticket_builder.lookup_tickets(self.state.user_query)
+        except Exception as e:
+            say(f"\n❌ ERRORE RICERCA PRENOTAZIONE: {e}")
+            return
+
+        if tickets is None:
+            say("\n⚠️  Indica il numero di prenotazione, la mail oppure nome e cognome del passeggero.")
+        elif not tickets:
+            say("\n⚠️  RISULTATO: nessuna prenotazione trovata")
+        else:
+            say(f"\n📋 Prenotazioni trovate: {len(tickets)}")
+            for ticket in tickets:
+                say(ticket.model_dump_json(indent=4))
+
+    @listen("unclear")
+    def handle_unclear(self):
+        say("\n🤔 Non ho capito se vuoi prenotare, cancellare, verificare una prenotazione o chiedere "
+            "informazioni. Riprova specificando l'operazione o scegli un numero dal menu.")
+
+    @listen("exit")
+    def handle_exit(self):
+        say("\n👋 Arrivederci!")
@@ -0,0 +1,232 @@
+# weflai/intent.py
+"""
+Riconoscimento dell'intento da testo libero, prima di avviare una crew.
+
+Tre livelli, dal più economico:
+1. tabella di regex compilate con un peso per intento (verbi di cancellazione,
+   "stato della prenotazione", domande sul regolamento, ...): se un intento
+   prevale nettamente si decide subito
+2. classificatore Naive Bayes locale su parole (radici) e bigrammi, addestrato
+   all'import su poche frasi di esempio, con le regole come evidenza a priori
+3. solo se la confidenza resta sotto WEFLAI_INTENT_THRESHOLD, una domanda
+   secca all'LLM condiviso (una parola in risposta)
+
+La cancellazione è irreversibile e ha un cancello più stretto: soglia
+WEFLAI_INTENT_CANCEL_THRESHOLD (default 0.85) e mai da negazioni ("non
+voglio cancellare, voglio cambiarla") o domande ("quanto costa cancellare
+la prenotazione 123?"), nemmeno se lo dice l'LLM.
+
+Nessuna dipendenza pesante: il modulo si importa anche dal menu.
+"""
+import logging
+import math
+import os
+import re
+import unicodedata
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("booking", "cancellation", "info", "status", "exit")
+THRESHOLD = float(os.getenv("WEFLAI_INTENT_THRESHOLD", "0.6"))
+CANCEL_THRESHOLD = float(os.getenv("WEFLAI_INTENT_CANCEL_THRESHOLD", "0.85"))
+LLM_FALLBACK = os.getenv("WEFLAI_INTENT_LLM_FALLBACK", "1") not in ("0", "false", "False")
+
+# (intento, regex sul testo normalizzato, peso)
+_RULES = [(intent, re.compile(pattern), weight) for intent, pattern, weight in [
+    ("exit", r"^(esci|exit|quit|basta|fine|ciao|arrivederci)$", 3.0),
+    ("cancellation", r"\b(cancell|annull|disdi|elimin|rimuov)\w*", 2.0),
+    ("status", r"\bstato (della |del |di )?(mia |mio )?(prenotazion|bigliett|volo)", 2.0),
+    ("status", r"\b(verific|controll|ritrova|ristamp|recuper)\w* (la |il |le |i )?(mia |mio |mie |miei )?"
+               r"(prenotazion|bigliett)", 2.0),
+    ("status", r"\b(ho prenotato|la mia prenotazione|le mie prenotazioni|il mio biglietto|e confermat)", 1.5),
+    ("status", r"\bprenotazione (n|numero|nr)?\.? ?\d+\b", 1.0),
+    ("booking", r"\b(prenota|prenotare|prenotami|prenotiamo|acquista|acquistare|compra|comprare)\b", 2.0),
+    ("booking", r"\b(vorrei|voglio|cerco|mi serve) (un )?(volo|biglietto|posto)\b", 2.0),
+    ("booking", r"\bda [a-z]+( [a-z]+)? (a|per) [a-z]+", 1.0),
+    ("info", r"\b(bagagl|regolament|check ?in|liquid|animal|document|imbarc|rimbors|penal|franchigi)\w*", 2.0),
+    ("info", r"\b(quanto (costa|costano|pesa)|quali sono|che voli|orari|come (funziona|si))\b", 1.5),
+    ("info", r"\?$", 1.0),
+]]
+
+# Verbi di cancellazione negati o dentro una domanda: non chiedono di cancellare
+_CANCEL_VERB = r"(cancell|annull|disdi|elimin|rimuov)\w*"
+_RE_CANCEL_NEGATED = re.compile(
+    r"\bnon (?:(?:voglio|vorrei|devo|intendo|serve|occorre|bisogna) )?(?:piu )?(?:di )?" + _CANCEL_VERB
+)
+_RE_CANCEL_QUESTION = re.compile(
+    r"^(quanto|quanti|come|cosa|che cosa|quando|perche|posso|si puo|e possibile|quali?)\b"
+    r"|\b(quanto costa|quanto si paga|penal\w*|costi? (di|della|per)|rimbors\w*)\b"
+)
+
+# Frasi di esempio per il classificatore locale
+_EXAMPLES = {
+    "booking": [
+        "volo roma milano domani mattina per mario rossi",
+        "prenota un volo da napoli a torino il 12 marzo",
+        "vorrei un biglietto per parigi venerdi",
+        "mi serve un volo per londra la prossima settimana",
+        "prenotami il primo volo per catania",
+        "un posto sul volo per palermo di sabato a nome giulia bianchi",
+        "volo milano new york 2026-03-01 per luca verdi luca verdi@example com",
+        "andata per barcellona dopodomani sera",
+    ],
+    "cancellation": [
+        "cancella la prenotazione di mario rossi",
+        "annulla il mio volo per milano",
+        "voglio disdire la prenotazione",
+        "elimina la prenotazione numero 42",
+        "non parto piu cancella tutto",
+        "rimuovi il biglietto di giulia bianchi per parigi",
+        "devo annullare il viaggio di domani",
+    ],
+    "info": [
+        "quanto pesa il bagaglio a mano",
+        "posso portare liquidi in cabina",
+        "come funziona il check in online",
+        "quali documenti servono per l imbarco",
+        "che voli ci sono per roma questa settimana",
+        "quanto costa un volo per parigi",
+        "orari dei voli da milano",
+        "posso portare il mio cane in aereo",
+        "regole per il rimborso in caso di ritardo",
+    ],
+    "status": [
+        "stato della mia prenotazione",
+        "la mia prenotazione e confermata",
+        "verifica la prenotazione 123",
+        "ho prenotato un volo per roma a nome mario rossi",
+        "ristampa il mio biglietto",
+        "controlla le prenotazioni di mario rossi",
+        "a che ora parte il mio volo prenotato",
+        "ritrova il biglietto di mario.rossi@example.com",
+    ],
+    "exit": ["esci", "basta cosi grazie", "arrivederci", "ho finito ciao"],
+}
+
+_LLM_PROMPT = (
+    "Classifica la richiesta di un cliente di una compagnia aerea in una sola di queste categorie: "
+    "booking (nuova prenotazione), cancellation (cancellare una prenotazione), status (stato o "
+    "ristampa di una prenotazione esistente), info (domande su voli, orari, prezzi, bagagli, "
+    "regolamento), exit (chiudere). Rispondi solo con il nome della categoria.\n\nRichiesta: "
+)
+
+
+class IntentResult(NamedTuple):
+    intent: str
+    confidence: float
+    source: str  # rules, classifier, llm
+
+
+def normalize(text: str) -> str:
+    """Minuscolo, senza accenti né punteggiatura (tranne '?' finale), spazi singoli."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower().strip()
+    question = text.endswith("?")
+    text = re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text)).strip()
+    return text + "?" if question else text
+
+
+def _features(normalized: str) -> list[str]:
+    # Radici di 5 lettere: "prenotazione"/"prenotare", "cancella"/"cancellare" coincidono
+    stems = [w[:5] for w in re.findall(r"[a-z]+", normalized) if len(w) > 2]
+    return stems + [f"{a}_{b}" for a, b in zip(stems, stems[1:])]
+
+
+class NaiveBayes:
+    """Naive Bayes multinomiale con smoothing di Laplace."""
+
+    def __init__(self, examples: dict[str, list[str]]):
+        self.labels = list(examples)
+        self.counts: dict[str, dict[str, int]] = {}
+        self.totals: dict[str, int] = {}
+        vocabulary: set[str] = set()
+        for label, texts in examples.items():
+            counts: dict[str, int] = {}
+            for text in texts:
+                for feature in _features(normalize(text)):
+                    counts[feature] = counts.get(feature, 0) + 1
+            self.counts[label] = counts
+            self.totals[label] = sum(counts.values())
+            vocabulary |= counts.keys()
+        self.vocabulary = vocabulary
+
+    def predict_proba(self, normalized: str) -> dict[str, float]:
+        # Le feature mai viste non discriminano: senza feature note restano le probabilità uniformi
+        features = [f for f in _features(normalized) if f in self.vocabulary]
+        size = len(self.vocabulary)
+        logs = {
+            label: sum(math.log((self.counts[label].get(f, 0) + 1) / (self.totals[label] + size)) for f in features)
+            for label in self.labels
+        }
+        top = max(logs.values())
+        exp = {label: math.exp(value - top) for label, value in logs.items()}
+        total = sum(exp.values())
+        return {label: value / total for label, value in exp.items()}
+
+
+_classifier = NaiveBayes(_EXAMPLES)
+
+
+def rule_scores(normalized: str) -> dict[str, float]:
+    scores: dict[str, float] = {}
+    for intent, pattern, weight in _RULES:
+        if pattern.search(normalized):
+            scores[intent] = scores.get(intent, 0.0) + weight
+    return scores
+
+
+def threshold_for(name: str, threshold: float = THRESHOLD) -> float:
+    """Confidenza minima per decidere l'intento senza chiedere: più alta per la cancellazione."""
+    return max(threshold, CANCEL_THRESHOLD) if name == "cancellation" else threshold
+
+
+def cancellation_excluded(normalized: str) -> bool:
+    """Il testo cita la cancellazione ma non la chiede (negazione o domanda)."""
+    return bool(_RE_CANCEL_NEGATED.search(normalized) or _RE_CANCEL_QUESTION.search(normalized))
+
+
+def _ask_llm(text: str) -> str | None:
+    from weflai.registry import get_llm
+
+    answer = get_llm().call([{"role": "user", "content": _LLM_PROMPT + text}])
+    match = re.search(r"\b(" + "|".join(INTENTS) + r")\b", str(answer).lower())
+    return match.group(1) if match else None
+
+
+def classify(text: str, llm_fallback: bool = LLM_FALLBACK, threshold: float = THRESHOLD) -> IntentResult:
+    """Intento di una richiesta in testo libero con confidenza (0-1) e livello che l'ha deciso."""
+    normalized = normalize(text)
+    if not normalized:
+        return IntentResult("exit", 1.0, "rules")
+
+    excluded = cancellation_excluded(normalized)
+    scores = rule_scores(normalized)
+    if excluded:
+        scores.pop("cancellation", None)
+    if scores:
+        best = max(scores, key=scores.get)
+        confidence = scores[best] / sum(scores.values())
+        if scores[best] >= 2.0 and confidence >= threshold_for(best, threshold):
+            return IntentResult(best, confidence, "rules")
+
+    # Le regole scattate spostano le probabilità del classificatore invece di decidere
+    probabilities = _classifier.predict_proba(normalized)
+    if excluded:
+        probabilities["cancellation"] = 0.0
+    weighted = {label: p * (1.0 + scores.get(label, 0.0)) for label, p in probabilities.items()}
+    total = sum(weighted.values())
+    best = max(weighted, key=weighted.get)
+    result = IntentResult(best, weighted[best] / total, "classifier")
+    if result.confidence >= threshold_for(result.intent, threshold) or not llm_fallback:
+        return result
+
+    try:
+        intent = _ask_llm(text)
+    except Exception as e:
+        logger.warning(f"Fallback LLM per l'intento non disponibile: {e}")
+        return result
+    if intent is None or (excluded and intent == "cancellation"):
+        return result
+    # L'LLM non dà una probabilità: si riporta quella locale dell'intento scelto
+    return IntentResult(intent, weighted.get(intent, 0.0) / total, "llm")
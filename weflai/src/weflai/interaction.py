@@ -0,0 +1,201 @@
+# weflai/interaction.py
+"""
+Canale di interazione con l'utente.
+
+Il flow e le crew non chiamano più print()/input() direttamente ma passano da
+say()/ask(): da terminale si comportano come prima, mentre nel server
+(weflai.server) ogni sessione lega il proprio canale al thread che esegue il
+flow. Anche la richiesta di feedback che crewAI fa per i task con
+human_input=True viene instradata sul canale della sessione corrente.
+
+I canali che implementano anche stream()/stream_end() ricevono le risposte
+degli agenti mentre vengono generate (weflai.streaming). flow_events() espone
+un flow come generatore asincrono di eventi per i front end asyncio.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Optional, Protocol
+
+
+class UserChannel(Protocol):
+    def say(self, text: str) -> None: ...
+
+    def ask(self, prompt: str) -> str: ...
+
+
+class ConsoleChannel:
+    """Canale di default: terminale."""
+
+    def say(self, text: str) -> None:
+        print(text)
+
+    def ask(self, prompt: str) -> str:
+        return input(prompt)
+
+    def stream(self, chunk: str) -> None:
+        print(chunk, end="", flush=True)
+
+    def stream_end(self) -> None:
+        print()
+
+
+_console = ConsoleChannel()
+_local = threading.local()
+
+
+def current_channel() -> UserChannel:
+    return getattr(_local, "channel", None) or _console
+
+
+@contextmanager
+def use_channel(channel: UserChannel):
+    """Lega un canale al thread corrente per la durata del blocco."""
+    previous = getattr(_local, "channel", None)
+    _local.channel = channel
+    mark_turn()
+    try:
+        yield channel
+    finally:
+        _local.channel = previous
+
+
+def say(text: str = "") -> None:
+    current_channel().say(text)
+
+
+def ask(prompt: str = "") -> str:
+    answer = current_channel().ask(prompt)
+    mark_turn()
+    return answer
+
+
+def mark_turn() -> None:
+    """L'utente ha appena scritto: da qui si misura il time-to-first-byte della risposta."""
+    _local.turn_ns = time.time_ns()
+
+
+def turn_started_ns() -> Optional[int]:
+    return getattr(_local, "turn_ns", None)
+
+
+def can_stream() -> bool:
+    return hasattr(current_channel(), "stream")
+
+
+def stream(chunk: str) -> None:
+    """Frammento di una risposta in corso di generazione (solo canali con stream())."""
+    current_channel().stream(chunk)
+
+
+def stream_end() -> None:
+    end = getattr(current_channel(), "stream_end", None)
+    if end is not None:
+        end()
+
+
+class QueueChannel:
+    """
+    Canale del thread di un flow che trasforma say/ask/stream in eventi su una
+    coda asyncio; le risposte arrivano con reply() dal lato event loop.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.events: asyncio.Queue = asyncio.Queue()
+        self._reply: Optional[Future] = None
+
+    def _emit(self, event: dict) -> None:
+        self.loop.call_soon_threadsafe(self.events.put_nowait, event)
+
+    def say(self, text: str) -> None:
+        self._emit({"type": "say", "text": text})
+
+    def stream(self, chunk: str) -> None:
+        self._emit({"type": "chunk", "text": chunk})
+
+    def stream_end(self) -> None:
+        self._emit({"type": "chunk_end"})
+
+    def ask(self, prompt: str) -> str:
+        self._reply = Future()
+        self._emit({"type": "ask", "prompt": prompt})
+        answer = self._reply.result()
+        if answer is None:
+            # Come input() a fine stream: il flow gestisce l'errore e termina
+            raise EOFError("Sessione chiusa dal client")
+        return answer
+
+    def reply(self, text: Optional[str]) -> None:
+        if self._reply is not None and not self._reply.done():
+            self._reply.set_result(text)
+
+    def run(self, flow, inputs: Optional[dict] = None) -> None:
+        try:
+            with use_channel(self):
+                flow.kickoff(inputs=inputs)
+        finally:
+            self._emit({"type": "done"})
+
+
+async def flow_events(flow, replies: asyncio.Queue, executor=None, inputs: Optional[dict] = None,
+                      reply_timeout: Optional[float] = None) -> AsyncIterator[dict]:
+    """
+    Esegue flow.kickoff nell'executor e ne produce gli eventi per il front end:
+    {"type": "say", "text"}, {"type": "chunk", "text"}, {"type": "chunk_end"},
+    {"type": "ask", "prompt"}. Dopo ogni "ask" la risposta si legge da `replies`
+    (None o timeout = utente sparito: il flow riceve EOFError).
+    """
+    loop = asyncio.get_running_loop()
+    channel = QueueChannel(loop)
+    execution = loop.run_in_executor(executor, channel.run, flow, inputs)
+    try:
+        while True:
+            event: dict[str, Any] = await channel.events.get()
+            if event["type"] == "done":
+                break
+            yield event
+            if event["type"] == "ask":
+                try:
+                    answer = await asyncio.wait_for(replies.get(), reply_timeout)
+                except asyncio.TimeoutError:
+                    answer = None
+                channel.reply(answer)
+    finally:
+        # Consumer interrotto: sblocca un eventuale ask pendente prima di attendere il flow
+        channel.reply(None)
+        await execution
+
+
+_hook_installed = False
+
+
+def install_human_input_hook() -> None:
+    """
+    Instrada la conferma umana dei task crewAI (human_input=True) sul canale
+    del thread corrente. Senza canale legato resta il comportamento originale
+    (prompt da terminale). Idempotente.
+    """
+    global _hook_installed
+    if _hook_installed:
+        return
+    from crewai.agents.agent_builder.base_agent_executor_mixin import CrewAgentExecutorMixin
+
+    original = CrewAgentExecutorMixin._ask_human_input
+
+    def _ask_human_input(executor, final_answer: str) -> str:
+        from weflai.streaming import take_shown
+
+        channel: Optional[UserChannel] = getattr(_local, "channel", None)
+        if channel is None:
+            return original(executor, final_answer)
+        # Risposta già comparsa in streaming: non si ripete
+        question = "Premi invio se va bene, altrimenti scrivi la correzione:"
+        answer = channel.ask(question if take_shown(final_answer) else f"{final_answer}\n\n{question}")
+        mark_turn()
+        return answer
+
+    CrewAgentExecutorMixin._ask_human_input = _ask_human_input
+    _hook_installed = True
@@ -0,0 +1,242 @@
+# weflai/llm_gateway.py
+"""
+Gateway unico verso i modelli: crew, tool e classificatore d'intento passano
+da qui (client LLM del registro, embedding di weflai.tools.pdf_index).
+
+Tutti i modelli stanno sulla stessa istanza Ollama; senza un punto di
+controllo, sotto carico le richieste si accodano senza limite nel server e i
+modelli si alternano in memoria. Il gateway:
+- limita le chiamate contemporanee per modello (WEFLAI_LLM_CONCURRENCY,
+  "modello=n;...", default=4 come OLLAMA_NUM_PARALLEL): le altre aspettano
+  uno slot nel processo, al più WEFLAI_LLM_QUEUE_TIMEOUT secondi, e oltre
+  WEFLAI_LLM_MAX_QUEUE chiamate in attesa per modello le nuove vengono
+  rifiutate subito con GatewayBusy invece di allungare la coda
+- unisce le chiamate identiche in corso (stesso modello, messaggi e stop,
+  senza function calling): la seconda aspetta la risposta della prima
+  invece di rifarla (WEFLAI_LLM_COALESCE=0 per disattivare)
+- mette i messaggi di sistema (ruolo, backstory, obiettivo e tool
+  dell'agente, stabili tra le chiamate) in testa al prompt, uniti in uno:
+  il prefisso è identico a ogni chiamata dello stesso agente e Ollama ne
+  riusa la cache KV invece di rivalutarlo
+- usa un solo client HTTP con connessioni keep-alive
+  (WEFLAI_LLM_HTTP_POOL connessioni) invece di quello con scadenza di litellm
+- chiede a Ollama keep_alive=WEFLAI_OLLAMA_KEEP_ALIVE a ogni richiesta: un
+  modello in uso non viene mai scaricato (weflai.warmup copre i periodi di
+  inattività)
+
+Metriche (weflai.telemetry): span "queue" con l'attesa dello slot
+(istogramma weflai_llm_queue_wait_seconds), weflai_llm_queue_depth e
+weflai_llm_in_flight per modello, weflai_llm_gateway_calls_total per esito.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+from crewai import LLM
+
+from weflai import telemetry
+
+logger = logging.getLogger(__name__)
+
+KEEP_ALIVE = os.getenv("WEFLAI_OLLAMA_KEEP_ALIVE", "30m")
+MAX_QUEUE = int(os.getenv("WEFLAI_LLM_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("WEFLAI_LLM_QUEUE_TIMEOUT", "300"))
+COALESCE = os.getenv("WEFLAI_LLM_COALESCE", "1") not in ("0", "false", "False")
+HTTP_POOL = int(os.getenv("WEFLAI_LLM_HTTP_POOL", "16"))
+HTTP_TIMEOUT = float(os.getenv("WEFLAI_LLM_HTTP_TIMEOUT", "600"))
+
+
+class GatewayBusy(RuntimeError):
+    """Troppe chiamate in attesa per il modello, o nessuno slot libero entro il timeout."""
+
+
+def _parse_limits(spec: str) -> dict[str, int]:
+    limits = {}
+    for item in spec.split(";"):
+        model, _, value = item.rpartition("=")
+        try:
+            limits[model.strip() or "default"] = max(int(value), 1)
+        except ValueError:
+            logger.warning(f"WEFLAI_LLM_CONCURRENCY: valore non valido {item.strip()!r}")
+    return limits
+
+
+_LIMITS = _parse_limits(os.getenv("WEFLAI_LLM_CONCURRENCY", "default=4"))
+
+
+def ollama_name(model: str) -> Optional[str]:
+    """'ollama/llama3.1:8b' -> 'llama3.1:8b'; None per modelli non serviti da Ollama."""
+    provider, _, name = model.partition("/")
+    return name if provider in ("ollama", "ollama_chat") and name else None
+
+
+# --- slot per modello ---
+
+class ModelGate:
+    """Slot di un modello: semaforo più i contatori pubblicati come metriche."""
+
+    def __init__(self, model: str, limit: int):
+        self.model = model
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+
+    def _publish(self) -> None:
+        telemetry.metrics.llm_queue_depth.set(self.waiting, model=self.model)
+        telemetry.metrics.llm_in_flight.set(self.running, model=self.model)
+
+    @contextmanager
+    def slot(self):
+        with self._lock:
+            if self.waiting >= MAX_QUEUE:
+                telemetry.metrics.llm_gateway.inc(model=self.model, outcome="rejected")
+                raise GatewayBusy(f"{self.model}: {self.waiting} chiamate già in coda")
+            self.waiting += 1
+            depth = self.waiting
+            self._publish()
+        acquired = False
+        try:
+            with telemetry.span(self.model, "queue", **{"llm.model": self.model, "queue.depth": depth}):
+                acquired = self._slots.acquire(timeout=QUEUE_TIMEOUT if QUEUE_TIMEOUT > 0 else None)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                self.running += acquired
+                self._publish()
+        if not acquired:
+            telemetry.metrics.llm_gateway.inc(model=self.model, outcome="rejected")
+            raise GatewayBusy(f"{self.model}: nessuno slot libero in {QUEUE_TIMEOUT:.0f}s")
+        telemetry.metrics.llm_gateway.inc(model=self.model, outcome="sent")
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.running -= 1
+                self._publish()
+            self._slots.release()
+
+
+_gates: dict[str, ModelGate] = {}
+_gates_lock = threading.Lock()
+
+
+def gate(model: str) -> ModelGate:
+    with _gates_lock:
+        current = _gates.get(model)
+        if current is None:
+            limit = _LIMITS.get(model, _LIMITS.get("default", 4))
+            current = _gates[model] = ModelGate(model, limit)
+        return current
+
+
+# --- coalescenza delle chiamate identiche ---
+
+class _Pending:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+_inflight: dict[str, _Pending] = {}
+_inflight_lock = threading.Lock()
+
+
+def _coalesce_key(model: str, messages: Any, stop: list, temperature: Optional[float]) -> str:
+    payload = json.dumps([model, messages, sorted(stop), temperature], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def coalesced(key: Optional[str], model: str, call: Callable[[], Any]) -> Any:
+    """Esegue `call`, o aspetta il risultato di quella già in corso con la stessa chiave."""
+    if key is None:
+        return call()
+    with _inflight_lock:
+        pending = _inflight.get(key)
+        leader = pending is None
+        if leader:
+            pending = _inflight[key] = _Pending()
+    if not leader:
+        telemetry.metrics.llm_gateway.inc(model=model, outcome="coalesced")
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+    try:
+        pending.result = call()
+        return pending.result
+    except BaseException as e:
+        pending.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        pending.done.set()
+
+
+# --- prompt e client ---
+
+def stable_prefix(messages: list[dict]) -> list[dict]:
+    """Messaggi di sistema in testa (uniti in uno), poi gli altri nell'ordine originale."""
+    system = [m for m in messages if m.get("role") == "system"]
+    if not system or (len(system) == 1 and messages[0] is system[0]):
+        return messages
+    merged = {"role": "system", "content": "\n\n".join(str(m.get("content") or "") for m in system)}
+    return [merged] + [m for m in messages if m.get("role") != "system"]
+
+
+def http_client():
+    """Client HTTP condiviso da tutte le chiamate ai modelli (connessioni keep-alive)."""
+    def factory():
+        import httpx
+        from litellm.llms.custom_httpx.http_handler import HTTPHandler
+        return HTTPHandler(timeout=httpx.Timeout(HTTP_TIMEOUT, connect=5.0), concurrent_limit=HTTP_POOL)
+
+    from weflai import registry
+    return registry.get_or_create("llm_http_client", factory)
+
+
+class GatewayLLM(LLM):
+    """LLM di crewAI con slot per modello, coalescenza e prefisso stabile (vedi modulo)."""
+
+    def _prepare_completion_params(self, messages, tools=None) -> dict[str, Any]:
+        params = super()._prepare_completion_params(messages, tools)
+        params["messages"] = stable_prefix(params["messages"])
+        if ollama_name(self.model):
+            params["client"] = http_client()
+            params["extra_body"] = {**params.get("extra_body", {}), "keep_alive": KEEP_ALIVE}
+        return params
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None,
+             from_agent=None):
+        def send():
+            with gate(self.model).slot():
+                return super(GatewayLLM, self).call(messages, tools, callbacks, available_functions,
+                                                    from_task, from_agent)
+
+        # Con function calling la chiamata esegue i tool: mai condividerla
+        key = None
+        if COALESCE and not tools and not available_functions:
+            key = _coalesce_key(self.model, messages, self.stop, self.temperature)
+        return coalesced(key, self.model, send)
+
+
+def create_llm(model: str, base_url: str, stream: bool = False) -> GatewayLLM:
+    return GatewayLLM(model=model, base_url=base_url, stream=stream)
+
+
+def embed(model: str, texts: list[str], api_base: str):
+    """litellm.embedding attraverso lo slot del modello di embedding."""
+    import litellm
+
+    extra = {"keep_alive": KEEP_ALIVE, "client": http_client()} if ollama_name(model) else {}
+    with gate(model).slot():
+        return litellm.embedding(model=model, input=texts, api_base=api_base, **extra)
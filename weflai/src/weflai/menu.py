@@ -0,0 +1,37 @@
+# weflai/menu.py
+"""Menu iniziale del sistema: volutamente senza dipendenze pesanti (crewAI, DB, LLM)."""
+from weflai.interaction import ask, say
+
+
+_CHOICES = {
+    "1": ("booking", "\n📝 Esempio: 'Volo Roma Milano domani mattina per Mario Rossi'"),
+    "2": ("cancellation", "\n🗑️  Esempio: 'Cancella la prenotazione di Mario Rossi per Milano'"),
+    "3": ("info", "\n💡 Esempio: 'Quanto pesa al massimo il bagaglio a mano?'"),
+    "4": ("status", "\n📋 Esempio: 'Stato della prenotazione 123' o 'Prenotazioni di Mario Rossi'"),
+}
+
+
+def read_user_intent() -> tuple[str, str]:
+    """
+    Mostra il menu e restituisce (intento, richiesta dell'utente).
+    Se invece di un numero l'utente scrive direttamente la richiesta,
+    l'intento è "auto": lo ricava il flow (weflai.intent).
+    """
+    say("\n" + "="*40)
+    say("✈️  WEFLAI SYSTEM v1.0 - DATABASE AGENT ✈️")
+    say("="*40)
+    say("1. Nuova Prenotazione")
+    say("2. Cancellazione Prenotazione")
+    say("3. Informazioni (voli, bagagli, regolamento)")
+    say("4. Stato Prenotazione")
+    say("5. Esci")
+    
+    choice = ask("\nSeleziona operazione (1-5) o scrivi direttamente la richiesta: ").strip()
+    
+    if choice in _CHOICES:
+        intent, example = _CHOICES[choice]
+        say(example)
+        return intent, ask("La tua richiesta: ")
+    if not choice or choice == "5":
+        return "exit", ""
+    return "auto", choice
@@ -126,4 +126,9 @@ class TicketOutput(BaseModel):
 class WeFlaiState(BaseModel):
     user_intent: str = ""
     user_query: str = ""
+    # Valorizzati quando l'intento è ricavato dal testo libero (weflai.intent)
+    intent_confidence: float = 0.0
+    intent_source: str = ""
+    # Sessione dell'utente (server: una per connessione): isola i checkpoint (weflai.checkpoints)
+    session_id: str = ""
     final_ticket: Optional[TicketOutput] = None
\ No newline at end of file
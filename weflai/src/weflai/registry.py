@@ -0,0 +1,95 @@
+# weflai/registry.py
+"""
+Registro dei componenti condivisi, creati pigramente al primo utilizzo.
+
+Engine DB, client LLM, catalogo dello schema, indice RAG, archivio dei
+checkpoint e archivio dei biglietti sono costosi da costruire e non servono
+all'avvio (menu): li crea la prima crew o il primo tool che li usa, e tutte
+le crew successive ricevono la stessa istanza.
+"""
+import os
+import threading
+from typing import Any, Callable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+DEFAULT_MODEL = os.getenv("WEFLAI_LLM_MODEL", "ollama/llama3.1:8b")
+
+_components: dict[str, Any] = {}
+_lock = threading.RLock()
+
+
+def get_or_create(name: str, factory: Callable[[], Any]) -> Any:
+    """Restituisce il componente `name`, creandolo con `factory` se manca."""
+    component = _components.get(name)
+    if component is None:
+        with _lock:
+            component = _components.get(name)
+            if component is None:
+                component = factory()
+                _components[name] = component
+    return component
+
+
+def reset(name: str | None = None) -> None:
+    """Dimentica un componente (o tutti): verrà ricreato al prossimo uso."""
+    with _lock:
+        if name is None:
+            _components.clear()
+        else:
+            _components.pop(name, None)
+
+
+def get_llm(model: str = DEFAULT_MODEL):
+    """
+    Client LLM condiviso per modello, attraverso il gateway (weflai.llm_gateway);
+    in streaming se WEFLAI_STREAM (weflai.streaming).
+    """
+    def factory():
+        from weflai import llm_gateway, streaming
+
+        if streaming.ENABLED:
+            streaming.install_stream_listener()
+        return llm_gateway.create_llm(model, OLLAMA_BASE_URL, stream=streaming.ENABLED)
+    return get_or_create(f"llm:{model}", factory)
+
+
+def get_engine():
+    """Engine SQLAlchemy con pool (weflai.tools.database)."""
+    from weflai.tools import database
+    return get_or_create("db_engine", database.get_engine)
+
+
+def get_schema_catalog():
+    """Catalogo dello schema DB (tabelle, colonne, indici, righe di esempio)."""
+    def factory():
+        from weflai.tools.schema_catalog import SchemaCatalog
+        return SchemaCatalog()
+    return get_or_create("schema_catalog", factory)
+
+
+def get_pdf_index():
+    """Indice persistente del regolamento PDF."""
+    def factory():
+        from weflai.tools.pdf_index import PDFIndex
+        return PDFIndex()
+    return get_or_create("pdf_index", factory)
+
+
+def get_checkpoints():
+    """Archivio SQLite dei checkpoint delle richieste (weflai.checkpoints)."""
+    def factory():
+        from weflai.checkpoints import CheckpointStore
+        return CheckpointStore()
+    return get_or_create("checkpoints", factory)
+
+
+def get_tickets():
+    """Archivio append-only dei biglietti emessi (weflai.ticket_store)."""
+    def factory():
+        from weflai.ticket_store import TicketStore
+        return TicketStore()
+    return get_or_create("tickets", factory)
@@ -0,0 +1,259 @@
+# weflai/routing.py
+"""
+Modello per task, con escalation.
+
+Non tutti i task hanno bisogno dell'8B: estrarre "CONFERMATO|X" e chiamare
+book_seat_tool, scegliere l'id da cancellare quando la richiesta lo
+identifica, formattare la conferma di una cancellazione. Ogni crew dichiara
+in config/routing.yaml, accanto a tasks_*.yaml, i livelli da provare per
+ogni task e il formato atteso dell'output:
+
+    insert_booking_task:
+      tiers: [rules, small, large]
+      rule: insert_booking
+      expect: '\\d+|ERRORE_VOLO_ESAURITO|ANNULLATO'
+
+- rules: una funzione Python (RULES), senza LLM; None se la richiesta non
+  basta a decidere
+- small: WEFLAI_LLM_SMALL_MODEL (default ollama/llama3.2:3b)
+- large: il modello di sempre (WEFLAI_LLM_MODEL)
+
+RoutedAgent prova i livelli in ordine e passa al successivo, con lo stesso
+contesto, se l'output non rispetta `expect` (regex sull'intero output). I
+task con human_input non salgono oltre il primo livello LLM: l'utente
+dovrebbe confermare di nuovo. Un task senza voce nel file usa il large.
+
+Politiche (WEFLAI_ROUTING, o use_policy() per il thread corrente):
+- tiered: i livelli di routing.yaml (default)
+- large: solo il modello grande, come prima del routing
+- small: modello piccolo per tutti i task, grande in escalation
+Confronto offline delle politiche: python -m benchmarks.routing_eval
+
+Metriche (weflai.telemetry): weflai_task_routing_total per task, livello ed
+esito (accepted, rejected, skipped); lo span del task riporta il livello
+che ha prodotto l'output e le escalation.
+"""
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional
+
+from crewai import Agent
+from pydantic import Field
+
+from weflai import telemetry
+from weflai.registry import DEFAULT_MODEL, get_llm
+
+logger = logging.getLogger(__name__)
+
+SMALL_MODEL = os.getenv("WEFLAI_LLM_SMALL_MODEL", "ollama/llama3.2:3b")
+POLICY = os.getenv("WEFLAI_ROUTING", "tiered")
+
+TIERS = ("rules", "small", "large")
+POLICIES = ("tiered", "large", "small")
+
+
+class Route(NamedTuple):
+    tiers: tuple[str, ...]
+    expect: str = ""
+    rule: str = ""
+
+
+# --- regole senza LLM: (query, contesto dei task precedenti) -> output o None ---
+
+RULES: dict[str, Callable[[str, str], Optional[str]]] = {}
+
+
+def rule(name: str):
+    def register(fn):
+        RULES[name] = fn
+        return fn
+    return register
+
+
+@rule("flight_search")
+def _flight_search(query: str, context: str) -> Optional[str]:
+    from weflai.tools import flight_search
+
+    flight_query, match = flight_search.search(query)
+    if flight_query is None:
+        return None
+    return str(match.id_volo) if match is not None else "ERRORE_VOLO_NON_TROVATO"
+
+
+@rule("insert_booking")
+def _insert_booking(query: str, context: str) -> Optional[str]:
+    from weflai.tools import flight_search, ticket_builder
+    from weflai.tools.db_tools import book_seat_tool
+
+    confirmed = re.search(r"CONFERMATO\W*(\d+)", context)
+    if confirmed is None:
+        return "ANNULLATO" if "ANNULLATO" in context else None
+    passenger = ticket_builder.parse_passenger(query)
+    mail = ticket_builder.parse_mail(query)
+    # "da Roma Milano" non è un passeggero
+    if passenger is None or mail is None or any(flight_search.resolve_place(part) for part in passenger):
+        return None
+    result = book_seat_tool.run(id_volo=int(confirmed.group(1)), nome_utente=passenger[0],
+                                cognome_utente=passenger[1], mail_utente=mail)
+    if result.startswith("ERRORE_VOLO_ESAURITO"):
+        return "ERRORE_VOLO_ESAURITO"
+    id_prenotazione = ticket_builder.parse_booking_id(result)
+    return str(id_prenotazione) if id_prenotazione is not None else None
+
+
+@rule("find_booking")
+def _find_booking(query: str, context: str) -> Optional[str]:
+    from weflai.tools import database, ticket_builder
+
+    lookup = ticket_builder.parse_lookup(query)
+    if lookup.id_prenotazione is not None:
+        return str(lookup.id_prenotazione)
+    if not (lookup.mail or lookup.nome):
+        return None
+    rows = database.find_ticket_rows(lookup.mail, lookup.nome, lookup.cognome, limit=2)
+    # Più prenotazioni: servono data o destinazione, decide l'agente
+    return str(rows[0].id_prenotazione) if len(rows) == 1 else None
+
+
+@rule("cancel_booking")
+def _cancel_booking(query: str, context: str) -> Optional[str]:
+    from weflai.tools.db_tools import cancel_booking_tool
+
+    received = context.strip().strip("`'\"")
+    if not received.isdigit():
+        return f"Nessuna cancellazione: {received}" if received else None
+    result = cancel_booking_tool.run(id_prenotazione=int(received))
+    if result.startswith("CANCELLATA|"):
+        _, booking, flight, passenger = result.split("|", 3)
+        return (f"Prenotazione {booking.split('=')[1]} di {passenger} "
+                f"(volo {flight.split('=')[1]}) cancellata.")
+    if result == "ERRORE_PRENOTAZIONE_NON_TROVATA":
+        return f"Prenotazione {received} non trovata: nessuna cancellazione."
+    return None
+
+
+# --- configurazione e politica ---
+
+@lru_cache(maxsize=None)
+def load(path: str | Path) -> dict[str, Route]:
+    """Rotte per task da un routing.yaml; ValueError se un livello o una regola non esiste."""
+    import yaml
+
+    with open(path, encoding="utf-8") as f:
+        spec = yaml.safe_load(f) or {}
+    routes = {}
+    for task_name, item in spec.items():
+        route = Route(tuple(item.get("tiers") or ("large",)), item.get("expect", ""), item.get("rule", ""))
+        unknown = [t for t in route.tiers if t not in TIERS]
+        if unknown or route.tiers[-1] == "rules":
+            raise ValueError(f"{path}: {task_name}: livelli {route.tiers} non validi "
+                             f"(ammessi {', '.join(TIERS)}, l'ultimo deve essere un modello)")
+        if "rules" in route.tiers and route.rule not in RULES:
+            raise ValueError(f"{path}: {task_name}: regola '{route.rule}' sconosciuta")
+        routes[task_name] = route
+    return routes
+
+
+_local = threading.local()
+
+
+def current_policy() -> str:
+    return getattr(_local, "policy", None) or POLICY
+
+
+@contextmanager
+def use_policy(policy: str):
+    """Politica di routing per il thread corrente (es. il confronto di benchmarks.routing_eval)."""
+    if policy not in POLICIES:
+        raise ValueError(f"politica '{policy}' sconosciuta: {', '.join(POLICIES)}")
+    previous = getattr(_local, "policy", None)
+    _local.policy = policy
+    try:
+        yield
+    finally:
+        _local.policy = previous
+
+
+def tiers_for(route: Optional[Route], policy: str) -> tuple[str, ...]:
+    if policy == "large":
+        return ("large",)
+    if policy == "small":
+        return ("small", "large")
+    return route.tiers if route is not None else ("large",)
+
+
+def model_for(tier: str) -> str:
+    return SMALL_MODEL if tier == "small" else DEFAULT_MODEL
+
+
+@lru_cache(maxsize=None)
+def _pattern(expect: str) -> re.Pattern:
+    return re.compile(expect, re.DOTALL)
+
+
+def accepts(route: Optional[Route], output: str) -> bool:
+    if route is None or not route.expect:
+        return True
+    return _pattern(route.expect).fullmatch(output.strip().strip("`'\"").strip()) is not None
+
+
+def models_in_use(policy: Optional[str] = None) -> list[str]:
+    """Modelli che la politica può chiamare (per weflai.warmup)."""
+    policy = policy or current_policy()
+    if policy == "large":
+        return [DEFAULT_MODEL]
+    if policy == "small":
+        return [SMALL_MODEL, DEFAULT_MODEL]
+    crews = Path(__file__).parent / "crews"
+    tiers = {tier for path in crews.glob("*/config/routing.yaml") for route in load(path).values()
+             for tier in route.tiers}
+    return [model_for(tier) for tier in ("small", "large") if tier in tiers or tier == "large"]
+
+
+def _record(task_name: str, tier: str, outcome: str) -> None:
+    telemetry.metrics.task_routing.inc(task=task_name, tier=tier, outcome=outcome)
+
+
+class RoutedAgent(Agent):
+    """Agent che esegue ogni task con il livello previsto dalla rotta, salendo se l'output non è valido."""
+
+    routes: dict[str, Any] = Field(default_factory=dict, exclude=True,
+                                   description="Rotte per nome del task (routing.yaml della crew)")
+
+    def execute_task(self, task, context: Optional[str] = None, tools: Optional[list] = None) -> str:
+        route = self.routes.get(task.name)
+        tiers = tiers_for(route, current_policy())
+        query = (getattr(self.crew, "_inputs", None) or {}).get("query", "")
+        escalations = 0
+        result = ""
+        for n, tier in enumerate(tiers):
+            if tier == "rules":
+                try:
+                    result = RULES[route.rule](query, context or "")
+                except Exception as e:
+                    logger.warning(f"Regola {route.rule} fallita per {task.name}, passo al modello: {e}")
+                    result = None
+                if result is None:
+                    _record(task.name, tier, "skipped")
+                    continue
+            else:
+                self.llm = get_llm(model_for(tier))
+                result = super().execute_task(task, context, tools)
+            last = n == len(tiers) - 1 or (task.human_input and tier != "rules")
+            valid = accepts(route, result)
+            _record(task.name, tier, "accepted" if valid else "rejected")
+            if valid or last:
+                span = telemetry.current_span()
+                if span is not None and span.stage == "task":
+                    span.attributes.update({"routing.tier": tier, "routing.escalations": escalations})
+                if not valid:
+                    logger.warning(f"{task.name}: output non conforme anche con {tier}: {result!r}")
+                return result
+            escalations += 1
+            logger.info(f"{task.name}: output di {tier} non conforme ({result!r}), passo a {tiers[n + 1]}")
+        return result
@@ -0,0 +1,147 @@
+# weflai/server.py
+"""
+Server asyncio multi-sessione per WeFlaiFlow.
+
+Protocollo a righe su TCP (utilizzabile anche con `nc localhost 8765`):
+- client -> server: una riga di testo, oppure JSON {"text": "..."}
+- server -> client: JSON per riga, {"type": "say", "text": ...},
+  {"type": "chunk", "text": ...} (risposta in streaming, chiusa da
+  {"type": "chunk_end"}), {"type": "ask", "prompt": ...} oppure {"type": "end"}
+
+Ogni connessione è una sessione con il proprio WeFlaiFlow (e quindi il proprio
+WeFlaiState). Il flow, con le sue chiamate bloccanti a DB e LLM, gira in un
+ThreadPoolExecutor limitato e arriva alla sessione come generatore asincrono
+di eventi (weflai.interaction.flow_events): i prompt (menu, richiesta,
+conferma umana dei task crewAI) attendono la riga successiva del client, i
+token delle risposte vengono inoltrati appena generati.
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from weflai import telemetry, warmup
+from weflai.interaction import flow_events, install_human_input_hook
+from weflai.flow import WeFlaiFlow
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = os.getenv("WEFLAI_SERVER_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.getenv("WEFLAI_SERVER_PORT", "8765"))
+DEFAULT_MAX_SESSIONS = int(os.getenv("WEFLAI_MAX_SESSIONS", "32"))
+# Secondi di attesa di una risposta dell'utente prima di chiudere la sessione
+IDLE_TIMEOUT = float(os.getenv("WEFLAI_SESSION_IDLE_TIMEOUT", "600"))
+
+
+class Session:
+    """Una connessione: righe del client in coda, eventi del flow scritti come JSON."""
+
+    def __init__(self, session_id: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.session_id = session_id
+        # Identità stabile della connessione (gli id numerici ripartono a ogni avvio del server)
+        self.key = f"server:{uuid.uuid4().hex}"
+        self.reader = reader
+        self.writer = writer
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.closed = False
+
+    async def write(self, message: dict) -> None:
+        if not self.writer.is_closing():
+            self.writer.write((json.dumps(message, ensure_ascii=False) + "\n").encode())
+            await self.writer.drain()
+
+    async def read_loop(self) -> None:
+        """Legge le righe del client e le accoda; None segnala la disconnessione."""
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                text = line.decode(errors="replace").rstrip("\r\n")
+                try:
+                    payload = json.loads(text)
+                    if isinstance(payload, dict):
+                        text = str(payload.get("text", ""))
+                except ValueError:
+                    pass
+                await self.inbox.put(text)
+        finally:
+            self.closed = True
+            await self.inbox.put(None)
+
+
+class SessionServer:
+    """Accetta connessioni ed esegue un WeFlaiFlow per sessione nell'executor."""
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 max_sessions: int = DEFAULT_MAX_SESSIONS):
+        self.host = host
+        self.port = port
+        self.max_sessions = max_sessions
+        self.executor = ThreadPoolExecutor(max_workers=max_sessions, thread_name_prefix="weflai-session")
+        self.active = 0
+        self._ids = itertools.count(1)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = Session(next(self._ids), reader, writer)
+        reader_task = asyncio.create_task(session.read_loop())
+        self.active += 1
+        logger.info(f"Sessione {session.session_id} aperta ({self.active} attive)")
+        try:
+            if self.active > self.max_sessions:
+                await session.write({"type": "say", "text": "⏳ Tutti gli operatori sono occupati, la sessione partirà a breve..."})
+            while not session.closed:
+                flow = WeFlaiFlow()
+                async for event in flow_events(flow, session.inbox, self.executor, inputs={"session_id": session.key},
+                                               reply_timeout=IDLE_TIMEOUT):
+                    await session.write(event)
+                if flow.state.user_intent in ("exit", ""):
+                    break
+        except Exception as e:
+            logger.error(f"Sessione {session.session_id} terminata con errore: {e}")
+        finally:
+            self.active -= 1
+            with contextlib.suppress(ConnectionError):
+                await session.write({"type": "end"})
+            reader_task.cancel()
+            writer.close()
+            logger.info(f"Sessione {session.session_id} chiusa ({self.active} attive)")
+
+    async def serve_forever(self) -> None:
+        install_human_input_hook()
+        # Modelli Ollama sempre caricati e crew pronte prima della prima sessione
+        warmup.prewarm(keepalive=True)
+        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        logger.info(f"✈️  WeFlai server in ascolto su {self.host}:{self.port} (max {self.max_sessions} sessioni)")
+        async with server:
+            await server.serve_forever()
+
+
+def run():
+    """Entry point del server multi-sessione."""
+    parser = argparse.ArgumentParser(description="WeFlai session server")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS)
+    parser.add_argument("--metrics-port", type=int, default=telemetry.METRICS_PORT,
+                        help="porta dell'endpoint Prometheus /metrics (0 = disattivato)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    telemetry.start_metrics_server(args.metrics_port)
+    server = SessionServer(args.host, args.port, args.max_sessions)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,134 @@
+# weflai/streaming.py
+"""
+Risposte degli agenti in streaming verso l'utente.
+
+Con WEFLAI_STREAM attivo (default) i client LLM del registro chiedono a
+Ollama lo streaming e crewAI emette un LLMStreamChunkEvent per chunk, nel
+thread della crew. Qui i chunk dei task rivolti all'utente
+(WEFLAI_STREAM_TASKS, default conferma del volo e risposta di InfoCrew)
+passano dal canale del thread (weflai.interaction.stream): del testo ReAct
+si mostra solo quanto segue "Final Answer:", mai pensieri e chiamate ai tool.
+
+Chi poi riceve la stessa risposta per intero (il flow, il prompt di conferma
+human_input) usa take_shown() per non ripeterla.
+
+Metrica: span "ttfb" (weflai.telemetry) dall'ultimo messaggio dell'utente al
+primo testo visibile della risposta; senza streaming il testo diventa
+visibile solo a risposta completa.
+"""
+import logging
+import os
+import threading
+from typing import Optional
+
+from weflai import interaction, telemetry
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("WEFLAI_STREAM", "1") not in ("0", "false", "False")
+STREAM_TASKS = {
+    name.strip()
+    for name in os.getenv("WEFLAI_STREAM_TASKS", "confirm_selection_task,answer_info_task").split(",")
+    if name.strip()
+}
+
+_MARKER = "Final Answer:"
+
+_local = threading.local()
+_listener_installed = False
+_listener_lock = threading.Lock()
+
+
+class AnswerFilter:
+    """Testo di una chiamata LLM: restituisce solo la parte nuova della risposta finale."""
+
+    def __init__(self, task_name: str):
+        self.task_name = task_name
+        self.buffer = ""
+        self.shown = ""
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        start = self.buffer.find(_MARKER)
+        if start < 0:
+            return ""
+        answer = self.buffer[start + len(_MARKER):].lstrip()
+        delta = answer[len(self.shown):]
+        self.shown = answer
+        return delta
+
+
+def _squash(text: str) -> str:
+    return " ".join(text.split())
+
+
+def take_shown(text: str) -> bool:
+    """True se `text` è la risposta appena mostrata in streaming su questo thread (una sola volta)."""
+    shown = getattr(_local, "shown", None)
+    _local.shown = None
+    return shown is not None and _squash(shown) == _squash(text)
+
+
+def _filters() -> dict:
+    filters = getattr(_local, "filters", None)
+    if filters is None:
+        filters = _local.filters = {}
+    return filters
+
+
+def _first_byte(task_name: str, streamed: bool) -> None:
+    # Un solo ttfb per turno utente
+    turn = interaction.turn_started_ns()
+    if turn is None or getattr(_local, "ttfb_turn", None) == turn:
+        return
+    _local.ttfb_turn = turn
+    telemetry.record_ttfb(task_name, turn, streamed=streamed)
+
+
+def install_stream_listener() -> None:
+    """Registra gli handler sull'event bus di crewAI (idempotente)."""
+    global _listener_installed
+    with _listener_lock:
+        if _listener_installed:
+            return
+        _listener_installed = True
+    from crewai.events.event_bus import crewai_event_bus
+    from crewai.events.types.llm_events import (
+        LLMCallCompletedEvent, LLMCallFailedEvent, LLMCallStartedEvent, LLMStreamChunkEvent,
+    )
+
+    on = crewai_event_bus.on
+
+    # Gli handler girano nel thread che chiama l'LLM: stato e canale sono quelli della sessione
+    @on(LLMCallStartedEvent)
+    def _started(source, event):
+        if event.task_name in STREAM_TASKS:
+            _filters()[id(source)] = AnswerFilter(event.task_name)
+
+    @on(LLMStreamChunkEvent)
+    def _chunk(source, event):
+        answer = _filters().get(id(source))
+        if answer is None or event.tool_call or not interaction.can_stream():
+            return
+        delta = answer.feed(event.chunk or "")
+        if delta:
+            _first_byte(answer.task_name, streamed=True)
+            interaction.stream(delta)
+
+    @on(LLMCallCompletedEvent)
+    def _completed(source, event):
+        answer: Optional[AnswerFilter] = _filters().pop(id(source), None)
+        if answer is None:
+            return
+        if answer.shown:
+            interaction.stream_end()
+            _local.shown = answer.shown
+        elif _MARKER in str(event.response):
+            # Nessun chunk (streaming disattivato o non supportato): visibile solo ora
+            _first_byte(answer.task_name, streamed=False)
+
+    @on(LLMCallFailedEvent)
+    def _failed(source, event):
+        answer = _filters().pop(id(source), None)
+        if answer is not None and answer.shown:
+            interaction.stream_end()
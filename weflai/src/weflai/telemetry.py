@@ -0,0 +1,635 @@
+# weflai/telemetry.py
+"""
+Tracing e metriche di latenza end-to-end.
+
+Ogni fase registra uno span (stage: flow, step, build, crew, task, tool, llm, queue, db, ttfb):
+- step del WeFlaiFlow, kickoff delle crew, task, tool e chiamate LLM arrivano
+  dall'event bus di crewAI (install_crewai_listener)
+- le query su Postgres da weflai.tools.database (span espliciti)
+- la costruzione/consegna delle crew da weflai.crew_pool (stage build)
+- il time-to-first-byte percepito dall'utente da weflai.streaming (stage ttfb)
+- l'attesa di uno slot del gateway LLM da weflai.llm_gateway (stage queue)
+
+Gli span chiusi finiscono:
+- in un file JSONL (WEFLAI_TRACE_FILE, default traces/spans.jsonl) con i campi
+  di uno span OTLP/JSON: traceId, spanId, parentSpanId, name,
+  startTimeUnixNano, endTimeUnixNano, attributes, status. Il file ruota a
+  WEFLAI_TRACE_MAX_MB (default 64) e se ne tengono WEFLAI_TRACE_BACKUPS
+  (default 3: spans.jsonl.1 ... .3), quindi al massimo ~256 MB su disco;
+  WEFLAI_TRACE_FILE="" scrive solo le metriche
+- in contatori e istogrammi in formato Prometheus, esposti su
+  http://<host>:<WEFLAI_METRICS_PORT>/metrics (serve --metrics-port)
+
+Le chiamate LLM riportano token di prompt/completamento, time-to-first-token
+(primo chunk in streaming, altrimenti la risposta intera) e durata totale;
+execute_sql_tool la dimensione stimata in token del risultato passato al
+prompt, e quella che avrebbe avuto come str() delle righe, e se è arrivato
+dalla cache delle query (weflai.tools.sql_cache).
+
+Report p50/p95 per fase:  trace_report [traces/spans.jsonl] [--last 1]
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("WEFLAI_TRACING", "1") not in ("0", "false", "False")
+TRACE_FILE = os.getenv("WEFLAI_TRACE_FILE", "traces/spans.jsonl")
+TRACE_MAX_BYTES = int(float(os.getenv("WEFLAI_TRACE_MAX_MB", "64")) * 1024 * 1024)
+TRACE_BACKUPS = int(os.getenv("WEFLAI_TRACE_BACKUPS", "3"))
+METRICS_PORT = int(os.getenv("WEFLAI_METRICS_PORT", "0"))
+
+# Bucket (secondi) degli istogrammi: dalle query DB alle crew da minuti
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300)
+
+
+class Span:
+    __slots__ = ("name", "stage", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "error", "_token")
+
+    def __init__(self, name: str, stage: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.stage = stage
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self._token: Optional[Token] = None
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> dict:
+        record = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": {"weflai.stage": self.stage, **self.attributes},
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+        if self.parent_id:
+            record["parentSpanId"] = self.parent_id
+        return record
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("weflai_span", default=None)
+
+
+# --- metriche Prometheus ---
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: str = "") -> str:
+    parts = [k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ") + '"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+# Le metriche si aggiornano da più thread (tool, gateway LLM, cache SQL): ognuna ha il suo lock
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self.values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(k)} {v:g}" for k, v in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        # per serie: conteggi per bucket (non cumulativi, +Inf in coda), somma, numero
+        self.series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self.series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self.values[_label_key(labels)] = value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self.values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        lines += [f"{self.name}{_format_labels(k)} {v:g}" for k, v in values]
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = Histogram("weflai_stage_duration_seconds", "Durata degli span per fase e nome")
+        self.spans = Counter("weflai_spans_total", "Span chiusi per fase, nome ed esito")
+        self.llm_tokens = Counter("weflai_llm_tokens_total", "Token LLM per modello e tipo")
+        self.llm_ttft = Histogram("weflai_llm_time_to_first_token_seconds", "Time-to-first-token delle chiamate LLM")
+        self.ttfb = Histogram("weflai_time_to_first_byte_seconds",
+                              "Dall'ultimo messaggio dell'utente al primo testo visibile della risposta")
+        self.tool_result_tokens = Counter("weflai_tool_result_tokens_total",
+                                          "Token stimati dei risultati dei tool (compatti e come str() grezzo)")
+        self.llm_queue_wait = Histogram("weflai_llm_queue_wait_seconds",
+                                        "Attesa di uno slot del gateway LLM prima della chiamata")
+        self.llm_queue_depth = Gauge("weflai_llm_queue_depth", "Chiamate LLM in coda nel gateway per modello")
+        self.llm_in_flight = Gauge("weflai_llm_in_flight", "Chiamate LLM in corso verso il server per modello")
+        self.llm_gateway = Counter("weflai_llm_gateway_calls_total",
+                                   "Chiamate al gateway LLM per modello ed esito (sent, coalesced, rejected)")
+        self.sql_cache = Counter("weflai_sql_cache_total",
+                                 "Letture di execute_sql_tool per livello di cache ed esito (hit, miss, invalidated)")
+        self.task_routing = Counter("weflai_task_routing_total",
+                                    "Tentativi dei task per livello di routing ed esito (accepted, rejected, skipped)")
+
+    def record(self, span: Span) -> None:
+        status = "error" if span.error else "ok"
+        with self._lock:
+            self.stage_seconds.observe(span.duration, stage=span.stage, name=span.name)
+            self.spans.inc(stage=span.stage, name=span.name, status=status)
+            if span.stage == "llm":
+                model = span.attributes.get("llm.model", "")
+                for kind in ("prompt", "completion"):
+                    tokens = span.attributes.get(f"llm.{kind}_tokens")
+                    if tokens:
+                        self.llm_tokens.inc(tokens, model=model, kind=kind)
+                if "llm.ttft_s" in span.attributes:
+                    self.llm_ttft.observe(span.attributes["llm.ttft_s"], model=model)
+            elif span.stage == "ttfb":
+                self.ttfb.observe(span.duration, name=span.name,
+                                  streamed=str(span.attributes.get("ttfb.streamed", False)).lower())
+            elif span.stage == "queue":
+                self.llm_queue_wait.observe(span.duration, model=span.attributes.get("llm.model", ""))
+            elif span.stage == "tool":
+                for kind in ("result", "raw"):
+                    tokens = span.attributes.get(f"tool.{kind}_tokens")
+                    if tokens is not None:
+                        self.tool_result_tokens.inc(tokens, name=span.name, kind=kind)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = []
+            for metric in (self.stage_seconds, self.spans, self.llm_tokens, self.llm_ttft, self.ttfb,
+                           self.tool_result_tokens, self.llm_queue_wait, self.llm_queue_depth,
+                           self.llm_in_flight, self.llm_gateway, self.sql_cache, self.task_routing):
+                lines += metric.render()
+            return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# --- sink JSONL ---
+
+class JsonlSink:
+    """Append-only, una riga per span; flush a blocchi e all'uscita, rotazione oltre max_bytes."""
+
+    def __init__(self, path: str, flush_every: int = 32, max_bytes: int = TRACE_MAX_BYTES,
+                 backups: int = TRACE_BACKUPS):
+        self.path = path
+        self.flush_every = flush_every
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._file = None
+        self._pending = 0
+        self._size = 0
+
+    def _rotate(self) -> None:
+        # spans.jsonl -> spans.jsonl.1 -> ... -> spans.jsonl.<backups>, il più vecchio si perde
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self, span: Span) -> None:
+        if not self.path:
+            return
+        line = json.dumps(span.to_otlp(), ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+                self._size = self._file.tell()
+            self._file.write(line)
+            self._size += len(line.encode("utf-8"))
+            self._pending += 1
+            # Gli span radice chiudono una richiesta: si scrivono subito
+            if self._pending >= self.flush_every or span.parent_id is None:
+                self._file.flush()
+                self._pending = 0
+            if self.max_bytes and self._size >= self.max_bytes:
+                self._rotate()
+                self._pending = 0
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._pending = 0
+
+
+sink = JsonlSink(TRACE_FILE)
+atexit.register(sink.flush)
+
+
+# --- API span ---
+
+def start_span(name: str, stage: str, **attributes) -> Span:
+    span = Span(name, stage, _current.get(), attributes)
+    span._token = _current.set(span)
+    return span
+
+
+def end_span(span: Span, error: Optional[BaseException | str] = None, **attributes) -> None:
+    if span.end_ns is not None:
+        return
+    span.end_ns = time.time_ns()
+    span.attributes.update(attributes)
+    if error is not None:
+        span.error = str(error)
+    if span._token is not None:
+        try:
+            _current.reset(span._token)
+        except ValueError:
+            # Span chiuso in un contesto diverso da quello di apertura
+            pass
+    if ENABLED:
+        metrics.record(span)
+        try:
+            sink.write(span)
+        except OSError as e:
+            logger.warning(f"Scrittura span non riuscita: {e}")
+
+
+@contextmanager
+def span(name: str, stage: str, **attributes):
+    current = start_span(name, stage, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        end_span(current, error=e)
+        raise
+    end_span(current)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def record_ttfb(name: str, started_ns: int, streamed: bool) -> None:
+    """Span ttfb già concluso: da `started_ns` (messaggio dell'utente) a ora."""
+    ttfb = start_span(name, "ttfb", **{"ttfb.streamed": streamed})
+    ttfb.start_ns = started_ns
+    end_span(ttfb)
+
+
+# --- event bus di crewAI ---
+
+_open: dict[tuple, Span] = {}
+_tokens_before: dict[tuple, tuple[int, int]] = {}
+_open_lock = threading.Lock()
+_listener_installed = False
+
+
+def _open_span(key: tuple, name: str, stage: str, **attributes) -> None:
+    new_span = start_span(name, stage, **attributes)
+    with _open_lock:
+        _open[key] = new_span
+
+
+def _close_span(key: tuple, error: Any = None, **attributes) -> Optional[Span]:
+    with _open_lock:
+        closed = _open.pop(key, None)
+    if closed is not None:
+        end_span(closed, error=error, **attributes)
+    return closed
+
+
+def _token_snapshot(agent) -> Optional[tuple[int, int]]:
+    process = getattr(agent, "_token_process", None)
+    if process is None:
+        return None
+    usage = process.get_summary()
+    return usage.prompt_tokens, usage.completion_tokens
+
+
+def install_crewai_listener() -> None:
+    """Registra gli handler sull'event bus di crewAI (idempotente)."""
+    global _listener_installed
+    if _listener_installed or not ENABLED:
+        return
+    from crewai.events.event_bus import crewai_event_bus
+    from crewai.events.types.crew_events import (
+        CrewKickoffCompletedEvent, CrewKickoffFailedEvent, CrewKickoffStartedEvent,
+    )
+    from crewai.events.types.flow_events import (
+        FlowFinishedEvent, FlowStartedEvent, MethodExecutionFailedEvent,
+        MethodExecutionFinishedEvent, MethodExecutionStartedEvent,
+    )
+    from crewai.events.types.llm_events import (
+        LLMCallCompletedEvent, LLMCallFailedEvent, LLMCallStartedEvent, LLMStreamChunkEvent,
+    )
+    from crewai.events.types.task_events import TaskCompletedEvent, TaskFailedEvent, TaskStartedEvent
+    from crewai.events.types.tool_usage_events import (
+        ToolUsageErrorEvent, ToolUsageFinishedEvent, ToolUsageStartedEvent,
+    )
+
+    on = crewai_event_bus.on
+
+    # Flow e step
+    @on(FlowStartedEvent)
+    def _flow_started(source, event):
+        _open_span(("flow", id(source)), event.flow_name, "flow")
+
+    @on(FlowFinishedEvent)
+    def _flow_finished(source, event):
+        _close_span(("flow", id(source)))
+
+    @on(MethodExecutionStartedEvent)
+    def _step_started(source, event):
+        _open_span(("step", id(source), event.method_name), event.method_name, "step", flow=event.flow_name)
+
+    @on(MethodExecutionFinishedEvent)
+    def _step_finished(source, event):
+        _close_span(("step", id(source), event.method_name))
+
+    @on(MethodExecutionFailedEvent)
+    def _step_failed(source, event):
+        _close_span(("step", id(source), event.method_name), error=event.error)
+
+    # Crew
+    @on(CrewKickoffStartedEvent)
+    def _crew_started(source, event):
+        _open_span(("crew", id(source)), event.crew_name or type(source).__name__, "crew")
+
+    @on(CrewKickoffCompletedEvent)
+    def _crew_completed(source, event):
+        _close_span(("crew", id(source)), **{"crew.total_tokens": event.total_tokens})
+
+    @on(CrewKickoffFailedEvent)
+    def _crew_failed(source, event):
+        _close_span(("crew", id(source)), error=event.error)
+
+    # Task
+    @on(TaskStartedEvent)
+    def _task_started(source, event):
+        task = event.task or source
+        _open_span(("task", id(task)), getattr(task, "name", None) or "task", "task",
+                   agent=str(getattr(task.agent, "role", "")).strip())
+
+    @on(TaskCompletedEvent)
+    def _task_completed(source, event):
+        _close_span(("task", id(event.task or source)))
+
+    @on(TaskFailedEvent)
+    def _task_failed(source, event):
+        _close_span(("task", id(event.task or source)), error=event.error)
+
+    # Tool
+    def _tool_key(event) -> tuple:
+        return ("tool", threading.get_ident(), event.agent_key or event.agent_role, event.tool_name)
+
+    @on(ToolUsageStartedEvent)
+    def _tool_started(source, event):
+        _open_span(_tool_key(event), event.tool_name, "tool", attempt=event.run_attempts or 1)
+
+    @on(ToolUsageFinishedEvent)
+    def _tool_finished(source, event):
+        _close_span(_tool_key(event), **{"tool.from_cache": bool(event.from_cache)})
+
+    @on(ToolUsageErrorEvent)
+    def _tool_error(source, event):
+        _close_span(_tool_key(event), error=event.error)
+
+    # LLM: la chiave include il thread perché il client LLM è condiviso tra le sessioni
+    def _llm_key(source) -> tuple:
+        return ("llm", id(source), threading.get_ident())
+
+    @on(LLMCallStartedEvent)
+    def _llm_started(source, event):
+        model = event.model or getattr(source, "model", "")
+        _open_span(_llm_key(source), model, "llm", **{"llm.model": model})
+        tokens = _token_snapshot(event.from_agent)
+        if tokens is not None:
+            with _open_lock:
+                _tokens_before[_llm_key(source)] = tokens
+
+    @on(LLMStreamChunkEvent)
+    def _llm_chunk(source, event):
+        with _open_lock:
+            current = _open.get(_llm_key(source))
+        if current is not None and "llm.ttft_s" not in current.attributes:
+            current.attributes["llm.ttft_s"] = current.duration
+
+    @on(LLMCallCompletedEvent)
+    def _llm_completed(source, event):
+        with _open_lock:
+            current = _open.get(_llm_key(source))
+        if current is None:
+            return
+        attributes = {}
+        with _open_lock:
+            before = _tokens_before.pop(_llm_key(source), None)
+        after = _token_snapshot(event.from_agent)
+        if before is not None and after is not None:
+            attributes["llm.prompt_tokens"] = after[0] - before[0]
+            attributes["llm.completion_tokens"] = after[1] - before[1]
+        if "llm.ttft_s" not in current.attributes:
+            # Senza streaming il primo token arriva con la risposta completa
+            attributes["llm.ttft_s"] = current.duration
+        _close_span(_llm_key(source), **attributes)
+
+    @on(LLMCallFailedEvent)
+    def _llm_failed(source, event):
+        with _open_lock:
+            _tokens_before.pop(_llm_key(source), None)
+        _close_span(_llm_key(source), error=event.error)
+
+    _listener_installed = True
+
+
+# --- endpoint Prometheus ---
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0") -> Optional[threading.Thread]:
+    """Serve /metrics in un thread daemon; port 0 = disattivato."""
+    if not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name="weflai-metrics", daemon=True)
+    thread.start()
+    logger.info(f"📈 Metriche Prometheus su http://{host}:{port}/metrics")
+    return thread
+
+
+# --- report ---
+
+def percentile(values: list[float], q: float) -> float:
+    """Percentile con interpolazione lineare su valori ordinati."""
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def load_spans(path: str, last: int = 0) -> list[dict]:
+    """Span del file; con last > 0 solo quelli delle ultime `last` tracce."""
+    with open(path, encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    if last > 0:
+        traces: list[str] = []
+        for record in spans:
+            if record["traceId"] not in traces:
+                traces.append(record["traceId"])
+        keep = set(traces[-last:])
+        spans = [s for s in spans if s["traceId"] in keep]
+    return spans
+
+
+def build_report(spans: list[dict]) -> str:
+    groups: dict[tuple[str, str], list[float]] = {}
+    errors: dict[tuple[str, str], int] = {}
+    tokens: dict[str, list[int]] = {}
+    ttft: dict[str, list[float]] = {}
+    tool_tokens: dict[str, list[int]] = {}
+    for record in spans:
+        attributes = record.get("attributes", {})
+        key = (attributes.get("weflai.stage", "?"), record["name"])
+        duration = (record["endTimeUnixNano"] - record["startTimeUnixNano"]) / 1e9
+        groups.setdefault(key, []).append(duration)
+        if record.get("status", {}).get("code") == "ERROR":
+            errors[key] = errors.get(key, 0) + 1
+        if key[0] == "llm":
+            totals = tokens.setdefault(record["name"], [0, 0])
+            totals[0] += attributes.get("llm.prompt_tokens") or 0
+            totals[1] += attributes.get("llm.completion_tokens") or 0
+            if "llm.ttft_s" in attributes:
+                ttft.setdefault(record["name"], []).append(attributes["llm.ttft_s"])
+        elif key[0] == "tool" and "tool.result_tokens" in attributes:
+            totals = tool_tokens.setdefault(record["name"], [0, 0, 0])
+            totals[0] += 1
+            totals[1] += attributes["tool.result_tokens"]
+            totals[2] += attributes.get("tool.raw_tokens", attributes["tool.result_tokens"])
+
+    header = f"{'fase':<6} {'nome':<36} {'n':>5} {'err':>4} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'tot s':>9}"
+    lines = [header, "-" * len(header)]
+    stage_order = ["flow", "ttfb", "step", "crew", "task", "llm", "tool", "db"]
+    for key in sorted(groups, key=lambda k: (stage_order.index(k[0]) if k[0] in stage_order else 99, -sum(groups[k]))):
+        values = sorted(groups[key])
+        lines.append(
+            f"{key[0]:<6} {key[1][:36]:<36} {len(values):>5} {errors.get(key, 0):>4} "
+            f"{percentile(values, 0.5):>8.3f} {percentile(values, 0.95):>8.3f} {values[-1]:>8.3f} {sum(values):>9.2f}"
+        )
+    for model, (prompt, completion) in tokens.items():
+        values = sorted(ttft.get(model, []))
+        lines.append(
+            f"\nLLM {model}: token prompt {prompt}, completamento {completion}; "
+            f"TTFT p50 {percentile(values, 0.5):.3f}s p95 {percentile(values, 0.95):.3f}s"
+        )
+    for tool, (calls, result, raw) in tool_tokens.items():
+        saved = 1 - result / raw if raw else 0.0
+        lines.append(f"Tool {tool}: {calls} risultati, token stimati {result / calls:.0f}/chiamata "
+                     f"(str() grezzo {raw / calls:.0f}, -{saved:.0%})")
+    return "\n".join(lines)
+
+
+def report():
+    """Entry point: p50/p95 per fase da un file di span."""
+    parser = argparse.ArgumentParser(description="Report di latenza per fase dagli span WeFlai")
+    parser.add_argument("file", nargs="?", default=TRACE_FILE)
+    parser.add_argument("--last", type=int, default=0, help="solo le ultime N tracce (richieste)")
+    args = parser.parse_args()
+    spans = load_spans(args.file, args.last)
+    if not spans:
+        print("Nessuno span.")
+        return
+    print(f"{len(spans)} span, {len({s['traceId'] for s in spans})} tracce da {args.file}\n")
+    print(build_report(spans))
+
+
+if __name__ == "__main__":
+    report()
@@ -0,0 +1,432 @@
+# weflai/ticket_store.py
+"""
+Archivio dei biglietti emessi: log append-only a segmenti con indice su disco.
+
+Il flow scriveva ogni biglietto in ticket_finale.json nella cartella di
+lavoro: con più prenotazioni in parallelo un biglietto sovrascriveva l'altro,
+e per ritrovare un biglietto passato serviva il DB. Qui ogni TicketOutput
+emesso (flow e batch_book) si aggiunge in coda a un log JSONL:
+
+- segmenti tickets/segment-000001.jsonl, ...: si passa al successivo oltre
+  WEFLAI_TICKET_SEGMENT_MB (default 64); un segmento chiuso non cambia più
+- group commit: un thread scrive con un solo fsync tutti i record accodati
+  mentre era occupato con il gruppo precedente (al massimo BATCH), più
+  quelli arrivati entro WEFLAI_TICKET_COMMIT_MS ms (default 0: nessuna
+  attesa); append() ritorna quando il biglietto è su disco (al massimo
+  WEFLAI_TICKET_WAIT_S secondi, default 30); un gruppo non scritto si
+  scarta dal log e il writer prosegue con il successivo
+- indice SQLite (tickets/index.sqlite) con segmento, offset e lunghezza di
+  ogni record per id_prenotazione, passeggero, volo e data del volo: una
+  ricerca è una query sull'indice più una pread
+- il log fa fede: all'apertura, e dopo un errore dell'indice, si indicizzano
+  i record scritti dopo l'ultimo indicizzato e si scarta una riga finale
+  incompleta; `tickets --reindex` ricostruisce l'indice da zero
+
+Un biglietto ristampato si aggiunge di nuovo: le ricerche restituiscono
+l'ultima versione per id_prenotazione. Un solo processo alla volta scrive
+nella stessa cartella (WEFLAI_TICKET_DIR, default tickets).
+
+Uso: tickets [ID ...] [--passeggero "Mario Rossi"] [--volo 12] [--dal 2026-03-01 --al 2026-03-31]
+             [--export] [--reindex]
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+from weflai.models import TicketOutput
+
+logger = logging.getLogger(__name__)
+
+TICKET_DIR = os.getenv("WEFLAI_TICKET_DIR", "tickets")
+SEGMENT_BYTES = int(float(os.getenv("WEFLAI_TICKET_SEGMENT_MB", "64")) * 1024 * 1024)
+COMMIT_MS = float(os.getenv("WEFLAI_TICKET_COMMIT_MS", "0"))
+# Attesa massima della conferma di scrittura in append() e flush()
+WAIT_S = float(os.getenv("WEFLAI_TICKET_WAIT_S", "30"))
+BATCH = 256
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+  seq             INTEGER PRIMARY KEY,
+  id_prenotazione TEXT NOT NULL,
+  id_volo         INTEGER NOT NULL,
+  passeggero      TEXT NOT NULL,
+  data            TEXT NOT NULL,
+  issued          REAL NOT NULL,
+  segment         INTEGER NOT NULL,
+  offset          INTEGER NOT NULL,
+  length          INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_prenotazione ON tickets (id_prenotazione, seq);
+CREATE INDEX IF NOT EXISTS idx_tickets_passeggero ON tickets (passeggero, seq);
+CREATE INDEX IF NOT EXISTS idx_tickets_volo ON tickets (id_volo, seq);
+CREATE INDEX IF NOT EXISTS idx_tickets_data ON tickets (data, seq);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tickets_posizione ON tickets (segment, offset);
+"""
+
+_RE_SEGMENT = re.compile(r"^segment-(\d{6})\.jsonl$")
+
+
+class StoredTicket(NamedTuple):
+    ticket: TicketOutput
+    issued: float
+
+
+class _Location(NamedTuple):
+    segment: int
+    offset: int
+    length: int
+
+
+class _Pending:
+    __slots__ = ("line", "ticket", "issued", "done", "error")
+
+    def __init__(self, ticket: TicketOutput, issued: float):
+        self.ticket = ticket
+        self.issued = issued
+        self.line = (json.dumps({"issued": issued, "ticket": ticket.model_dump()}, ensure_ascii=False,
+                                separators=(",", ":")) + "\n").encode()
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+def normalize_passenger(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def _index_row(ticket: TicketOutput, issued: float, location: _Location) -> tuple:
+    return (ticket.id_prenotazione, ticket.id_volo, normalize_passenger(ticket.passeggero), ticket.data, issued,
+            *location)
+
+
+class TicketStore:
+    def __init__(self, directory: str = TICKET_DIR, segment_bytes: int = SEGMENT_BYTES,
+                 commit_ms: float = COMMIT_MS, batch: int = BATCH, wait_s: float = WAIT_S):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.commit_ms = commit_ms
+        self.batch = batch
+        self.wait_s = wait_s
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._last: Optional[_Pending] = None
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+        self._fds: dict[int, int] = {}
+        self._fds_lock = threading.Lock()
+
+    # --- file ---
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f"segment-{segment:06d}.jsonl"
+
+    def segments(self) -> list[int]:
+        if not self.directory.exists():
+            return []
+        return sorted(int(m.group(1)) for m in map(_RE_SEGMENT.match, os.listdir(self.directory)) if m)
+
+    def _connect(self) -> sqlite3.Connection:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.directory / "index.sqlite", timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(INDEX_SCHEMA)
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        # Una connessione per thread (sqlite3 non le condivide tra thread); le letture non avviano
+        # il writer: vedono i biglietti già su disco e indicizzati
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _read(self, location: _Location) -> StoredTicket:
+        with self._fds_lock:
+            fd = self._fds.get(location.segment)
+            if fd is None:
+                fd = self._fds[location.segment] = os.open(self._segment_path(location.segment), os.O_RDONLY)
+        record = json.loads(os.pread(fd, location.length, location.offset))
+        return StoredTicket(TicketOutput.model_validate(record["ticket"]), record["issued"])
+
+    # --- scrittura ---
+
+    def _recover(self, conn: sqlite3.Connection) -> tuple[int, int]:
+        """Indicizza i record del log non ancora nell'indice; (segmento, offset) da cui riprendere."""
+        last = conn.execute("SELECT segment, offset + length FROM tickets ORDER BY segment DESC, offset DESC "
+                            "LIMIT 1").fetchone()
+        segments = self.segments()
+        if not segments:
+            return 1, 0
+        segment, offset = last if last else (segments[0], 0)
+        recovered = 0
+        for current in (s for s in segments if s >= segment):
+            start = offset if current == segment else 0
+            rows = []
+            with open(self._segment_path(current), "rb") as f:
+                f.seek(start)
+                position = start
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    record = json.loads(line)
+                    ticket = TicketOutput.model_validate(record["ticket"])
+                    rows.append(_index_row(ticket, record["issued"], _Location(current, position, len(line))))
+                    position += len(line)
+            size = self._segment_path(current).stat().st_size
+            if position < size:
+                # Riga scritta a metà da un processo interrotto prima dell'fsync
+                logger.warning(f"Archivio biglietti: scarto {size - position} byte incompleti in coda "
+                               f"al segmento {current}")
+                os.truncate(self._segment_path(current), position)
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO tickets (id_prenotazione, id_volo, passeggero, data, "
+                                 "issued, segment, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            recovered += len(rows)
+            segment, offset = current, position
+        if recovered:
+            logger.info(f"Archivio biglietti: {recovered} record indicizzati dal log")
+        return segment, offset
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._start_lock:
+            if self._writer is None:
+                with closing(self._connect()) as conn:
+                    position = self._recover(conn)
+                self._writer = threading.Thread(target=self._write_loop, args=position,
+                                                name="weflai-tickets", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _write_loop(self, segment: int, offset: int) -> None:
+        # (segment, offset): fine dell'ultimo gruppo su disco; `f` è None dopo un errore e si riapre al gruppo
+        # successivo; con `stale` l'indice è rimasto indietro rispetto al log e si riallinea con _recover
+        conn = self._connect()
+        f = None
+        stale = False
+        while True:
+            # Il gruppo: quanto si è accodato durante l'fsync precedente, più l'eventuale attesa
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.commit_ms / 1000
+            while len(batch) < self.batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            error = None
+            current, position, rows = segment, offset, []
+            try:
+                if f is None:
+                    f = open(self._segment_path(segment), "ab")
+                for pending in batch:
+                    if position and position + len(pending.line) > self.segment_bytes:
+                        f.flush()
+                        os.fsync(f.fileno())
+                        f.close()
+                        f = None
+                        current, position = current + 1, 0
+                        f = open(self._segment_path(current), "ab")
+                    f.write(pending.line)
+                    location = _Location(current, position, len(pending.line))
+                    rows.append(_index_row(pending.ticket, pending.issued, location))
+                    position += location.length
+                # Un solo fsync per tutto il gruppo
+                f.flush()
+                os.fsync(f.fileno())
+                segment, offset = current, position
+            except Exception as e:
+                logger.error(f"Archivio biglietti: {len(batch)} biglietti non scritti: {e}")
+                error = e
+                f = self._rollback(f, segment, offset, current)
+            if error is None:
+                # Il gruppo è nel log (che fa fede): un errore dell'indice non lo annulla, i record
+                # si indicizzano dal log al gruppo successivo
+                try:
+                    if stale:
+                        self._recover(conn)
+                        stale = False
+                    else:
+                        with conn:
+                            conn.executemany("INSERT INTO tickets (id_prenotazione, id_volo, passeggero, data, "
+                                             "issued, segment, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                             rows)
+                except Exception as e:
+                    logger.error(f"Archivio biglietti: {len(batch)} biglietti scritti ma non indicizzati: {e}")
+                    stale = True
+            for pending in batch:
+                pending.error = error
+                pending.done.set()
+                self._queue.task_done()
+
+    def _rollback(self, f, segment: int, offset: int, current: int):
+        """Scarta dal log il gruppo fallito (fino a (segment, offset)); il file da cui ripartire, None se non apribile."""
+        if f is not None:
+            try:
+                f.close()
+            except OSError:
+                pass
+        try:
+            for created in range(segment + 1, current + 1):
+                self._segment_path(created).unlink(missing_ok=True)
+            path = self._segment_path(segment)
+            if path.exists() and path.stat().st_size > offset:
+                os.truncate(path, offset)
+            return open(path, "ab")
+        except OSError as e:
+            logger.error(f"Archivio biglietti: segmento {segment} non riaperto: {e}")
+            return None
+
+    def append(self, ticket: TicketOutput, wait: bool = True) -> None:
+        """
+        Aggiunge il biglietto al log; con `wait` ritorna quando è su disco (OSError se la scrittura fallisce,
+        TimeoutError se non è confermata entro WEFLAI_TICKET_WAIT_S secondi).
+        """
+        self._ensure_writer()
+        pending = _Pending(ticket, time.time())
+        self._queue.put(pending)
+        self._last = pending
+        if wait:
+            if not pending.done.wait(self.wait_s):
+                raise TimeoutError(f"biglietto {ticket.id_prenotazione} non confermato entro {self.wait_s:g} s")
+            if pending.error is not None:
+                raise OSError(f"biglietto {ticket.id_prenotazione} non archiviato: {pending.error}")
+
+    def flush(self) -> bool:
+        """Attende (al massimo WEFLAI_TICKET_WAIT_S secondi) che i biglietti accodati siano scritti; False se scade."""
+        # Il writer procede in ordine: quando l'ultimo accodato è concluso lo sono tutti
+        last = self._last
+        if last is None or last.done.wait(self.wait_s):
+            return True
+        logger.warning(f"Archivio biglietti: biglietti ancora in coda dopo {self.wait_s:g} s")
+        return False
+
+    # --- lettura ---
+
+    def _select(self, where: str, params: tuple, limit: Optional[int] = None) -> list[StoredTicket]:
+        # SQLite: con max(seq) le colonne non aggregate vengono dalla riga con seq massimo,
+        # cioè l'ultima versione di ogni prenotazione
+        sql = (f"SELECT segment, offset, length, max(seq) AS seq FROM tickets WHERE {where} "
+               f"GROUP BY id_prenotazione ORDER BY seq DESC")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        rows = self._reader().execute(sql, params).fetchall()
+        return [self._read(_Location(*row[:3])) for row in rows]
+
+    def get(self, id_prenotazione: int | str) -> Optional[StoredTicket]:
+        """Ultimo biglietto emesso per la prenotazione; None se non archiviato."""
+        found = self._select("id_prenotazione = ?", (str(id_prenotazione),))
+        return found[0] if found else None
+
+    def by_passenger(self, passeggero: str, limit: int = 50) -> list[StoredTicket]:
+        """Biglietti del passeggero ("Nome Cognome", senza distinzione di maiuscole), dal più recente."""
+        return self._select("passeggero = ?", (normalize_passenger(passeggero),), limit)
+
+    def by_flight(self, id_volo: int, limit: Optional[int] = None) -> list[StoredTicket]:
+        return self._select("id_volo = ?", (int(id_volo),), limit)
+
+    def scan(self, dal: str, al: str) -> Iterator[StoredTicket]:
+        """Biglietti con data del volo tra `dal` e `al` (YYYY-MM-DD, inclusi), per data e ordine di emissione."""
+        rows = self._reader().execute(
+            "SELECT segment, offset, length, max(seq) AS seq, data FROM tickets WHERE data BETWEEN ? AND ? "
+            "GROUP BY id_prenotazione ORDER BY data, seq",
+            (dal, al),
+        )
+        for row in rows:
+            yield self._read(_Location(*row[:3]))
+
+    def export(self) -> Iterator[StoredTicket]:
+        """Tutti i record del log in ordine di scrittura (ristampe comprese), un segmento alla volta."""
+        self.flush()
+        for segment in self.segments():
+            with open(self._segment_path(segment), "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    record = json.loads(line)
+                    yield StoredTicket(TicketOutput.model_validate(record["ticket"]), record["issued"])
+
+    def reindex(self) -> int:
+        """Ricostruisce l'indice dal log; restituisce i record indicizzati."""
+        if self._writer is not None:
+            raise RuntimeError("reindex con il writer attivo: usare un processo separato")
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute("DELETE FROM tickets")
+            self._recover(conn)
+            return conn.execute("SELECT count(*) FROM tickets").fetchone()[0]
+
+    def close(self) -> None:
+        self.flush()
+        with self._fds_lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
+
+
+def archive(ticket: TicketOutput) -> None:
+    """Archivia un biglietto appena emesso nell'archivio condiviso."""
+    from weflai.registry import get_tickets
+
+    get_tickets().append(ticket)
+
+
+def _print(found) -> None:
+    for stored in found:
+        sys.stdout.write(stored.ticket.model_dump_json() + "\n")
+
+
+def run():
+    """Entry point: ricerca ed export dei biglietti archiviati (JSONL su stdout)."""
+    parser = argparse.ArgumentParser(description="Archivio dei biglietti emessi")
+    parser.add_argument("ids", nargs="*", help="id_prenotazione")
+    parser.add_argument("--dir", default=TICKET_DIR)
+    parser.add_argument("--passeggero", help='"Nome Cognome"')
+    parser.add_argument("--volo", type=int, help="id_volo")
+    parser.add_argument("--dal", help="data del volo iniziale (YYYY-MM-DD)")
+    parser.add_argument("--al", help="data del volo finale (YYYY-MM-DD, default = --dal)")
+    parser.add_argument("--export", action="store_true", help="tutti i record del log, ristampe comprese")
+    parser.add_argument("--reindex", action="store_true", help="ricostruisce l'indice dal log")
+    args = parser.parse_args()
+
+    store = TicketStore(args.dir)
+    if args.reindex:
+        print(f"🗂️  Record indicizzati: {store.reindex()}", file=sys.stderr)
+    if args.export:
+        _print(store.export())
+    for id_prenotazione in args.ids:
+        stored = store.get(id_prenotazione)
+        if stored is None:
+            print(f"Biglietto {id_prenotazione} non archiviato", file=sys.stderr)
+        else:
+            _print([stored])
+    if args.passeggero:
+        _print(store.by_passenger(args.passeggero))
+    if args.volo is not None:
+        _print(store.by_flight(args.volo))
+    if args.dal:
+        _print(store.scan(args.dal, args.al or args.dal))
+    store.close()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,237 @@
+# weflai/tools/availability.py
+"""
+Indice materializzato di disponibilità e prezzi per tratta e giorno.
+
+we_flai.disponibilita_tratte ha una riga per (aeroporto partenza, aeroporto
+arrivo, data) con prezzo minimo, volo più economico con posti liberi, numero
+di voli, posti prenotati e disponibili e id dei voli ordinati per prezzo.
+"Il volo più economico Roma→Milano nei prossimi 7 giorni" diventa una
+scansione di range sulla chiave primaria invece di un'aggregazione su voli.
+
+Aggiornamento incrementale: trigger per statement (con transition table) su
+voli ricalcolano solo le chiavi toccate, con un advisory lock per chiave: due
+transazioni sulla stessa tratta-giorno si serializzano e la seconda ricalcola
+vedendo i dati della prima. Le prenotazioni arrivano tramite il contatore
+voli.posti_disponibili (weflai.tools.inventory, installato con l'indice).
+
+Installazione (idempotente, ricostruisce l'indice):  availability_index
+Rimozione:                                           availability_index --drop
+Senza indice installato le ricerche calcolano lo stesso risultato da voli.
+"""
+import argparse
+import logging
+import threading
+import time
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import text
+
+from weflai.tools import database, inventory
+
+logger = logging.getLogger(__name__)
+
+TABLE = f"{database.DB_SCHEMA}.disponibilita_tratte"
+
+INDEX_DDL = """
+CREATE TABLE IF NOT EXISTS we_flai.disponibilita_tratte (
+  id_apt_ptz        BIGINT NOT NULL,
+  id_apt_arr        BIGINT NOT NULL,
+  data_ptz          DATE NOT NULL,
+  prezzo_min        NUMERIC(10,2) NOT NULL,
+  id_volo_min       BIGINT NOT NULL,
+  voli              INTEGER NOT NULL,
+  posti_prenotati   INTEGER NOT NULL,
+  posti_disponibili INTEGER NOT NULL DEFAULT 0,
+  id_voli           BIGINT[] NOT NULL,
+  aggiornato        TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (id_apt_ptz, id_apt_arr, data_ptz)
+);
+ALTER TABLE we_flai.disponibilita_tratte ADD COLUMN IF NOT EXISTS posti_disponibili INTEGER NOT NULL DEFAULT 0;
+
+-- Ogni prenotazione aggiorna voli.posti_disponibili (weflai.tools.inventory): bastano i trigger su voli
+DROP TRIGGER IF EXISTS disponibilita_prenotazioni_ins ON we_flai.prenotazioni;
+DROP TRIGGER IF EXISTS disponibilita_prenotazioni_upd ON we_flai.prenotazioni;
+DROP TRIGGER IF EXISTS disponibilita_prenotazioni_del ON we_flai.prenotazioni;
+DROP FUNCTION IF EXISTS we_flai.disponibilita_trg_prenotazioni();
+
+CREATE OR REPLACE FUNCTION we_flai.disponibilita_ricalcola(p_ptz BIGINT[], p_arr BIGINT[], p_data DATE[])
+RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+  chiave record;
+BEGIN
+  IF coalesce(cardinality(p_ptz), 0) = 0 THEN
+    RETURN;
+  END IF;
+  -- Lock in ordine di chiave: nessun deadlock tra transazioni che toccano più tratte
+  FOR chiave IN
+    SELECT DISTINCT t.ptz, t.arr, t.dt FROM unnest(p_ptz, p_arr, p_data) AS t(ptz, arr, dt) ORDER BY 1, 2, 3
+  LOOP
+    PERFORM pg_advisory_xact_lock(hashtext('we_flai.disponibilita_tratte'),
+                                  hashtext(chiave.ptz || '/' || chiave.arr || '/' || chiave.dt));
+  END LOOP;
+
+  -- Il volo di riferimento è il più economico con posti liberi (il più economico in assoluto se sono tutti pieni)
+  INSERT INTO we_flai.disponibilita_tratte AS d
+    (id_apt_ptz, id_apt_arr, data_ptz, prezzo_min, id_volo_min, voli, posti_prenotati, posti_disponibili,
+     id_voli, aggiornato)
+  SELECT v.id_apt_ptz, v.id_apt_arr, v.data_ptz,
+         coalesce(min(v.prezzo) FILTER (WHERE v.posti_disponibili > 0), min(v.prezzo)),
+         (array_agg(v.id_volo ORDER BY v.posti_disponibili = 0, v.prezzo, v.ora_ptz, v.id_volo))[1],
+         count(*),
+         sum(v.posti_totali - v.posti_disponibili),
+         sum(v.posti_disponibili),
+         array_agg(v.id_volo ORDER BY v.posti_disponibili = 0, v.prezzo, v.ora_ptz, v.id_volo),
+         now()
+  FROM (SELECT DISTINCT t.ptz, t.arr, t.dt FROM unnest(p_ptz, p_arr, p_data) AS t(ptz, arr, dt)) k
+  JOIN we_flai.voli v ON v.id_apt_ptz = k.ptz AND v.id_apt_arr = k.arr AND v.data_ptz = k.dt
+  GROUP BY v.id_apt_ptz, v.id_apt_arr, v.data_ptz
+  ON CONFLICT (id_apt_ptz, id_apt_arr, data_ptz) DO UPDATE SET
+    prezzo_min = EXCLUDED.prezzo_min,
+    id_volo_min = EXCLUDED.id_volo_min,
+    voli = EXCLUDED.voli,
+    posti_prenotati = EXCLUDED.posti_prenotati,
+    posti_disponibili = EXCLUDED.posti_disponibili,
+    id_voli = EXCLUDED.id_voli,
+    aggiornato = EXCLUDED.aggiornato;
+
+  -- Tratte-giorno rimaste senza voli
+  DELETE FROM we_flai.disponibilita_tratte d
+  USING unnest(p_ptz, p_arr, p_data) AS k(ptz, arr, dt)
+  WHERE d.id_apt_ptz = k.ptz AND d.id_apt_arr = k.arr AND d.data_ptz = k.dt
+    AND NOT EXISTS (
+      SELECT 1 FROM we_flai.voli v
+      WHERE v.id_apt_ptz = k.ptz AND v.id_apt_arr = k.arr AND v.data_ptz = k.dt
+    );
+END $$;
+
+CREATE OR REPLACE FUNCTION we_flai.disponibilita_ricostruisci()
+RETURNS void LANGUAGE plpgsql AS $$
+BEGIN
+  -- Le scritture su voli (e quindi le prenotazioni) attendono la fine della ricostruzione
+  LOCK TABLE we_flai.voli IN SHARE MODE;
+  DELETE FROM we_flai.disponibilita_tratte;
+  INSERT INTO we_flai.disponibilita_tratte
+    (id_apt_ptz, id_apt_arr, data_ptz, prezzo_min, id_volo_min, voli, posti_prenotati, posti_disponibili,
+     id_voli, aggiornato)
+  SELECT v.id_apt_ptz, v.id_apt_arr, v.data_ptz,
+         coalesce(min(v.prezzo) FILTER (WHERE v.posti_disponibili > 0), min(v.prezzo)),
+         (array_agg(v.id_volo ORDER BY v.posti_disponibili = 0, v.prezzo, v.ora_ptz, v.id_volo))[1],
+         count(*),
+         sum(v.posti_totali - v.posti_disponibili),
+         sum(v.posti_disponibili),
+         array_agg(v.id_volo ORDER BY v.posti_disponibili = 0, v.prezzo, v.ora_ptz, v.id_volo),
+         now()
+  FROM we_flai.voli v
+  GROUP BY v.id_apt_ptz, v.id_apt_arr, v.data_ptz;
+END $$;
+
+CREATE OR REPLACE FUNCTION we_flai.disponibilita_trg_voli()
+RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+  ptz BIGINT[];
+  arr BIGINT[];
+  dt DATE[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(id_apt_ptz), array_agg(id_apt_arr), array_agg(data_ptz) INTO ptz, arr, dt
+    FROM (SELECT DISTINCT id_apt_ptz, id_apt_arr, data_ptz FROM nuove) t;
+  ELSIF TG_OP = 'DELETE' THEN
+    SELECT array_agg(id_apt_ptz), array_agg(id_apt_arr), array_agg(data_ptz) INTO ptz, arr, dt
+    FROM (SELECT DISTINCT id_apt_ptz, id_apt_arr, data_ptz FROM vecchie) t;
+  ELSE
+    -- Un UPDATE può spostare un volo di tratta o di giorno: chiavi vecchie e nuove
+    SELECT array_agg(id_apt_ptz), array_agg(id_apt_arr), array_agg(data_ptz) INTO ptz, arr, dt
+    FROM (SELECT id_apt_ptz, id_apt_arr, data_ptz FROM nuove
+          UNION SELECT id_apt_ptz, id_apt_arr, data_ptz FROM vecchie) t;
+  END IF;
+  PERFORM we_flai.disponibilita_ricalcola(ptz, arr, dt);
+  RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS disponibilita_voli_ins ON we_flai.voli;
+DROP TRIGGER IF EXISTS disponibilita_voli_upd ON we_flai.voli;
+DROP TRIGGER IF EXISTS disponibilita_voli_del ON we_flai.voli;
+CREATE TRIGGER disponibilita_voli_ins AFTER INSERT ON we_flai.voli
+  REFERENCING NEW TABLE AS nuove
+  FOR EACH STATEMENT EXECUTE FUNCTION we_flai.disponibilita_trg_voli();
+CREATE TRIGGER disponibilita_voli_upd AFTER UPDATE ON we_flai.voli
+  REFERENCING OLD TABLE AS vecchie NEW TABLE AS nuove
+  FOR EACH STATEMENT EXECUTE FUNCTION we_flai.disponibilita_trg_voli();
+CREATE TRIGGER disponibilita_voli_del AFTER DELETE ON we_flai.voli
+  REFERENCING OLD TABLE AS vecchie
+  FOR EACH STATEMENT EXECUTE FUNCTION we_flai.disponibilita_trg_voli();
+"""
+
+REBUILD_SQL = "SELECT we_flai.disponibilita_ricostruisci();\n"
+
+DROP_DDL = """
+DROP TRIGGER IF EXISTS disponibilita_voli_ins ON we_flai.voli;
+DROP TRIGGER IF EXISTS disponibilita_voli_upd ON we_flai.voli;
+DROP TRIGGER IF EXISTS disponibilita_voli_del ON we_flai.voli;
+DROP FUNCTION IF EXISTS we_flai.disponibilita_trg_voli();
+DROP FUNCTION IF EXISTS we_flai.disponibilita_ricostruisci();
+DROP FUNCTION IF EXISTS we_flai.disponibilita_ricalcola(BIGINT[], BIGINT[], DATE[]);
+DROP TABLE IF EXISTS we_flai.disponibilita_tratte;
+"""
+
+_installed: Optional[bool] = None
+_installed_lock = threading.Lock()
+
+
+def _run_ddl(sql: str) -> None:
+    with database.get_engine().begin() as conn:
+        conn.execution_options(no_parameters=True).exec_driver_sql(sql)
+
+
+def is_installed() -> bool:
+    """True se l'indice esiste (verificato una volta per processo)."""
+    global _installed
+    if _installed is None:
+        with _installed_lock:
+            if _installed is None:
+                with database.get_engine().connect() as conn:
+                    _installed = conn.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": TABLE}).scalar()
+    return _installed
+
+
+def install(rebuild: bool = True) -> None:
+    """Crea tabella, funzioni e trigger (idempotente) e ricostruisce il contenuto."""
+    global _installed
+    t0 = time.perf_counter()
+    inventory.install()
+    _run_ddl(INDEX_DDL + (REBUILD_SQL if rebuild else ""))
+    _installed = True
+    logger.info(f"✓ Indice disponibilità installato in {time.perf_counter() - t0:.1f}s")
+
+
+def drop() -> None:
+    global _installed
+    _run_ddl(DROP_DDL)
+    _installed = False
+
+
+def cheapest(partenza: list[str], arrivo: list[str], dal: Optional[date] = None, giorni: int = 7,
+             limit: int = 1) -> list[database.AvailabilityRow]:
+    """Voli più economici della tratta (uno per giorno), dall'indice se installato."""
+    return database.cheapest_flights(partenza, arrivo, dal or date.today(), giorni, limit,
+                                     indexed=is_installed())
+
+
+def run():
+    """Entry point: installazione o rimozione dell'indice."""
+    parser = argparse.ArgumentParser(description="Indice disponibilità/prezzi per tratta e giorno")
+    parser.add_argument("--drop", action="store_true", help="rimuove tabella, funzioni e trigger")
+    parser.add_argument("--no-rebuild", action="store_true", help="installa senza ricalcolare il contenuto")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.drop:
+        drop()
+        print(f"{TABLE} rimossa")
+    else:
+        install(rebuild=not args.no_rebuild)
+        print(f"{TABLE} installata")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,340 @@
+# weflai/tools/flight_search.py
+"""
+Motore di ricerca voli deterministico.
+
+Trasforma richieste come "Volo Roma Milano domani mattina" in una ricerca
+parametrizzata su we_flai.voli senza passare dall'LLM. Il parser è basato su
+regole e su un gazetteer di città/codici IATA; se la richiesta è ambigua
+(città mancanti o multiple, data assente o contraddittoria) restituisce None
+e il flow passa la richiesta alla BookingCrew.
+"""
+import logging
+import re
+import threading
+import time
+import unicodedata
+from datetime import date, timedelta
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from weflai.tools import database
+
+logger = logging.getLogger(__name__)
+
+# Finestra di fallback (giorni) applicata direttamente in SQL
+FALLBACK_DAYS = 3
+
+# Gazetteer di base (seed di "Script WeFlai.sql"), usato se il DB non risponde
+_SEED_AIRPORTS = {
+    "FCO": "Roma", "MXP": "Milano", "LIN": "Milano", "VCE": "Venezia",
+    "NAP": "Napoli", "CTA": "Catania", "CDG": "Parigi", "AMS": "Amsterdam",
+    "FRA": "Francoforte", "MAD": "Madrid", "BCN": "Barcellona", "ZRH": "Zurigo",
+    "VIE": "Vienna", "LHR": "Londra", "JFK": "New York", "LAX": "Los Angeles",
+    "PEK": "Pechino", "SVO": "Mosca", "JNB": "Johannesburg", "SYD": "Sydney",
+}
+
+# Nomi alternativi (inglese) -> città canonica
+_CITY_ALIASES = {
+    "rome": "Roma", "milan": "Milano", "venice": "Venezia", "naples": "Napoli",
+    "paris": "Parigi", "frankfurt": "Francoforte", "barcelona": "Barcellona",
+    "zurich": "Zurigo", "london": "Londra", "beijing": "Pechino",
+    "moscow": "Mosca", "nyc": "New York",
+}
+
+# Nomi degli scali -> codice IATA specifico
+_AIRPORT_ALIASES = {"fiumicino": "FCO", "malpensa": "MXP", "linate": "LIN"}
+
+_MONTHS = {
+    "gennaio": 1, "febbraio": 2, "marzo": 3, "aprile": 4, "maggio": 5,
+    "giugno": 6, "luglio": 7, "agosto": 8, "settembre": 9, "ottobre": 10,
+    "novembre": 11, "dicembre": 12,
+}
+
+_WEEKDAYS = {
+    "lunedi": 0, "martedi": 1, "mercoledi": 2, "giovedi": 3,
+    "venerdi": 4, "sabato": 5, "domenica": 6,
+}
+
+# Fasce orarie (inclusive) usate solo come preferenza di ordinamento
+_DAY_PARTS = {
+    "mattina": ("05:00", "11:59"),
+    "pomeriggio": ("12:00", "17:59"),
+    "sera": ("18:00", "23:59"),
+    "notte": ("00:00", "04:59"),
+}
+
+_RE_ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_RE_NUM_DATE = re.compile(r"\b(\d{1,2})[/.](\d{1,2})(?:[/.](\d{2,4}))?\b")
+_RE_TEXT_DATE = re.compile(r"\b(\d{1,2})\s+(" + "|".join(_MONTHS) + r")(?:\s+(\d{4}))?\b")
+_RE_IN_DAYS = re.compile(r"\btra\s+(\d{1,2})\s+giorni\b")
+_RE_WEEKDAY = re.compile(r"\b(" + "|".join(_WEEKDAYS) + r")\b")
+
+_ORIGIN_MARKERS = {"da", "dal", "dalla", "from"}
+_DESTINATION_MARKERS = {"a", "per", "verso", "to", "destinazione"}
+
+class FlightQuery(BaseModel):
+    """Richiesta di volo estratta in modo deterministico dal testo utente."""
+
+    partenza: list[str] = Field(..., description="Codici IATA ammessi in partenza")
+    arrivo: list[str] = Field(..., description="Codici IATA ammessi in arrivo")
+    data: date
+    fascia_oraria: Optional[str] = Field(None, description="mattina/pomeriggio/sera/notte")
+
+
+class FlightMatch(BaseModel):
+    """Volo trovato dal motore di ricerca."""
+
+    id_volo: int
+    compagnia: str
+    partenza_iata: str
+    arrivo_iata: str
+    citta_partenza: str
+    citta_arrivo: str
+    data: date
+    orario_partenza: str
+    orario_arrivo: str
+    prezzo: float
+
+    def describe(self) -> str:
+        return (
+            f"Volo {self.id_volo} - {self.compagnia}: {self.citta_partenza} ({self.partenza_iata}) -> "
+            f"{self.citta_arrivo} ({self.arrivo_iata}) il {self.data.isoformat()} "
+            f"{self.orario_partenza}-{self.orario_arrivo}, {self.prezzo:.2f} EUR"
+        )
+
+
+class SearchStats:
+    """Contatori di hit-rate del parser e latenza della ricerca (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.parsed = 0
+        self.found = 0
+        self.parse_ms = 0.0
+        self.query_ms = 0.0
+
+    def record(self, parsed: bool, found: bool, parse_ms: float, query_ms: float):
+        with self._lock:
+            self.requests += 1
+            self.parsed += parsed
+            self.found += found
+            self.parse_ms += parse_ms
+            self.query_ms += query_ms
+
+    def summary(self) -> str:
+        with self._lock:
+            if not self.requests:
+                return "nessuna ricerca eseguita"
+            hit_rate = 100.0 * self.parsed / self.requests
+            avg_parse = self.parse_ms / self.requests
+            avg_query = self.query_ms / self.parsed if self.parsed else 0.0
+            return (
+                f"parse hit-rate {hit_rate:.1f}% ({self.parsed}/{self.requests}), "
+                f"voli trovati {self.found}, parse medio {avg_parse:.2f} ms, query media {avg_query:.2f} ms"
+            )
+
+
+stats = SearchStats()
+
+_gazetteer: Optional[dict[str, list[str]]] = None
+_gazetteer_lock = threading.Lock()
+
+
+def _normalize(value: str) -> str:
+    """Minuscolo, senza accenti e con spazi singoli."""
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", value.lower()).strip()
+
+
+def _build_gazetteer(airports: dict[str, str]) -> dict[str, list[str]]:
+    """Mappa nome normalizzato (città, alias o IATA) -> codici IATA."""
+    gazetteer: dict[str, list[str]] = {}
+    for iata, citta in airports.items():
+        gazetteer.setdefault(_normalize(citta), []).append(iata)
+        gazetteer[iata.lower()] = [iata]
+    for alias, citta in _CITY_ALIASES.items():
+        if _normalize(citta) in gazetteer:
+            gazetteer[alias] = gazetteer[_normalize(citta)]
+    for alias, iata in _AIRPORT_ALIASES.items():
+        if iata in airports:
+            gazetteer[alias] = [iata]
+    return gazetteer
+
+
+def load_gazetteer(refresh: bool = False) -> dict[str, list[str]]:
+    """Carica il gazetteer da we_flai.aeroporti (una volta sola), con fallback sui seed."""
+    global _gazetteer
+    if _gazetteer is not None and not refresh:
+        return _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None or refresh:
+            airports = dict(_SEED_AIRPORTS)
+            try:
+                rows = database.list_airports()
+                if rows:
+                    airports = dict(rows)
+            except Exception as e:
+                logger.warning(f"Gazetteer dal DB non disponibile, uso i seed: {e}")
+            _gazetteer = _build_gazetteer(airports)
+    return _gazetteer
+
+
+def _find_places(normalized: str, gazetteer: dict[str, list[str]]) -> list[tuple[int, str, list[str]]]:
+    """Restituisce le località citate come (posizione, nome, codici IATA), in ordine di apparizione."""
+    places = []
+    taken: list[tuple[int, int]] = []
+    # Nomi più lunghi prima ("new york" prima di "york")
+    for name in sorted(gazetteer, key=len, reverse=True):
+        for match in re.finditer(r"\b" + re.escape(name) + r"\b", normalized):
+            start, end = match.span()
+            if any(start < t_end and end > t_start for t_start, t_end in taken):
+                continue
+            taken.append((start, end))
+            places.append((start, name, gazetteer[name]))
+    return sorted(places)
+
+
+def _parse_date(normalized: str, today: date) -> Optional[date]:
+    """Estrae una sola data (relativa o assoluta); None se assente o contraddittoria."""
+    found: set[date] = set()
+
+    for y, m, d in _RE_ISO_DATE.findall(normalized):
+        found.add(date(int(y), int(m), int(d)))
+    without_iso = _RE_ISO_DATE.sub(" ", normalized)
+
+    for d, m, y in _RE_NUM_DATE.findall(without_iso):
+        year = int(y) if y else today.year
+        if y and year < 100:
+            year += 2000
+        candidate = date(year, int(m), int(d))
+        if not y and candidate < today:
+            candidate = candidate.replace(year=year + 1)
+        found.add(candidate)
+
+    for d, month, y in _RE_TEXT_DATE.findall(normalized):
+        year = int(y) if y else today.year
+        candidate = date(year, _MONTHS[month], int(d))
+        if not y and candidate < today:
+            candidate = candidate.replace(year=year + 1)
+        found.add(candidate)
+
+    if re.search(r"\bdopodomani\b", normalized):
+        found.add(today + timedelta(days=2))
+    elif re.search(r"\bdomani\b", normalized):
+        found.add(today + timedelta(days=1))
+    if re.search(r"\boggi\b", normalized):
+        found.add(today)
+    for n in _RE_IN_DAYS.findall(normalized):
+        found.add(today + timedelta(days=int(n)))
+    for day_name in _RE_WEEKDAY.findall(normalized):
+        delta = (_WEEKDAYS[day_name] - today.weekday()) % 7 or 7
+        found.add(today + timedelta(days=delta))
+
+    return found.pop() if len(found) == 1 else None
+
+
+def resolve_place(name: str) -> Optional[list[str]]:
+    """Codici IATA per una città, un alias o un codice IATA; None se sconosciuto."""
+    return load_gazetteer().get(_normalize(name))
+
+
+def parse_date(value: str, today: Optional[date] = None) -> Optional[date]:
+    """Data assoluta o relativa ("2026-02-01", "01/02", "domani"); None se non valida."""
+    try:
+        return _parse_date(_normalize(value), today or date.today())
+    except ValueError:
+        return None
+
+
+def parse_query(query: str, today: Optional[date] = None) -> Optional[FlightQuery]:
+    """
+    Estrae partenza, arrivo e data dalla richiesta.
+    Restituisce None se la richiesta è ambigua: in quel caso decide la crew.
+    """
+    today = today or date.today()
+    normalized = _normalize(query)
+    gazetteer = load_gazetteer()
+
+    try:
+        travel_date = _parse_date(normalized, today)
+    except ValueError:
+        # Es. "31/02": data impossibile, meglio lasciar decidere l'agente
+        return None
+    if travel_date is None:
+        return None
+
+    places = []
+    for pos, name, codes in _find_places(normalized, gazetteer):
+        # Evita falsi positivi su codici IATA scritti in minuscolo ("per" non è un aeroporto)
+        if len(name) == 3 and name.upper() in codes and name.upper() not in query:
+            continue
+        places.append((pos, codes))
+    # Città distinte: "Milano Linate" indica un solo scalo, si tiene il più specifico
+    distinct = []
+    for pos, codes in places:
+        for i, (other_pos, other) in enumerate(distinct):
+            if set(codes) <= set(other) or set(other) <= set(codes):
+                distinct[i] = (other_pos, min(codes, other, key=len))
+                break
+        else:
+            distinct.append((pos, codes))
+    if len(distinct) != 2:
+        return None
+
+    (pos_a, codes_a), (pos_b, codes_b) = distinct
+    marker_a = normalized[:pos_a].split()[-1:] or [""]
+    marker_b = normalized[:pos_b].split()[-1:] or [""]
+    origin_a, origin_b = marker_a[0] in _ORIGIN_MARKERS, marker_b[0] in _ORIGIN_MARKERS
+    dest_a, dest_b = marker_a[0] in _DESTINATION_MARKERS, marker_b[0] in _DESTINATION_MARKERS
+    # Due partenze o due destinazioni esplicite: decide la crew
+    if (origin_a and origin_b) or (dest_a and dest_b):
+        return None
+    # "a Milano da Roma", "Milano da Roma", "per Milano Roma": il marcatore esplicito prevale sull'ordine
+    if origin_b or dest_a:
+        codes_a, codes_b = codes_b, codes_a
+
+    fascia = next((part for part in _DAY_PARTS if re.search(rf"\b{part}\b", normalized)), None)
+    return FlightQuery(partenza=codes_a, arrivo=codes_b, data=travel_date, fascia_oraria=fascia)
+
+
+def find_flight(flight_query: FlightQuery) -> Optional[FlightMatch]:
+    """Esegue la ricerca (prepared statement) con fallback ±3 giorni in un solo round-trip."""
+    ora_da, ora_a = _DAY_PARTS.get(flight_query.fascia_oraria, ("00:00", "23:59"))
+    rows = database.search_flights(
+        flight_query.partenza, flight_query.arrivo, flight_query.data,
+        finestra=FALLBACK_DAYS, ora_da=ora_da, ora_a=ora_a,
+    )
+    if not rows:
+        return None
+    row = rows[0]
+    return FlightMatch(
+        id_volo=row.id_volo,
+        compagnia=row.compagnia,
+        partenza_iata=row.partenza_iata.strip(),
+        arrivo_iata=row.arrivo_iata.strip(),
+        citta_partenza=row.citta_partenza,
+        citta_arrivo=row.citta_arrivo,
+        data=row.data_ptz,
+        orario_partenza=row.ora_ptz.strftime("%H:%M"),
+        orario_arrivo=row.ora_arr.strftime("%H:%M"),
+        prezzo=float(row.prezzo),
+    )
+
+
+def search(query: str, today: Optional[date] = None) -> tuple[Optional[FlightQuery], Optional[FlightMatch]]:
+    """
+    Percorso veloce completo: parsing + query.
+    Output: (richiesta estratta o None se ambigua, volo trovato o None).
+    """
+    t0 = time.perf_counter()
+    flight_query = parse_query(query, today)
+    t1 = time.perf_counter()
+    match = find_flight(flight_query) if flight_query else None
+    t2 = time.perf_counter()
+
+    stats.record(flight_query is not None, match is not None, (t1 - t0) * 1000, (t2 - t1) * 1000)
+    logger.info(f"⚡ Ricerca deterministica: {stats.summary()}")
+    return flight_query, match
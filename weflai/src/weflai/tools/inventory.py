@@ -0,0 +1,220 @@
+# weflai/tools/inventory.py
+"""
+Posti dei voli e prenotazioni idempotenti.
+
+Schema (migrazione idempotente: seat_inventory, oppure automatica al primo
+uso con WEFLAI_AUTO_MIGRATE=1, il default; con 0 le query sollevano
+database.SchemaNotReady finché non la si esegue):
+- voli.posti_totali (default WEFLAI_SEATS_PER_FLIGHT) e voli.posti_disponibili,
+  con CHECK 0 <= posti_disponibili <= posti_totali
+- prenotazioni.chiave_idempotenza, con indice univoco
+
+Un trigger AFTER ROW su prenotazioni tiene il contatore allineato per ogni
+percorso di scrittura (tool degli agenti, batch, SQL a mano): INSERT esegue
+UPDATE voli SET posti_disponibili = posti_disponibili - 1 WHERE ... AND
+posti_disponibili > 0, e se nessuna riga viene aggiornata la prenotazione
+fallisce con SQLSTATE WF001 (volo esaurito); DELETE restituisce il posto.
+Le prenotazioni concorrenti sullo stesso volo si serializzano sul lock di
+riga di voli e ricontrollano la condizione: nessun overbooking.
+
+La chiave di idempotenza (idempotency_key) è derivata da volo e passeggero
+nell'ambito della richiesta corrente (idempotency_scope): una chiamata al tool
+ripetuta dall'agente restituisce la prenotazione già creata, e il flow emette
+il biglietto solo per prenotazioni con la chiave del proprio scope
+(booked_in_scope).
+"""
+import argparse
+import hashlib
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from weflai import interaction
+from weflai.tools import database, sql_cache
+
+logger = logging.getLogger(__name__)
+
+SEATS_PER_FLIGHT = int(os.getenv("WEFLAI_SEATS_PER_FLIGHT", "180"))
+AUTO_MIGRATE = os.getenv("WEFLAI_AUTO_MIGRATE", "1") not in ("0", "false", "False")
+
+SEATS_DDL = f"""
+ALTER TABLE we_flai.voli ADD COLUMN IF NOT EXISTS posti_totali INTEGER NOT NULL DEFAULT {SEATS_PER_FLIGHT};
+ALTER TABLE we_flai.voli ADD COLUMN IF NOT EXISTS posti_disponibili INTEGER;
+UPDATE we_flai.voli v
+SET posti_disponibili = greatest(v.posti_totali - (
+  SELECT count(*) FROM we_flai.prenotazioni p WHERE p.id_volo = v.id_volo
+), 0)
+WHERE v.posti_disponibili IS NULL;
+ALTER TABLE we_flai.voli ALTER COLUMN posti_disponibili SET NOT NULL;
+ALTER TABLE we_flai.voli DROP CONSTRAINT IF EXISTS voli_posti_check;
+ALTER TABLE we_flai.voli ADD CONSTRAINT voli_posti_check
+  CHECK (posti_totali > 0 AND posti_disponibili BETWEEN 0 AND posti_totali);
+
+ALTER TABLE we_flai.prenotazioni ADD COLUMN IF NOT EXISTS chiave_idempotenza TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_prenotazioni_chiave_idempotenza
+  ON we_flai.prenotazioni (chiave_idempotenza);
+
+-- Un volo nuovo nasce con tutti i posti disponibili
+CREATE OR REPLACE FUNCTION we_flai.posti_trg_voli()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.posti_disponibili := coalesce(NEW.posti_disponibili, NEW.posti_totali);
+  RETURN NEW;
+END $$;
+
+CREATE OR REPLACE FUNCTION we_flai.posti_trg_prenotazioni()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP IN ('DELETE', 'UPDATE') THEN
+    UPDATE we_flai.voli SET posti_disponibili = posti_disponibili + 1 WHERE id_volo = OLD.id_volo;
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    UPDATE we_flai.voli SET posti_disponibili = posti_disponibili - 1
+    WHERE id_volo = NEW.id_volo AND posti_disponibili > 0;
+    IF NOT FOUND THEN
+      RAISE EXCEPTION 'Volo % esaurito', NEW.id_volo USING ERRCODE = 'WF001';
+    END IF;
+  END IF;
+  RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS posti_voli ON we_flai.voli;
+CREATE TRIGGER posti_voli BEFORE INSERT ON we_flai.voli
+  FOR EACH ROW EXECUTE FUNCTION we_flai.posti_trg_voli();
+-- AFTER: con ON CONFLICT DO NOTHING il trigger scatta solo per le righe davvero inserite
+DROP TRIGGER IF EXISTS posti_prenotazioni ON we_flai.prenotazioni;
+CREATE TRIGGER posti_prenotazioni AFTER INSERT OR DELETE OR UPDATE OF id_volo ON we_flai.prenotazioni
+  FOR EACH ROW EXECUTE FUNCTION we_flai.posti_trg_prenotazioni();
+"""
+
+# Caricamenti massivi (benchmarks.datagen): senza trigger, i voli caricati restano con
+# posti_disponibili NULL e SEATS_DDL li ricalcola dalle prenotazioni
+BULK_LOAD_DDL = """
+DROP TRIGGER IF EXISTS posti_voli ON we_flai.voli;
+DROP TRIGGER IF EXISTS posti_prenotazioni ON we_flai.prenotazioni;
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM information_schema.columns
+             WHERE table_schema = 'we_flai' AND table_name = 'voli' AND column_name = 'posti_disponibili') THEN
+    ALTER TABLE we_flai.voli ALTER COLUMN posti_disponibili DROP NOT NULL;
+  END IF;
+END $$;
+"""
+
+# Colonne, indice e trigger che le query del percorso caldo danno per scontati
+INSTALLED_SQL = """
+SELECT EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_schema = 'we_flai' AND table_name = 'voli'
+                 AND column_name = 'posti_disponibili' AND is_nullable = 'NO')
+   AND EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_schema = 'we_flai' AND table_name = 'prenotazioni'
+                 AND column_name = 'chiave_idempotenza')
+   AND to_regclass('we_flai.idx_prenotazioni_chiave_idempotenza') IS NOT NULL
+   AND EXISTS (SELECT 1 FROM pg_trigger
+               WHERE tgname = 'posti_prenotazioni' AND tgrelid = 'we_flai.prenotazioni'::regclass)
+"""
+
+_scope = threading.local()
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install() -> None:
+    """Applica la migrazione dei posti (idempotente)."""
+    global _installed
+    with database.get_engine().begin() as conn:
+        # Più processi che migrano insieme si mettono in fila
+        conn.exec_driver_sql("SELECT pg_advisory_xact_lock(hashtext('we_flai.seat_inventory'))")
+        conn.execution_options(no_parameters=True).exec_driver_sql(SEATS_DDL)
+    _installed = True
+    logger.info("✓ Posti dei voli e chiavi di idempotenza installati")
+
+
+def is_installed() -> bool:
+    with database.get_engine().connect() as conn:
+        return bool(conn.exec_driver_sql(INSTALLED_SQL).scalar())
+
+
+def ensure_installed() -> None:
+    """
+    Verifica la migrazione dei posti una volta per processo e, se manca, la
+    applica (WEFLAI_AUTO_MIGRATE) o solleva database.SchemaNotReady.
+    """
+    global _installed
+    if _installed:
+        return
+    with _install_lock:
+        if _installed:
+            return
+        if is_installed():
+            _installed = True
+            return
+        if not AUTO_MIGRATE:
+            raise database.SchemaNotReady(
+                "we_flai.voli.posti_disponibili / prenotazioni.chiave_idempotenza mancanti: eseguire seat_inventory"
+            )
+        logger.warning("Migrazione dei posti non applicata: la applico ora (seat_inventory)")
+        try:
+            install()
+        except Exception as e:
+            raise database.SchemaNotReady(f"migrazione dei posti non riuscita ({e}): eseguire seat_inventory") from e
+
+
+@contextmanager
+def idempotency_scope(scope: str):
+    """Ambito delle chiavi di idempotenza (es. id dello stato del flow) per il thread corrente."""
+    previous = getattr(_scope, "value", None)
+    _scope.value = scope
+    try:
+        yield
+    finally:
+        _scope.value = previous
+
+
+def idempotency_key(id_volo: int, nome: str, cognome: str, mail: str, scope: Optional[str] = None) -> str:
+    """
+    Stesso volo e passeggero nella stessa richiesta -> stessa chiave.
+    Senza `scope` vale l'idempotency_scope corrente, fuori da uno scope il turno corrente dell'utente.
+    """
+    scope = scope or getattr(_scope, "value", None) or f"turn:{interaction.turn_started_ns()}"
+    passenger = "|".join(" ".join(part.lower().split()) for part in (nome, cognome, mail))
+    return hashlib.sha256(f"{scope}|{id_volo}|{passenger}".encode()).hexdigest()[:32]
+
+
+def reserve(id_volo: int, id_documento: str, nome: str, cognome: str, mail: str,
+            chiave: Optional[str] = None) -> database.BookingResult:
+    """Prenota un posto; solleva database.FlightFullError se il volo è esaurito."""
+    chiave = chiave or idempotency_key(id_volo, nome, cognome, mail)
+    booking = database.book_seat(id_volo, id_documento, nome, cognome, mail, chiave)
+    # Il trigger ha aggiornato anche i posti del volo: le letture in cache non valgono più
+    sql_cache.invalidate(("prenotazioni", "voli"))
+    return booking
+
+
+def booked_in_scope(id_prenotazione: int, scope: str) -> bool:
+    """
+    True se la prenotazione è stata creata da reserve() nell'ambito `scope`: la sua
+    chiave di idempotenza è quella di volo e passeggero della riga in quello scope.
+    Un id citato dalla crew ma prenotato altrove (o inventato) non supera il controllo.
+    """
+    found = database.get_booking_with_key(id_prenotazione)
+    if found is None:
+        return False
+    booking, chiave = found
+    return chiave == idempotency_key(booking.id_volo, booking.nome_utente, booking.cognome_utente,
+                                     booking.mail_utente, scope)
+
+
+def run():
+    """Entry point: migrazione dei posti."""
+    parser = argparse.ArgumentParser(description="Posti dei voli e prenotazioni idempotenti")
+    parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    install()
+    print("we_flai.voli: posti_totali/posti_disponibili installati")
+
+
+if __name__ == "__main__":
+    run()
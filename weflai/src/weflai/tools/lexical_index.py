@@ -0,0 +1,80 @@
+# weflai/tools/lexical_index.py
+"""
+Indice invertito con ranking BM25 per i chunk del regolamento.
+
+Gli embedding ritrovano bene le parafrasi ma male i termini esatti: numeri
+di articolo, nomi di tariffe, "bagaglio a mano 10 kg". BM25 premia proprio
+le parole rare presenti alla lettera, e le due classifiche si fondono in
+weflai.tools.pdf_index (reciprocal rank fusion).
+
+Tokenizzazione: minuscolo senza accenti, numeri separati dalle unità
+("10kg" -> "10", "kg"), stopword italiane escluse, vocale finale tolta dalle
+parole lunghe (bagaglio/bagagli, rimborso/rimborsi -> stessa radice).
+L'indice si costruisce in memoria al caricamento: per qualche centinaio di
+chunk servono millisecondi, nessun file da tenere allineato.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+
+K1 = 1.2
+B = 0.75
+
+_RE_TERM = re.compile(r"\d+|[a-z]+")
+_STOPWORDS = frozenset("""
+a ad al alla alle agli ai all anche che chi ci come con da dal dalla dalle dai degli dei del della delle
+dello di e ed gli ha hanno i il in la le lo ma mi ne nei nel nella nelle non o per piu puo quale quali
+quando questo questa se si sono su sul sulla tra un una uno sia essere viene vengono cosa posso
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    terms = []
+    for term in _RE_TERM.findall(text):
+        if term in _STOPWORDS:
+            continue
+        if len(term) > 4 and term[-1] in "aeiou":
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+class BM25Index:
+    """Liste di posting termine -> [(documento, frequenza)] e lunghezze dei documenti."""
+
+    def __init__(self, texts: list[str], k1: float = K1, b: float = B):
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+        self.lengths: list[int] = []
+        for doc, text in enumerate(texts):
+            terms = tokenize(text)
+            self.lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings.setdefault(term, []).append((doc, tf))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        n = len(self.lengths)
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def scores(self, query: str) -> dict[int, float]:
+        """Punteggio BM25 dei soli documenti che contengono almeno un termine della query."""
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc] / (self.avg_length or 1))
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int) -> list[tuple[int, float]]:
+        """Top-k (documento, punteggio), dal più pertinente."""
+        ranked = sorted(self.scores(query).items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:k]
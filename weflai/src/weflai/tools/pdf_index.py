@@ -0,0 +1,304 @@
+# weflai/tools/pdf_index.py
+"""
+Indice persistente e incrementale del regolamento PDF, con ricerca ibrida.
+
+Struttura su disco (INDEX_DIR/<chiave embedder>/):
+- pages/<hash pagina>.json + .npy : chunk ed embedding di una singola pagina,
+  indirizzati per contenuto; una pagina invariata non viene mai ri-embeddata
+- <hash pdf>.chunks.jsonl + <hash pdf>.npy : indice consolidato del PDF,
+  caricato a runtime con np.load(mmap_mode="r")
+
+La chiave embedder è l'hash di modello + parametri di chunking: cambiando
+configurazione si costruisce un indice nuovo senza toccare quello vecchio.
+
+Chunking per pagina e per sezione: un chunk non attraversa mai una pagina né
+un titolo (articolo, capo, paragrafo numerato, riga in maiuscolo), e porta
+il titolo della sezione in cui si trova, anche se iniziata a pagina
+precedente.
+
+Ricerca (WEFLAI_KB_RETRIEVAL, default hybrid): le classifiche per
+similarità degli embedding e per BM25 (weflai.tools.lexical_index) si
+fondono con reciprocal rank fusion, somma di 1 / (WEFLAI_KB_RRF_K + rango)
+sui primi WEFLAI_KB_CANDIDATES candidati di ciascuna; i migliori passano
+poi dal cross-encoder, se configurato (weflai.tools.reranker). Se
+l'embedding della query non riesce resta la sola classifica BM25.
+
+Build offline:  build_pdf_index [--pdf knowledge_base/regolamento.pdf]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from weflai.registry import OLLAMA_BASE_URL
+from weflai.tools import reranker
+from weflai.tools.lexical_index import BM25Index
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PDF_PATH = os.getenv("WEFLAI_KB_PDF", "knowledge_base/regolamento.pdf")
+INDEX_DIR = os.getenv("WEFLAI_KB_INDEX_DIR", "knowledge_base/.index")
+EMBED_MODEL = os.getenv("WEFLAI_EMBED_MODEL", "ollama/bge-m3")
+CHUNK_SIZE = int(os.getenv("WEFLAI_KB_CHUNK_SIZE", "800"))
+CHUNK_OVERLAP = int(os.getenv("WEFLAI_KB_CHUNK_OVERLAP", "100"))
+EMBED_BATCH = 32
+RETRIEVAL_MODE = os.getenv("WEFLAI_KB_RETRIEVAL", "hybrid")
+CANDIDATES = int(os.getenv("WEFLAI_KB_CANDIDATES", "20"))
+RRF_K = int(os.getenv("WEFLAI_KB_RRF_K", "60"))
+RETRIEVAL_MODES = ("hybrid", "vector", "bm25")
+# Versione del chunking, parte della chiave embedder
+CHUNKER = "sezioni-v1"
+
+# Titoli di sezione: articoli, capi, sezioni, allegati, paragrafi numerati ("3.2 Bagaglio a mano")
+_RE_HEADING = re.compile(
+    r"^(?:(?i:art(?:icolo)?\.?\s*\d+\w*|capo\s+[ivxlc]+\b|sezione\s+\d+|allegato\s+\w+)"
+    r"|\d+(?:\.\d+)*[.)]?\s+[A-ZÀ-Ý])"
+)
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def embedder_key() -> str:
+    """Identifica modello e chunking: fa parte del percorso dell'indice."""
+    config = f"{EMBED_MODEL}|{CHUNK_SIZE}|{CHUNK_OVERLAP}|{CHUNKER}"
+    return hashlib.sha256(config.encode()).hexdigest()[:16]
+
+
+def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
+    """Chunk di circa `size` caratteri, spezzati preferibilmente a fine riga."""
+    text = text.strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            newline = text.rfind("\n", start + size // 2, end)
+            if newline != -1:
+                end = newline
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def is_heading(line: str) -> bool:
+    line = line.strip()
+    if not line or len(line) > 80:
+        return False
+    if _RE_HEADING.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 4 and all(c.isupper() for c in letters) and not line.endswith((".", ",", ";"))
+
+
+def split_sections(text: str) -> list[tuple[Optional[str], str]]:
+    """(titolo, testo) delle sezioni della pagina; titolo None per il testo prima del primo titolo."""
+    sections: list[tuple[Optional[str], list[str]]] = [(None, [])]
+    for line in text.splitlines():
+        if is_heading(line):
+            sections.append((line.strip(), []))
+        sections[-1][1].append(line)
+    return [(title, "\n".join(lines).strip()) for title, lines in sections if "\n".join(lines).strip()]
+
+
+def chunk_page(text: str) -> list[dict]:
+    """
+    Chunk della pagina per sezione: [{"section", "text"}]. Le sezioni troppo
+    corte per un chunk utile si uniscono alla successiva, col titolo della prima.
+    """
+    merged: list[tuple[Optional[str], str]] = []
+    for title, body in split_sections(text):
+        if merged and len(merged[-1][1]) < CHUNK_SIZE // 4:
+            merged[-1] = (merged[-1][0] or title, merged[-1][1] + "\n" + body)
+        else:
+            merged.append((title, body))
+    return [{"section": title, "text": chunk} for title, body in merged for chunk in chunk_text(body)]
+
+
+def embed_texts(texts: list[str]) -> np.ndarray:
+    """Embedding normalizzati (float32) via Ollama, a batch, attraverso il gateway LLM."""
+    from weflai import llm_gateway
+
+    vectors = []
+    for i in range(0, len(texts), EMBED_BATCH):
+        response = llm_gateway.embed(EMBED_MODEL, texts[i:i + EMBED_BATCH], OLLAMA_BASE_URL)
+        vectors.extend(item["embedding"] for item in response.data)
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def build_index(pdf_path: str = PDF_PATH, index_dir: str = INDEX_DIR) -> Path:
+    """
+    Costruisce (o aggiorna) l'indice del PDF ri-embeddando solo le pagine
+    il cui contenuto non è già presente. Restituisce il percorso della matrice.
+    """
+    from pypdf import PdfReader
+
+    store = Path(index_dir) / embedder_key()
+    pages_dir = store / "pages"
+    pages_dir.mkdir(parents=True, exist_ok=True)
+    pdf_hash = file_hash(pdf_path)
+    matrix_path = store / f"{pdf_hash}.npy"
+    if matrix_path.exists():
+        logger.info(f"✓ Indice già aggiornato: {matrix_path}")
+        return matrix_path
+
+    t0 = time.perf_counter()
+    reused = embedded = 0
+    all_chunks, all_vectors = [], []
+    section: Optional[str] = None
+    for page_number, page in enumerate(PdfReader(pdf_path).pages, start=1):
+        text = page.extract_text() or ""
+        page_hash = hashlib.sha256(text.encode()).hexdigest()
+        page_json, page_npy = pages_dir / f"{page_hash}.json", pages_dir / f"{page_hash}.npy"
+        if page_json.exists() and page_npy.exists():
+            chunks = json.loads(page_json.read_text())
+            vectors = np.load(page_npy)
+            reused += 1
+        else:
+            chunks = chunk_page(text)
+            vectors = embed_texts([c["text"] for c in chunks]) if chunks else np.zeros((0, 0), dtype=np.float32)
+            np.save(page_npy, vectors)
+            page_json.write_text(json.dumps(chunks, ensure_ascii=False))
+            embedded += 1
+        for chunk in chunks:
+            # Il testo prima del primo titolo continua la sezione della pagina precedente
+            section = chunk["section"] or section
+            all_chunks.append({"page": page_number, "section": section, "text": chunk["text"]})
+        if len(chunks):
+            all_vectors.append(vectors)
+
+    matrix = np.vstack(all_vectors) if all_vectors else np.zeros((0, 0), dtype=np.float32)
+    # Scrittura atomica: prima i chunk, poi la matrice (che segnala l'indice completo)
+    chunks_path = store / f"{pdf_hash}.chunks.jsonl"
+    with open(chunks_path, "w", encoding="utf-8") as f:
+        for chunk in all_chunks:
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+    tmp_path = store / f"{pdf_hash}.tmp.npy"
+    np.save(tmp_path, matrix)
+    os.replace(tmp_path, matrix_path)
+
+    logger.info(
+        f"✓ Indice PDF costruito in {time.perf_counter() - t0:.1f}s: "
+        f"{len(all_chunks)} chunk, pagine ri-embeddate {embedded}, riutilizzate {reused}"
+    )
+    return matrix_path
+
+
+class PDFIndex:
+    """Indice caricato pigramente: la matrice degli embedding è memory-mapped."""
+
+    def __init__(self, pdf_path: str = PDF_PATH, index_dir: str = INDEX_DIR):
+        self.pdf_path = pdf_path
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._pdf_stat: Optional[tuple[float, int]] = None
+        self._pdf_hash: Optional[str] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._chunks: list[dict] = []
+        self._lexical: Optional[BM25Index] = None
+
+    def _ensure_loaded(self) -> None:
+        stat = os.stat(self.pdf_path)
+        pdf_stat = (stat.st_mtime, stat.st_size)
+        if pdf_stat == self._pdf_stat:
+            return
+        with self._lock:
+            if pdf_stat == self._pdf_stat:
+                return
+            pdf_hash = file_hash(self.pdf_path)
+            store = Path(self.index_dir) / embedder_key()
+            matrix_path = store / f"{pdf_hash}.npy"
+            if not matrix_path.exists():
+                logger.warning("Indice PDF assente o non aggiornato: build incrementale (usa build_pdf_index offline)")
+                build_index(self.pdf_path, self.index_dir)
+            with open(store / f"{pdf_hash}.chunks.jsonl", encoding="utf-8") as f:
+                self._chunks = [json.loads(line) for line in f]
+            self._lexical = BM25Index([f"{c.get('section') or ''}\n{c['text']}" for c in self._chunks])
+            self._matrix = np.load(matrix_path, mmap_mode="r")
+            self._pdf_hash = pdf_hash
+            self._pdf_stat = pdf_stat
+
+    def _vector_ranking(self, query: str, depth: int) -> list[int]:
+        scores = np.asarray(self._matrix @ embed_texts([query])[0])
+        top = np.argpartition(-scores, depth - 1)[:depth]
+        return [int(i) for i in top[np.argsort(-scores[top])]]
+
+    def search(self, query: str, k: int = 4, mode: str = RETRIEVAL_MODE,
+               rerank: Optional[bool] = None) -> list[dict]:
+        """
+        Top-k chunk: [{"page", "section", "text", "score", "ranks"}], con `ranks`
+        la posizione del chunk in ciascuna classifica fusa. `rerank` None = cross-encoder
+        se configurato.
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"modalità di ricerca sconosciuta: {mode} (ammesse: {', '.join(RETRIEVAL_MODES)})")
+        self._ensure_loaded()
+        if not self._chunks:
+            return []
+        depth = min(max(CANDIDATES, k), len(self._chunks))
+
+        rankings: dict[str, list[int]] = {}
+        if mode in ("hybrid", "vector"):
+            try:
+                rankings["vector"] = self._vector_ranking(query, depth)
+            except Exception as e:
+                if mode == "vector":
+                    raise
+                logger.warning(f"Embedding della query non riuscito, solo BM25: {e}")
+        if mode in ("hybrid", "bm25"):
+            rankings["bm25"] = [doc for doc, _ in self._lexical.search(query, depth)]
+        fused = reciprocal_rank_fusion(rankings.values())
+
+        cross_encoder = reranker.get() if rerank is not False else None
+        if cross_encoder is not None and fused:
+            head = fused[:reranker.RERANK_TOP]
+            scores = cross_encoder.scores(query, [self._chunks[doc]["text"] for doc, _ in head])
+            fused = sorted(zip((doc for doc, _ in head), scores), key=lambda item: -item[1]) + fused[len(head):]
+
+        return [
+            {**self._chunks[doc], "score": float(score),
+             "ranks": {name: ranking.index(doc) + 1 for name, ranking in rankings.items() if doc in ranking}}
+            for doc, score in fused[:k]
+        ]
+
+
+def reciprocal_rank_fusion(rankings, rrf_k: int = RRF_K) -> list[tuple[int, float]]:
+    """Fonde classifiche di documenti (dal migliore): somma di 1 / (rrf_k + rango)."""
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def build():
+    """Entry point: costruzione offline dell'indice."""
+    parser = argparse.ArgumentParser(description="Costruisce l'indice persistente del regolamento PDF")
+    parser.add_argument("--pdf", default=PDF_PATH)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(build_index(args.pdf, args.index_dir))
+
+
+if __name__ == "__main__":
+    build()
@@ -1,24 +1,31 @@
-import os
-from crewai_tools import PDFSearchTool
-from dotenv import load_dotenv
+from crewai.tools import tool
 
-load_dotenv()
+from weflai.registry import get_pdf_index
 
+# Indice persistente (weflai.tools.pdf_index, condiviso via registry): nessun parsing
+# o embedding del PDF all'import, la matrice viene mappata in memoria alla prima ricerca.
+# Ricerca ibrida: BM25 per i termini esatti, embedding per le parafrasi
 
 
-pdf_tool = PDFSearchTool(
-    config=dict(
-        llm=dict(
-            provider="ollama",
-            config=dict(
-                model="qwen2.5:7b"
-            ),
-        ),
-        embedder = dict(
-            provider="ollama",
-            config=dict(
-                model="bge-m3"
-            )
-        )
-    ),pdf = "knowledge_base/regolamento.pdf"
-)
\ No newline at end of file
+def _format_result(result: dict) -> str:
+    section = f" · {result['section']}" if result.get("section") else ""
+    return f"[pagina {result['page']}{section}] {result['text']}"
+
+
+@tool("pdf_search")
+def pdf_tool(query: str) -> str:
+    """
+    Cerca nel regolamento WeFlai (knowledge_base/regolamento.pdf) i passaggi
+    più pertinenti alla domanda: bagagli, rimborsi, penali, procedure.
+
+    Input: domanda o parole chiave in italiano, anche termini esatti
+    (numero di articolo, nome della tariffa, "bagaglio a mano 10 kg")
+    Output: estratti del regolamento con pagina e sezione
+    """
+    try:
+        results = get_pdf_index().search(query)
+        if not results:
+            return "Nessun passaggio pertinente trovato nel regolamento."
+        return "\n\n".join(_format_result(r) for r in results)
+    except Exception as e:
+        return f"ERRORE pdf_search: {str(e)}"
@@ -0,0 +1,52 @@
+# weflai/tools/reranker.py
+"""
+Rerank opzionale dei candidati del regolamento con un cross-encoder locale.
+
+Con WEFLAI_KB_RERANK_MODEL (es. BAAI/bge-reranker-v2-m3) il cross-encoder
+legge domanda e chunk insieme e riordina i primi WEFLAI_KB_RERANK_TOP
+candidati (default 10) della fusione di weflai.tools.pdf_index: più preciso
+degli embedding, ma troppo lento per l'intero indice. Richiede
+sentence-transformers (extra "rerank"); se manca o il modello non si
+carica, la ricerca prosegue senza rerank con un avviso.
+"""
+import logging
+import os
+import threading
+from functools import lru_cache
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+RERANK_MODEL = os.getenv("WEFLAI_KB_RERANK_MODEL", "")
+RERANK_TOP = int(os.getenv("WEFLAI_KB_RERANK_TOP", "10"))
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self._model = CrossEncoder(model_name)
+        # predict non è documentato come thread-safe: le sessioni si alternano
+        self._lock = threading.Lock()
+
+    def scores(self, query: str, texts: list[str]) -> list[float]:
+        with self._lock:
+            return [float(s) for s in self._model.predict([(query, text) for text in texts])]
+
+
+@lru_cache(maxsize=None)
+def get(model_name: str = RERANK_MODEL) -> Optional[CrossEncoderReranker]:
+    """Reranker caricato una volta per processo; None se disattivato o non disponibile."""
+    if not model_name:
+        return None
+    try:
+        reranker = CrossEncoderReranker(model_name)
+    except ImportError:
+        logger.warning("WEFLAI_KB_RERANK_MODEL impostato ma sentence-transformers non è installato: niente rerank")
+        return None
+    except Exception as e:
+        logger.warning(f"Cross-encoder {model_name} non caricato, niente rerank: {e}")
+        return None
+    logger.info(f"✓ Cross-encoder {model_name} caricato per il rerank")
+    return reranker
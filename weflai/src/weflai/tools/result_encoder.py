@@ -0,0 +1,119 @@
+# weflai/tools/result_encoder.py
+"""
+Risultati SQL in forma compatta per il prompt degli agenti.
+
+str() delle tuple psycopg2 costa molti token per riga (Decimal('89.90'),
+datetime.date(2026, 3, 1), apici e parentesi) e con il modello locale la
+lunghezza del prompt pesa più di tutto sulla latenza. Qui:
+- una riga sola diventa "colonna=valore | ...";
+- più righe diventano intestazione + righe separate da "|";
+- le colonne con lo stesso valore in tutte le righe salgono in una riga
+  "costanti:" (proiezione), e un valore uguale a quello della riga sopra
+  diventa '"' (deduplicazione);
+- oltre WEFLAI_SQL_PROMPT_ROWS righe (default 20) il resto è riassunto in
+  "… altre N righe", con min/max delle colonne numeriche come suggerimento
+  di aggregazione.
+
+WEFLAI_SQL_RESULT_FORMAT=raw ripristina str(righe) (confronti nei benchmark).
+estimate_tokens() è la stima usata per misurare il risultato nello span del tool.
+"""
+import os
+import re
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Sequence
+
+PROMPT_ROWS = int(os.getenv("WEFLAI_SQL_PROMPT_ROWS", "20"))
+RESULT_FORMAT = os.getenv("WEFLAI_SQL_RESULT_FORMAT", "compact")
+
+_DITTO = '"'
+_RE_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima dei token (parole e segni di punteggiatura), senza tokenizer del modello."""
+    return len(_RE_TOKEN.findall(text))
+
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, Decimal):
+        return format(value, "f")
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="minutes")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, time):
+        return value.strftime("%H:%M" if not value.second else "%H:%M:%S")
+    if isinstance(value, timedelta):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return ",".join(format_value(v) for v in value)
+    # CHAR(n) arriva con gli spazi di riempimento; "|" e a capo romperebbero la tabella
+    return " ".join(str(value).split()).replace("|", "/")
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def _aggregation_hints(columns: Sequence[str], rows: Sequence[tuple]) -> list[str]:
+    hints = []
+    for i, column in enumerate(columns):
+        if column.startswith("id_") or column == "id":
+            continue
+        values = [row[i] for row in rows if _is_number(row[i])]
+        if values and len(values) == sum(row[i] is not None for row in rows):
+            hints.append(f"{column} {format_value(min(values))}-{format_value(max(values))}")
+    return hints
+
+
+def encode_result(columns: Sequence[str], rows: Sequence[tuple], max_rows: int = PROMPT_ROWS,
+                  more: bool = False) -> str:
+    """
+    Tabella compatta delle righe. `more` indica che la query ne aveva altre oltre
+    quelle ricevute (righe già troncate a monte).
+    """
+    if RESULT_FORMAT == "raw":
+        return str(list(rows)) if rows else ""
+    if not rows:
+        return "(nessuna riga)"
+
+    columns = [str(c) for c in columns]
+    cells = [[format_value(v) for v in row] for row in rows]
+    if len(cells) == 1:
+        return " | ".join(f"{c}={v}" for c, v in zip(columns, cells[0]))
+
+    constant = [i for i in range(len(columns)) if all(row[i] == cells[0][i] for row in cells)]
+    if len(constant) == len(columns):
+        return " | ".join(f"{c}={v}" for c, v in zip(columns, cells[0])) + f" (×{len(cells)} righe identiche)"
+    shown = [i for i in range(len(columns)) if i not in constant]
+
+    lines = []
+    if constant:
+        lines.append("costanti: " + " | ".join(f"{columns[i]}={cells[0][i]}" for i in constant))
+    lines.append("|".join(columns[i] for i in shown))
+    previous = None
+    for row in cells[:max_rows]:
+        out = []
+        for i in shown:
+            # Ditto solo dove fa risparmiare: valori lunghi ripetuti dalla riga sopra
+            same = previous is not None and row[i] == previous[i] and len(row[i]) > 3
+            out.append(_DITTO if same else row[i])
+        lines.append("|".join(out))
+        previous = row
+
+    hidden = len(cells) - max_rows
+    if hidden > 0 or more:
+        summary = f"… altre {hidden}{'+' if more else ''} righe non mostrate" if hidden > 0 \
+            else "… altre righe non mostrate"
+        hints = _aggregation_hints(columns, rows)
+        if hints:
+            summary += f"; intervalli sulle {len(cells)} righe lette: {', '.join(hints)}"
+        lines.append(summary + ". Per totali o medie usa COUNT/MIN/MAX/AVG con GROUP BY.")
+    return "\n".join(lines)
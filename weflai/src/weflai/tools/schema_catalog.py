@@ -0,0 +1,283 @@
+# weflai/tools/schema_catalog.py
+"""
+Catalogo in memoria dello schema we_flai.
+
+Tabelle, colonne, tipi, vincoli, indici e qualche riga di esempio vengono
+letti dal catalogo di Postgres una sola volta e riusati da list_tables_tool,
+tables_schema_tool e dai prompt degli agenti (schema_prompt), che così non
+portano più uno schema scritto a mano e destinato a divergere.
+
+Il catalogo si ricarica solo:
+- con invalidate() esplicito
+- quando cambia l'impronta del catalogo (md5 di colonne, tipi e vincoli dello
+  schema, una query sui cataloghi di sistema), controllata al massimo ogni
+  check_interval secondi
+"""
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, NamedTuple, Optional
+
+from weflai.tools import database
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_ROWS = int(os.getenv("WEFLAI_SCHEMA_SAMPLE_ROWS", "3"))
+CHECK_INTERVAL = float(os.getenv("WEFLAI_SCHEMA_CHECK_INTERVAL", "30"))
+
+# Cambia con qualsiasi DDL sullo schema: tabelle, colonne (anche degli indici), tipi, vincoli
+_FINGERPRINT_SQL = """
+    SELECT md5(
+        coalesce((
+            SELECT string_agg(c.relname || '.' || c.relkind || '.' || a.attnum || '.' || a.attname
+                              || '.' || a.atttypid || '.' || a.attnotnull, ',' ORDER BY c.relname, a.attnum)
+            FROM pg_class c
+            JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+            WHERE c.relnamespace = to_regnamespace(:schema)
+        ), '') || '|' || coalesce((
+            SELECT string_agg(conname || '.' || contype, ',' ORDER BY conname)
+            FROM pg_constraint WHERE connamespace = to_regnamespace(:schema)
+        ), '')
+    )
+"""
+
+_TABLES_SQL = """
+    SELECT c.relname, c.relkind, greatest(c.reltuples, 0)::bigint
+    FROM pg_class c
+    WHERE c.relnamespace = to_regnamespace(:schema) AND c.relkind IN ('r', 'p', 'v', 'm')
+    ORDER BY c.relname
+"""
+
+_COLUMNS_SQL = """
+    SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull,
+           pg_get_expr(d.adbin, d.adrelid)
+    FROM pg_class c
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+    WHERE c.relnamespace = to_regnamespace(:schema) AND c.relkind IN ('r', 'p', 'v', 'm')
+    ORDER BY c.relname, a.attnum
+"""
+
+_CONSTRAINTS_SQL = """
+    SELECT cl.relname, con.conname, con.contype, pg_get_constraintdef(con.oid)
+    FROM pg_constraint con
+    JOIN pg_class cl ON cl.oid = con.conrelid
+    WHERE con.connamespace = to_regnamespace(:schema) AND con.contype IN ('p', 'u', 'f', 'c')
+    ORDER BY cl.relname, con.contype, con.conname
+"""
+
+_INDEXES_SQL = """
+    SELECT tablename, indexname, indexdef
+    FROM pg_indexes
+    WHERE schemaname = :schema
+    ORDER BY tablename, indexname
+"""
+
+_RE_KEY_COLUMNS = re.compile(r"^(?:PRIMARY KEY|UNIQUE) \((.+?)\)")
+_RE_FOREIGN_KEY = re.compile(r"^FOREIGN KEY \((.+?)\) REFERENCES (?:[\w\"]+\.)?\"?(\w+)\"?\((.+?)\)")
+
+
+class ColumnInfo(NamedTuple):
+    name: str
+    type: str
+    not_null: bool
+    default: Optional[str]
+
+
+class ConstraintInfo(NamedTuple):
+    name: str
+    kind: str  # p, u, f, c come in pg_constraint.contype
+    definition: str
+
+
+class TableInfo(NamedTuple):
+    name: str
+    kind: str
+    estimated_rows: int
+    columns: list[ColumnInfo]
+    constraints: list[ConstraintInfo]
+    indexes: list[str]
+    sample_columns: list[str]
+    sample_rows: list[tuple]
+
+
+def _quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def normalize_table_name(name: str) -> str:
+    """'We_FlAI.Voli', '"we_flai"."voli"' -> 'voli' (lo schema è sempre DB_SCHEMA)."""
+    return name.strip().strip("'").split(".")[-1].strip().strip('"').lower()
+
+
+class SchemaCatalog:
+    """Snapshot dello schema con refresh su invalidazione o cambio di impronta."""
+
+    def __init__(self, schema: str = database.DB_SCHEMA, sample_rows: int = SAMPLE_ROWS,
+                 check_interval: float = CHECK_INTERVAL):
+        self.schema = schema
+        self.sample_rows = sample_rows
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._tables: Optional[dict[str, TableInfo]] = None
+        self._fingerprint: Optional[str] = None
+        self._checked_at = 0.0
+        self._summary: Optional[str] = None
+
+        self.loads = 0
+        self.checks = 0
+        self.hits = 0
+
+    # --- caricamento ---
+
+    def fingerprint(self) -> str:
+        return database.run_query(_FINGERPRINT_SQL, {"schema": self.schema}).rows[0][0]
+
+    def _load(self) -> dict[str, TableInfo]:
+        t0 = time.perf_counter()
+        params = {"schema": self.schema}
+        columns: dict[str, list[ColumnInfo]] = {}
+        for table, name, type_, not_null, default in database.run_query(_COLUMNS_SQL, params).rows:
+            columns.setdefault(table, []).append(ColumnInfo(name, type_, not_null, default))
+        constraints: dict[str, list[ConstraintInfo]] = {}
+        for table, name, kind, definition in database.run_query(_CONSTRAINTS_SQL, params).rows:
+            constraints.setdefault(table, []).append(ConstraintInfo(name, kind, definition))
+        indexes: dict[str, list[str]] = {}
+        for table, _, definition in database.run_query(_INDEXES_SQL, params).rows:
+            indexes.setdefault(table, []).append(definition)
+
+        tables = {}
+        for name, kind, estimated_rows in database.run_query(_TABLES_SQL, params).rows:
+            sample = database.run_query(
+                f"SELECT * FROM {_quote_ident(self.schema)}.{_quote_ident(name)} LIMIT {int(self.sample_rows)}"
+            ) if self.sample_rows > 0 else database.QueryResult([], [], 0)
+            tables[name] = TableInfo(
+                name=name,
+                kind=kind,
+                estimated_rows=estimated_rows,
+                columns=columns.get(name, []),
+                constraints=constraints.get(name, []),
+                indexes=indexes.get(name, []),
+                sample_columns=sample.columns,
+                sample_rows=sample.rows,
+            )
+        self.loads += 1
+        logger.info(f"✓ Catalogo schema {self.schema} caricato in {time.perf_counter() - t0:.2f}s: {len(tables)} tabelle")
+        return tables
+
+    def tables(self) -> dict[str, TableInfo]:
+        """Tabelle dello schema, ricaricate solo se il catalogo è cambiato."""
+        now = time.monotonic()
+        with self._lock:
+            if self._tables is not None and now - self._checked_at <= self.check_interval:
+                self.hits += 1
+                return self._tables
+            fingerprint = self.fingerprint()
+            self.checks += 1
+            self._checked_at = now
+            if self._tables is None or fingerprint != self._fingerprint:
+                if self._tables is not None:
+                    logger.info(f"Schema {self.schema} modificato: ricarico il catalogo")
+                self._tables = self._load()
+                self._fingerprint = fingerprint
+                self._summary = None
+            else:
+                self.hits += 1
+            return self._tables
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._tables = None
+            self._fingerprint = None
+            self._summary = None
+
+    # --- viste per tool e prompt ---
+
+    def table_names(self) -> list[str]:
+        return list(self.tables())
+
+    def describe(self, names: list[str]) -> str:
+        """DDL, indici e righe di esempio delle tabelle richieste (formato tables_schema_tool)."""
+        tables = self.tables()
+        unknown = [n for n in names if normalize_table_name(n) not in tables]
+        if unknown:
+            raise ValueError(f"tabelle inesistenti: {', '.join(unknown)}. Disponibili: {', '.join(tables)}")
+        return "\n\n".join(_render_table(tables[normalize_table_name(n)]) for n in names)
+
+    def summary(self) -> str:
+        """Riassunto compatto dello schema da inserire nei prompt degli agenti."""
+        tables = self.tables()
+        with self._lock:
+            if self._summary is None:
+                lines = [f'Schema PostgreSQL "{self.schema}" (nomi minuscoli, prefisso {self.schema}.):']
+                lines += [_summarize_table(t) for t in tables.values()]
+                self._summary = "\n".join(lines)
+            return self._summary
+
+    def stats(self) -> str:
+        return f"caricamenti {self.loads}, controlli impronta {self.checks}, hit {self.hits}"
+
+
+def _format_value(value: Any) -> str:
+    text = "" if value is None else str(value)
+    return text if len(text) <= 100 else text[:100] + "..."
+
+
+def _render_table(table: TableInfo) -> str:
+    lines = [f"CREATE TABLE {table.name} ("]
+    body = []
+    for column in table.columns:
+        line = f"\t{column.name} {column.type.upper()}"
+        if column.not_null:
+            line += " NOT NULL"
+        if column.default is not None:
+            line += f" DEFAULT {column.default}"
+        body.append(line)
+    body += [f"\tCONSTRAINT {c.name} {c.definition}" for c in table.constraints]
+    lines.append(",\n".join(body))
+    lines.append(")")
+    for index in table.indexes:
+        lines.append(f"-- {index}")
+    if table.sample_rows:
+        lines.append("")
+        lines.append("/*")
+        lines.append(f"{len(table.sample_rows)} rows from {table.name} table:")
+        lines.append("\t".join(table.sample_columns))
+        lines += ["\t".join(_format_value(v) for v in row) for row in table.sample_rows]
+        lines.append("*/")
+    return "\n".join(lines)
+
+
+def _summarize_table(table: TableInfo) -> str:
+    notes: dict[str, list[str]] = {}
+    for constraint in table.constraints:
+        if constraint.kind in ("p", "u"):
+            match = _RE_KEY_COLUMNS.match(constraint.definition)
+            if match and "," not in match.group(1):
+                notes.setdefault(match.group(1).strip('"'), []).append("PK" if constraint.kind == "p" else "unico")
+        elif constraint.kind == "f":
+            match = _RE_FOREIGN_KEY.match(constraint.definition)
+            if match and "," not in match.group(1):
+                target = match.group(2) + "." + match.group(3).strip('"')
+                notes.setdefault(match.group(1).strip('"'), []).append(f"-> {target}")
+    columns = []
+    for column in table.columns:
+        text = f"{column.name} {column.type}"
+        if column.name in notes:
+            text += " " + " ".join(notes[column.name])
+        columns.append(text)
+    return f"- {table.name}({', '.join(columns)}) ~{table.estimated_rows} righe"
+
+
+def schema_prompt() -> str:
+    """Riassunto dello schema per i prompt; se il DB non risponde, un rimando a list_tables_tool."""
+    from weflai.registry import get_schema_catalog
+
+    try:
+        return get_schema_catalog().summary()
+    except Exception as e:
+        logger.warning(f"Catalogo schema non disponibile: {e}")
+        return f'Schema PostgreSQL "{database.DB_SCHEMA}" (nomi minuscoli): usa list_tables_tool per le tabelle.'
@@ -0,0 +1,263 @@
+# weflai/tools/sql_cache.py
+"""
+Cache dei risultati di execute_sql_tool.
+
+In una stessa run della BookingCrew più agenti leggono le stesse righe di
+voli/aeroporti, e un agente ripete spesso lo stesso SELECT dopo un passo di
+ragionamento: ogni ripetizione è un round-trip con EXPLAIN e query. Qui il
+risultato già codificato per il prompt si conserva con chiave il testo SQL
+normalizzato (senza commenti, spazi singoli, minuscolo fuori da stringhe e
+identificatori quotati), in due livelli:
+- run: uno per kickoff di crew (run_scope, aperto da weflai.flow e dalla
+  cache delle risposte di InfoCrew) e scartato alla fine, con il conteggio
+  di hit e miss nel log; fuori da una run non si usa
+- globale: per i SELECT che leggono solo tabelle di riferimento
+  (WEFLAI_SQL_CACHE_GLOBAL, default "aeroporti"), condiviso tra le sessioni
+  con TTL WEFLAI_SQL_CACHE_TTL secondi (default 3600) ed evizione LRU
+
+Invalidazione: INSERT/UPDATE/DELETE passati dal tool, le prenotazioni di
+weflai.tools.inventory.reserve e le cancellazioni di weflai.cancellation
+scartano, in tutte le run aperte e nel livello globale, le letture che
+hanno toccato le tabelle scritte. Le query con funzioni volatili (now(),
+current_date, random(), ...) non si mettono in cache.
+
+WEFLAI_SQL_CACHE=0 disattiva entrambi i livelli.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+from weflai import telemetry
+from weflai.tools import sql_guard
+from weflai.tools.schema_catalog import normalize_table_name
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("WEFLAI_SQL_CACHE", "1") not in ("0", "false", "False")
+GLOBAL_TABLES = frozenset(
+    normalize_table_name(t) for t in os.getenv("WEFLAI_SQL_CACHE_GLOBAL", "aeroporti").split(",") if t.strip()
+)
+GLOBAL_TTL = float(os.getenv("WEFLAI_SQL_CACHE_TTL", "3600"))
+GLOBAL_MAX_ENTRIES = int(os.getenv("WEFLAI_SQL_CACHE_GLOBAL_MAX", "512"))
+RUN_MAX_ENTRIES = 256
+
+# Tabella dopo FROM/JOIN/INTO/UPDATE, anche in elenchi "from voli v, aeroporti a"
+_RE_TABLES = re.compile(
+    r"\b(?:from|join|into|update)\s+([\w.]+(?:\s+(?:as\s+)?\w+)?(?:\s*,\s*[\w.]+(?:\s+(?:as\s+)?\w+)?)*)"
+)
+_VOLATILE = frozenset({"now", "current_date", "current_time", "current_timestamp", "localtime",
+                       "localtimestamp", "clock_timestamp", "statement_timestamp", "transaction_timestamp",
+                       "timeofday", "random", "nextval", "currval", "setval", "txid_current"})
+_RE_WORD = re.compile(r"[a-z_][a-z0-9_]*")
+
+
+class Statement(NamedTuple):
+    key: str
+    kind: str
+    tables: frozenset[str]
+    volatile: bool
+
+
+def _normalize(body: str) -> str:
+    # Stringhe e identificatori quotati restano come sono, il resto minuscolo a spazi singoli
+    parts, last = [], 0
+    for match in sql_guard._RE_NOISE.finditer(body):
+        parts.append(body[last:match.start()].lower())
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(body[last:].lower())
+    return " ".join("".join(parts).split())
+
+
+def _tables(bare: str) -> frozenset[str]:
+    tables = set()
+    for listing in _RE_TABLES.findall(bare):
+        for item in listing.split(","):
+            tables.add(normalize_table_name(item.split()[0]))
+    return frozenset(tables)
+
+
+def parse(query: str) -> Statement:
+    """Chiave, tipo e tabelle lette/scritte; SqlRejected come sql_guard.classify."""
+    kind, body = sql_guard.classify(query)
+    # Identificatori quotati ridotti a nomi semplici per l'estrazione delle tabelle
+    bare = sql_guard._RE_NOISE.sub(
+        lambda m: m.group(0).strip('"').lower() if m.group(0).startswith('"') else " ", body
+    ).lower()
+    return Statement(_normalize(body), kind, _tables(bare), bool(_VOLATILE.intersection(_RE_WORD.findall(bare))))
+
+
+class _Entry(NamedTuple):
+    result: str
+    tables: frozenset[str]
+    created: float
+
+
+class RunCache:
+    """Risultati letti durante una run, con i contatori riportati a fine run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.hits = self.misses = self.global_hits = self.invalidated = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry.result if entry else None
+
+    def put(self, key: str, result: str, tables: frozenset[str]) -> None:
+        with self._lock:
+            self.entries[key] = _Entry(result, tables, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > RUN_MAX_ENTRIES:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, tables: frozenset[str]) -> int:
+        with self._lock:
+            stale = [key for key, entry in self.entries.items() if entry.tables & tables]
+            for key in stale:
+                del self.entries[key]
+            self.invalidated += len(stale)
+            return len(stale)
+
+
+class GlobalCache:
+    """SELECT sulle sole tabelle di riferimento, condivisi tra le sessioni."""
+
+    def __init__(self, ttl: float = GLOBAL_TTL, max_entries: int = GLOBAL_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.created > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry.result
+
+    def put(self, key: str, result: str, tables: frozenset[str]) -> None:
+        with self._lock:
+            self.entries[key] = _Entry(result, tables, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, tables: frozenset[str]) -> int:
+        with self._lock:
+            stale = [key for key, entry in self.entries.items() if entry.tables & tables]
+            for key in stale:
+                del self.entries[key]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+
+
+global_cache = GlobalCache()
+_runs: set[RunCache] = set()
+_runs_lock = threading.Lock()
+_local = threading.local()
+
+
+def current_run() -> Optional[RunCache]:
+    return getattr(_local, "run", None)
+
+
+@contextmanager
+def run_scope(name: str):
+    """Cache delle query per la run corrente (es. un kickoff di crew) nel thread corrente."""
+    previous = current_run()
+    run = RunCache(name)
+    with _runs_lock:
+        _runs.add(run)
+    _local.run = run
+    try:
+        yield run
+    finally:
+        _local.run = previous
+        with _runs_lock:
+            _runs.discard(run)
+        if run.hits or run.misses or run.global_hits:
+            logger.info(f"Cache SQL {name}: {run.hits + run.global_hits} round-trip evitati "
+                        f"({run.hits} run, {run.global_hits} globali), {run.misses} miss, "
+                        f"{run.invalidated} letture invalidate")
+
+
+def _count(tier: str, outcome: str) -> None:
+    telemetry.metrics.sql_cache.inc(tier=tier, outcome=outcome)
+    span = telemetry.current_span()
+    if span is not None and span.stage == "tool":
+        span.attributes["tool.sql_cache"] = f"{tier}:{outcome}"
+
+
+def lookup(statement: Statement) -> Optional[str]:
+    """Risultato in cache per un SELECT, dalla run corrente o dal livello globale."""
+    if not ENABLED or statement.kind != "select" or statement.volatile:
+        return None
+    run = current_run()
+    if statement.tables and statement.tables <= GLOBAL_TABLES:
+        result = global_cache.get(statement.key)
+        if run is not None:
+            run.global_hits += result is not None
+            run.misses += result is None
+        if result is not None:
+            _count("global", "hit")
+        return result
+    if run is None:
+        return None
+    result = run.get(statement.key)
+    if result is not None:
+        run.hits += 1
+        _count("run", "hit")
+    else:
+        run.misses += 1
+    return result
+
+
+def store(statement: Statement, result: str) -> None:
+    """Conserva il risultato di un SELECT appena eseguito; le scritture invalidano le tabelle toccate."""
+    if not ENABLED:
+        return
+    if statement.kind != "select":
+        invalidate(statement.tables)
+        return
+    if statement.volatile:
+        return
+    if statement.tables and statement.tables <= GLOBAL_TABLES:
+        global_cache.put(statement.key, result, statement.tables)
+        _count("global", "miss")
+        return
+    run = current_run()
+    if run is not None:
+        run.put(statement.key, result, statement.tables)
+        _count("run", "miss")
+
+
+def invalidate(tables) -> int:
+    """Scarta le letture in cache (tutte le run aperte e livello globale) che toccano `tables`."""
+    tables = frozenset(normalize_table_name(t) for t in tables)
+    if not ENABLED or not tables:
+        return 0
+    with _runs_lock:
+        runs = list(_runs)
+    removed = global_cache.invalidate(tables) + sum(run.invalidate(tables) for run in runs)
+    if removed:
+        telemetry.metrics.sql_cache.inc(removed, tier="all", outcome="invalidated")
+        logger.info(f"Cache SQL: {removed} letture invalidate da scrittura su {', '.join(sorted(tables))}")
+    return removed
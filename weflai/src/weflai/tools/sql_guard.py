@@ -0,0 +1,301 @@
+# weflai/tools/sql_guard.py
+"""
+Esecuzione controllata dell'SQL scritto dagli agenti (execute_sql_tool).
+
+Per ogni query:
+1. analisi lessicale (commenti e stringhe esclusi): una sola istruzione, di
+   un tipo ammesso dalla policy dell'agente (default: solo letture);
+2. transazione con statement_timeout locale (WEFLAI_SQL_TIMEOUT_MS) e, per
+   le policy di sola lettura, SET TRANSACTION READ ONLY: il vincolo lo
+   applica anche Postgres;
+3. controllo di Postgres: la query è una sola istruzione (check_single_statement:
+   psycopg2 usa il protocollo semplice, che eseguirebbe ogni istruzione
+   separata da ";" sfuggita all'analisi lessicale);
+4. EXPLAIN (FORMAT JSON): se costo stimato o righe stimate superano il
+   budget (WEFLAI_SQL_MAX_COST, WEFLAI_SQL_MAX_PLAN_ROWS) la query non viene
+   eseguita e l'agente riceve i nodi più costosi del piano e come
+   restringerla;
+5. esecuzione con al massimo WEFLAI_SQL_MAX_ROWS righe restituite.
+
+Piano stimato e latenza finiscono nel log e nello span "db" della query.
+
+Policy per agente (WEFLAI_SQL_POLICIES, "agente=tipo,tipo;..."), es.
+    WEFLAI_SQL_POLICIES="default=select;booking_manager=select,insert"
+Tipi: select, insert, update, delete. DDL, COPY, GRANT, SET, ... mai ammessi.
+L'analisi è lessicale, non un parser SQL completo: le garanzie vere le dà
+Postgres, con il controllo dell'istruzione singola e, per le policy di sola
+lettura, la transazione READ ONLY.
+"""
+import json
+import logging
+import os
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+from sqlalchemy.exc import DBAPIError
+
+from weflai import telemetry
+from weflai.tools import database
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_MS = int(os.getenv("WEFLAI_SQL_TIMEOUT_MS", "5000"))
+MAX_COST = float(os.getenv("WEFLAI_SQL_MAX_COST", "200000"))
+MAX_PLAN_ROWS = float(os.getenv("WEFLAI_SQL_MAX_PLAN_ROWS", "100000"))
+MAX_ROWS = int(os.getenv("WEFLAI_SQL_MAX_ROWS", "200"))
+
+SQLSTATE_QUERY_CANCELED = "57014"
+SQLSTATE_READ_ONLY = "25006"
+SQLSTATE_INVALID_CURSOR = "42P11"
+
+STATEMENT_KINDS = ("select", "insert", "update", "delete")
+_READ_ONLY = frozenset({"select"})
+
+# Stringhe (anche E'...' con escape \'), identificatori quotati, dollar quoting e commenti:
+# nessuna parola chiave al loro interno conta
+_RE_NOISE = re.compile(
+    r"(?<![\w$])[eE]'(?:[^'\\]|\\.|'')*'|'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(\$(?:[A-Za-z_]\w*)?\$).*?\1"
+    r"|--[^\n]*|/\*.*?\*/",
+    re.DOTALL,
+)
+_RE_WORD = re.compile(r"[a-z_][a-z0-9_]*")
+_STARTERS = {"select": "select", "values": "select", "table": "select", "with": None,
+             "insert": "insert", "update": "update", "delete": "delete"}
+# Funzioni con effetti fuori dalla transazione o sul server
+_FORBIDDEN_FUNCTIONS = {"pg_terminate_backend", "pg_cancel_backend", "set_config", "pg_read_file",
+                        "pg_read_binary_file", "pg_ls_dir", "lo_import", "lo_export", "dblink", "dblink_exec",
+                        "pg_reload_conf", "pg_advisory_lock", "pg_sleep"}
+
+
+class SqlRejected(ValueError):
+    """Query non eseguita: il messaggio spiega all'agente come correggerla."""
+
+
+class SqlPolicy(NamedTuple):
+    name: str
+    allowed: frozenset
+
+    @property
+    def read_only(self) -> bool:
+        return self.allowed <= _READ_ONLY
+
+
+class PlanEstimate(NamedTuple):
+    cost: float
+    rows: float
+    # (costo, descrizione) dei nodi più costosi
+    hotspots: list[tuple[float, str]]
+
+
+class GuardedResult(NamedTuple):
+    result: database.QueryResult
+    plan: PlanEstimate
+    truncated: bool
+    seconds: float
+
+
+def _parse_policies(spec: str) -> dict[str, frozenset]:
+    policies = {}
+    for item in spec.split(";"):
+        agent, _, kinds = item.partition("=")
+        allowed = frozenset(k.strip().lower() for k in kinds.split(",") if k.strip())
+        unknown = allowed - set(STATEMENT_KINDS)
+        if unknown:
+            logger.warning(f"WEFLAI_SQL_POLICIES: tipi sconosciuti {sorted(unknown)} per {agent.strip()}")
+        if agent.strip():
+            policies[agent.strip()] = allowed & set(STATEMENT_KINDS)
+    return policies
+
+
+_POLICIES = _parse_policies(os.getenv("WEFLAI_SQL_POLICIES", "default=select"))
+
+
+def policy_for(agent: str) -> SqlPolicy:
+    """Policy dell'agente (nome della chiave in agents.yaml), altrimenti quella di default."""
+    allowed = _POLICIES.get(agent, _POLICIES.get("default", _READ_ONLY))
+    return SqlPolicy(agent, allowed)
+
+
+def _top_level_words(bare: str) -> list[str]:
+    """Parole fuori da ogni parentesi."""
+    words, depth = [], 0
+    for token in re.findall(r"[a-z_][a-z0-9_]*|[()]", bare):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            words.append(token)
+    return words
+
+
+def classify(query: str) -> tuple[str, str]:
+    """
+    (tipo, sql senza commenti) di una singola istruzione. SqlRejected se ce n'è
+    più di una, se non è SELECT/INSERT/UPDATE/DELETE (anche dentro WITH), se è
+    un SELECT ... INTO o se chiama funzioni di amministrazione.
+    """
+    body = _RE_NOISE.sub(lambda m: " " if m.group(0).startswith(("--", "/*")) else m.group(0), query)
+    body = body.strip().rstrip(";").strip()
+    if not body:
+        raise SqlRejected("Query vuota.")
+    bare = _RE_NOISE.sub(" ", body).lower()
+    if ";" in bare:
+        raise SqlRejected("Una sola istruzione per chiamata: separa le query in più chiamate al tool.")
+    words = _RE_WORD.findall(bare)
+    if not words or words[0] not in _STARTERS:
+        raise SqlRejected(f"Istruzione '{(words or ['?'])[0].upper()}' non ammessa: usa SELECT.")
+
+    kind = _STARTERS[words[0]]
+    if kind is None:
+        # CTE: il corpo di ogni blocco "AS (" e l'istruzione principale devono essere ammessi
+        bodies = re.findall(r"\bas\s+(?:not\s+)?(?:materialized\s+)?\(\s*([a-z_]+)", bare)
+        main = next((w for w in _top_level_words(bare)[1:] if w in _STARTERS), None)
+        starters = bodies + [main]
+        if main in (None, "with") or any(w not in _STARTERS or w == "with" for w in bodies):
+            raise SqlRejected("WITH ammesso solo con SELECT/INSERT/UPDATE/DELETE nei suoi blocchi.")
+        writes = [_STARTERS[w] for w in starters if _STARTERS[w] != "select"]
+        kind = writes[0] if writes else "select"
+    if kind == "select" and "into" in words and "insert" not in words:
+        raise SqlRejected("SELECT ... INTO crea tabelle e non è ammesso: usa un SELECT semplice.")
+    functions = _FORBIDDEN_FUNCTIONS.intersection(words)
+    if functions:
+        raise SqlRejected(f"Funzioni non ammesse: {', '.join(sorted(functions))}.")
+    return kind, body
+
+
+def check_allowed(kind: str, policy: SqlPolicy) -> None:
+    if kind in policy.allowed:
+        return
+    hint = {
+        "insert": "Le prenotazioni si creano con book_seat_tool.",
+        "delete": "Le cancellazioni passano da cancel_booking_tool.",
+    }.get(kind, "")
+    raise SqlRejected(f"{kind.upper()} non consentito per questo agente (ammessi: "
+                      f"{', '.join(sorted(k.upper() for k in policy.allowed)) or 'nessuno'}). {hint}".strip())
+
+
+def _plan_nodes(plan: dict):
+    """(costo, descrizione) di ogni nodo del piano."""
+    node = plan.get("Node Type", "?")
+    relation = plan.get("Relation Name")
+    description = f"{node}{' su ' + relation if relation else ''} (righe≈{plan.get('Plan Rows', 0):.0f})"
+    children = plan.get("Plans", [])
+    if node == "Nested Loop" and "Join Filter" not in plan and not any(
+        "Index Cond" in child or "Recheck Cond" in child for child in children
+    ):
+        description += " senza condizione di join (prodotto cartesiano?)"
+    yield float(plan.get("Total Cost", 0.0)), description
+    for child in children:
+        yield from _plan_nodes(child)
+
+
+def _dollar_tag(text: str) -> str:
+    """Delimitatore di dollar quoting che non compare in `text`: il testo non può chiuderlo."""
+    while True:
+        tag = f"$q{secrets.token_hex(6)}$"
+        if tag not in text:
+            return tag
+
+
+def check_single_statement(conn, body: str) -> None:
+    """
+    Postgres verifica che `body` sia una sola istruzione, senza eseguirla: PL/pgSQL apre
+    un cursore su EXPLAIN <body> (testo in dollar quoting) e rifiuta un piano con più
+    istruzioni prima di eseguirne una. SqlRejected se le istruzioni sono più di una.
+    """
+    inner = _dollar_tag(body)
+    outer = _dollar_tag(body + inner)
+    gate = (f"DO {outer} DECLARE r record; BEGIN "
+            f"FOR r IN EXECUTE 'EXPLAIN ' || {inner}{body}{inner} LOOP END LOOP; END {outer}")
+    try:
+        conn.exec_driver_sql(gate)
+    except DBAPIError as e:
+        if getattr(e.orig, "pgcode", None) == SQLSTATE_INVALID_CURSOR:
+            raise SqlRejected("Una sola istruzione per chiamata: separa le query in più chiamate al tool.") from e
+        raise
+
+
+def explain(conn, body: str) -> PlanEstimate:
+    """Stima del planner, senza eseguire la query."""
+    raw = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {body}").scalar_one()
+    plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+    hotspots = sorted(_plan_nodes(plan), key=lambda node: node[0], reverse=True)[:3]
+    return PlanEstimate(float(plan.get("Total Cost", 0.0)), float(plan.get("Plan Rows", 0.0)), hotspots)
+
+
+def check_budget(plan: PlanEstimate) -> None:
+    if plan.cost <= MAX_COST and plan.rows <= MAX_PLAN_ROWS:
+        return
+    hotspots = "; ".join(description for _, description in plan.hotspots)
+    seq_scan = any(description.startswith("Seq Scan") for _, description in plan.hotspots)
+    advice = ["aggiungi filtri WHERE selettivi"]
+    if seq_scan:
+        advice.append("filtra su colonne indicizzate (voli: id_volo o id_apt_ptz+id_apt_arr+data_ptz; "
+                      "prenotazioni: id_prenotazione, id_volo, mail_utente)")
+    if "cartesiano" in hotspots:
+        advice.append("collega ogni tabella nel JOIN con ON ...")
+    advice.append(f"usa LIMIT (al massimo {MAX_ROWS} righe) o aggregazioni (count, min, ...)")
+    advice.append("per il volo più economico di una tratta usa cheapest_flight_tool")
+    raise SqlRejected(
+        f"Query rifiutata prima dell'esecuzione: costo stimato {plan.cost:.0f} (budget {MAX_COST:.0f}), "
+        f"righe stimate {plan.rows:.0f} (budget {MAX_PLAN_ROWS:.0f}). Nodi più costosi: {hotspots}. "
+        f"Riscrivi la query: {'; '.join(advice)}."
+    )
+
+
+@contextmanager
+def _feedback_on_db_errors():
+    try:
+        yield
+    except DBAPIError as e:
+        pgcode = getattr(e.orig, "pgcode", None)
+        if pgcode == SQLSTATE_QUERY_CANCELED:
+            raise SqlRejected(f"Query interrotta dopo {TIMEOUT_MS} ms (statement_timeout): restringi i filtri, "
+                              "evita funzioni sulle colonne indicizzate e aggiungi LIMIT.") from e
+        if pgcode == SQLSTATE_READ_ONLY:
+            raise SqlRejected("Questo agente può solo leggere: niente INSERT/UPDATE/DELETE, "
+                              "nemmeno tramite funzioni o SELECT ... FOR UPDATE.") from e
+        raise
+
+
+def run(query: str, policy: Optional[SqlPolicy] = None) -> GuardedResult:
+    """Esegue `query` con i controlli della policy; SqlRejected se non ammessa o fuori budget."""
+    policy = policy or policy_for("default")
+    kind, body = classify(query)
+    check_allowed(kind, policy)
+
+    t0 = time.perf_counter()
+    with _feedback_on_db_errors(), telemetry.span("guarded_query", "db", kind=kind, policy=policy.name) as span, \
+            database.get_engine().begin() as conn:
+        raw = conn.execution_options(no_parameters=True)
+        if policy.read_only:
+            raw.exec_driver_sql("SET TRANSACTION READ ONLY")
+        raw.exec_driver_sql(f"SET LOCAL statement_timeout = {TIMEOUT_MS}")
+        check_single_statement(raw, body)
+        plan = explain(raw, body)
+        span.attributes.update({"plan.cost": plan.cost, "plan.rows": plan.rows})
+        try:
+            check_budget(plan)
+        except SqlRejected:
+            span.attributes["rejected"] = True
+            logger.warning(f"SQL rifiutata ({policy.name}): costo {plan.cost:.0f}, righe {plan.rows:.0f}\n{body}")
+            raise
+
+        result = raw.exec_driver_sql(body)
+        if result.returns_rows:
+            columns = list(result.keys())
+            rows = [tuple(row) for row in result.fetchmany(MAX_ROWS + 1)]
+            truncated = len(rows) > MAX_ROWS
+            query_result = database.QueryResult(columns, rows[:MAX_ROWS], len(rows[:MAX_ROWS]))
+            result.close()
+        else:
+            truncated = False
+            query_result = database.QueryResult([], [], result.rowcount)
+    seconds = time.perf_counter() - t0
+    logger.info(f"SQL {kind} ({policy.name}): costo stimato {plan.cost:.0f}, righe stimate {plan.rows:.0f}, "
+                f"righe {query_result.rowcount}{'+' if truncated else ''}, {seconds * 1000:.1f} ms")
+    return GuardedResult(query_result, plan, truncated, seconds)
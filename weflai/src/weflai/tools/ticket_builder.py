@@ -0,0 +1,153 @@
+# weflai/tools/ticket_builder.py
+"""
+Emissione diretta dei biglietti.
+
+Il TicketOutput si costruisce dalla JOIN fissa prenotazioni/voli/aeroporti
+(prepared statement in weflai.tools.database) invece di chiedere a un agente
+di scrivere la query e mappare le colonne: nessun round-trip LLM e nessun
+valore inventato. Supporta anche la ristampa di molti biglietti in blocco e
+la ricerca delle prenotazioni di un cliente (stato prenotazione) per numero,
+mail oppure nome e cognome.
+
+Ristampa: print_tickets 12 13 14 > biglietti.jsonl
+"""
+import argparse
+import re
+import sys
+from typing import Iterable, NamedTuple, Optional
+
+from weflai.models import TicketOutput
+from weflai.tools import database
+from weflai.tools.database import TicketRow
+from weflai.tools.flight_search import FlightMatch
+
+_RE_BOOKING_ID = re.compile(r"id_prenotazione\D{0,5}(\d+)", re.IGNORECASE)
+_RE_LOOKUP_ID = re.compile(
+    r"\b(?:prenotazione|biglietto|codice|id|numero|n\.|nr\.?)\s*(?:n\.|numero|nr\.?|#)?\s*(\d+)\b", re.IGNORECASE
+)
+_RE_MAIL = re.compile(r"[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}", re.IGNORECASE)
+_RE_NAME_AFTER = re.compile(r"\b(?:di|per|a nome(?: di)?|intestat[ao] a)\s+([^\W\d_][\w']+)\s+([^\W\d_][\w']+)",
+                            re.IGNORECASE)
+_RE_CAPITALIZED = re.compile(r"(?<=\s)([A-ZÀ-Ý][a-zà-ÿ']+)\s+([A-ZÀ-Ý][a-zà-ÿ']+)\b")
+_NOT_NAMES = {"il", "lo", "la", "le", "gli", "un", "una", "mio", "mia", "miei", "mie", "suo", "sua",
+              "volo", "voli", "biglietto", "prenotazione", "prenotazioni", "domani", "oggi", "ieri"}
+
+
+class BookingLookup(NamedTuple):
+    """Criteri di ricerca estratti da una richiesta di stato prenotazione."""
+    id_prenotazione: Optional[int] = None
+    mail: Optional[str] = None
+    nome: Optional[str] = None
+    cognome: Optional[str] = None
+
+
+def ticket_from_row(row: TicketRow, note: str = "Prenotazione confermata") -> TicketOutput:
+    return TicketOutput(
+        id_prenotazione=row.id_prenotazione,
+        id_volo=row.id_volo,
+        passeggero=f"{row.nome_utente} {row.cognome_utente}",
+        compagnia=row.compagnia,
+        partenza_iata=row.partenza_iata.strip(),
+        arrivo_iata=row.arrivo_iata.strip(),
+        tratta=f"{row.citta_partenza} - {row.citta_arrivo}",
+        data=row.data_ptz.isoformat(),
+        orario_partenza=row.ora_ptz.strftime("%H:%M"),
+        orario_arrivo=row.ora_arr.strftime("%H:%M"),
+        note=note,
+    )
+
+
+def ticket_from_flight(match: FlightMatch, passeggero: str, id_prenotazione: int) -> TicketOutput:
+    """Biglietto di una prenotazione appena inserita sul volo `match`, senza rileggere il DB."""
+    return TicketOutput(
+        id_prenotazione=id_prenotazione,
+        id_volo=match.id_volo,
+        passeggero=passeggero,
+        compagnia=match.compagnia,
+        partenza_iata=match.partenza_iata,
+        arrivo_iata=match.arrivo_iata,
+        tratta=f"{match.citta_partenza} - {match.citta_arrivo}",
+        data=match.data.isoformat(),
+        orario_partenza=match.orario_partenza,
+        orario_arrivo=match.orario_arrivo,
+    )
+
+
+def build_ticket(id_prenotazione: int) -> Optional[TicketOutput]:
+    """Biglietto di una prenotazione; None se la prenotazione non esiste."""
+    row = database.get_ticket_row(id_prenotazione)
+    return ticket_from_row(row) if row else None
+
+
+def build_tickets(ids: Iterable[int]) -> list[TicketOutput]:
+    """Biglietti di molte prenotazioni con una sola query (ristampe, gruppi)."""
+    return [ticket_from_row(row) for row in database.get_ticket_rows(list(ids))]
+
+
+def parse_booking_id(text: str) -> Optional[int]:
+    """Estrae l'id_prenotazione dall'output di insert_booking_task."""
+    text = text.strip().strip("`'\"")
+    if text.isdigit():
+        return int(text)
+    match = _RE_BOOKING_ID.search(text)
+    return int(match.group(1)) if match else None
+
+
+def parse_lookup(text: str) -> BookingLookup:
+    """Numero di prenotazione, mail o nome e cognome citati nella richiesta (il primo disponibile)."""
+    match = _RE_LOOKUP_ID.search(text)
+    if match:
+        return BookingLookup(id_prenotazione=int(match.group(1)))
+    if text.strip().isdigit():
+        return BookingLookup(id_prenotazione=int(text.strip()))
+    match = _RE_MAIL.search(text)
+    if match:
+        return BookingLookup(mail=match.group(0))
+    passenger = parse_passenger(text)
+    if passenger is not None:
+        return BookingLookup(nome=passenger[0], cognome=passenger[1])
+    return BookingLookup()
+
+
+def parse_passenger(text: str) -> Optional[tuple[str, str]]:
+    """Nome e cognome citati nel testo ("per Mario Rossi", "Mario Rossi"); None se assenti."""
+    for pattern in (_RE_NAME_AFTER, _RE_CAPITALIZED):
+        for match in pattern.finditer(text):
+            nome, cognome = match.group(1), match.group(2)
+            if nome.lower() not in _NOT_NAMES and cognome.lower() not in _NOT_NAMES:
+                return nome.capitalize(), cognome.capitalize()
+    return None
+
+
+def parse_mail(text: str) -> Optional[str]:
+    match = _RE_MAIL.search(text)
+    return match.group(0) if match else None
+
+
+def lookup_tickets(text: str, limit: int = 10) -> Optional[list[TicketOutput]]:
+    """Biglietti della richiesta di stato; None se non contiene né numero, né mail, né nome."""
+    lookup = parse_lookup(text)
+    if lookup.id_prenotazione is not None:
+        ticket = build_ticket(lookup.id_prenotazione)
+        return [ticket] if ticket else []
+    if lookup.mail or lookup.nome:
+        rows = database.find_ticket_rows(lookup.mail, lookup.nome, lookup.cognome, limit)
+        return [ticket_from_row(row) for row in rows]
+    return None
+
+
+def run():
+    """Entry point: ristampa dei biglietti in JSONL."""
+    parser = argparse.ArgumentParser(description="Ristampa biglietti per id_prenotazione")
+    parser.add_argument("ids", nargs="+", type=int)
+    args = parser.parse_args()
+    tickets = build_tickets(args.ids)
+    for ticket in tickets:
+        sys.stdout.write(ticket.model_dump_json() + "\n")
+    missing = set(args.ids) - {int(t.id_prenotazione) for t in tickets}
+    if missing:
+        print(f"Prenotazioni non trovate: {sorted(missing)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    run()
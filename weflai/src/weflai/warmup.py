@@ -0,0 +1,102 @@
+# weflai/warmup.py
+"""
+Riscaldamento all'avvio: modelli Ollama caricati in memoria e crew pronte.
+
+Ollama carica un modello alla prima richiesta (secondi, decine per un 8B su
+CPU) e lo scarica dopo keep_alive di inattività (default 5 minuti). Qui:
+- warm_ollama() manda a ogni modello una richiesta vuota con keep_alive
+  WEFLAI_OLLAMA_KEEP_ALIVE (default 30m): il caricamento avviene subito,
+  non sulla prima richiesta dell'utente (le richieste del gateway,
+  weflai.llm_gateway, rinnovano lo stesso keep_alive)
+- start_keepalive() ripete il ping ogni WEFLAI_OLLAMA_KEEPALIVE_INTERVAL
+  secondi (server sempre acceso: il modello non viene mai scaricato)
+- prewarm() fa entrambe le cose in un thread e riempie le riserve di crew
+  (weflai.crew_pool)
+"""
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from typing import Optional
+
+from weflai import crew_pool
+from weflai.llm_gateway import KEEP_ALIVE, ollama_name
+from weflai.registry import OLLAMA_BASE_URL
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_INTERVAL = float(os.getenv("WEFLAI_OLLAMA_KEEPALIVE_INTERVAL", "600"))
+WARMUP_ENABLED = os.getenv("WEFLAI_WARMUP", "1") not in ("0", "false", "False")
+
+_keepalive_started = False
+_keepalive_lock = threading.Lock()
+
+
+def _post(path: str, payload: dict, timeout: float) -> None:
+    request = urllib.request.Request(
+        OLLAMA_BASE_URL.rstrip("/") + path,
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+def warm_ollama(models: Optional[list[str]] = None, timeout: float = 300.0) -> dict[str, float]:
+    """Carica i modelli (LLM ed embedding) in Ollama; secondi impiegati per modello."""
+    from weflai.routing import models_in_use
+    from weflai.tools.pdf_index import EMBED_MODEL
+
+    timings = {}
+    # Anche il modello piccolo, se la politica di routing (weflai.routing) lo usa
+    for model in models or [*models_in_use(), EMBED_MODEL]:
+        name = ollama_name(model)
+        if name is None:
+            continue
+        t0 = time.perf_counter()
+        try:
+            if model == EMBED_MODEL:
+                _post("/api/embed", {"model": name, "input": "warmup", "keep_alive": KEEP_ALIVE}, timeout)
+            else:
+                # Senza prompt Ollama carica il modello e risponde subito
+                _post("/api/generate", {"model": name, "keep_alive": KEEP_ALIVE}, timeout)
+        except Exception as e:
+            logger.warning(f"Warmup di {model} non riuscito: {e}")
+            continue
+        timings[model] = time.perf_counter() - t0
+        logger.info(f"🔥 Modello {model} caricato in {timings[model]:.1f}s (keep_alive {KEEP_ALIVE})")
+    return timings
+
+
+def start_keepalive(interval: float = KEEPALIVE_INTERVAL) -> None:
+    """Ping periodico ai modelli per tenerli in memoria (idempotente)."""
+    global _keepalive_started
+    with _keepalive_lock:
+        if _keepalive_started or interval <= 0:
+            return
+        _keepalive_started = True
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            warm_ollama()
+
+    threading.Thread(target=loop, name="weflai-keepalive", daemon=True).start()
+
+
+def prewarm(keepalive: bool = False) -> Optional[threading.Thread]:
+    """Crew pronte e modelli caricati in background; il thread restituito si può ignorare."""
+    if not WARMUP_ENABLED:
+        return None
+    crew_pool.prewarm()
+
+    def run():
+        warm_ollama()
+        if keepalive:
+            start_keepalive()
+
+    thread = threading.Thread(target=run, name="weflai-warmup", daemon=True)
+    thread.start()
+    return thread
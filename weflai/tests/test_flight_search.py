@@ -0,0 +1,41 @@
+from datetime import date
+
+import pytest
+
+from weflai.tools import flight_search
+
+TODAY = date(2026, 11, 20)
+ROMA, MILANO = ["FCO"], ["MXP", "LIN"]
+
+
+@pytest.fixture(autouse=True)
+def seed_gazetteer(monkeypatch):
+    # Gazetteer dai seed: nessun accesso al DB
+    monkeypatch.setattr(flight_search, "_gazetteer", flight_search._build_gazetteer(flight_search._SEED_AIRPORTS))
+
+
+@pytest.mark.parametrize("query", [
+    "Volo da Roma a Milano il 01/12",
+    "Volo Roma Milano il 01/12",
+    "Volo Roma a Milano il 01/12",
+    "Volo Roma per Milano il 01/12",
+    "Volo da Roma per Milano il 01/12",
+    "Volo a Milano da Roma il 01/12",
+    "Volo per Milano da Roma il 01/12",
+    "Volo per Milano Roma il 01/12",
+    "Volo Milano da Roma il 01/12",
+    "Volo verso Milano, partenza Roma, il 01/12",
+])
+def test_parse_query_route_orderings(query):
+    flight_query = flight_search.parse_query(query, TODAY)
+    assert flight_query is not None
+    assert (flight_query.partenza, flight_query.arrivo) == (ROMA, MILANO)
+    assert flight_query.data == date(2026, 12, 1)
+
+
+@pytest.mark.parametrize("query", [
+    "Volo da Roma da Milano il 01/12",
+    "Volo a Roma per Milano il 01/12",
+])
+def test_parse_query_conflicting_markers_is_ambiguous(query):
+    assert flight_search.parse_query(query, TODAY) is None
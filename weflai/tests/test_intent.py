@@ -0,0 +1,23 @@
+import pytest
+
+from weflai import intent
+
+
+@pytest.mark.parametrize("text", [
+    "Quanto costa cancellare la prenotazione 123?",
+    "Non voglio cancellare la prenotazione 77, voglio cambiarla",
+    "Posso annullare il volo senza penale?",
+])
+def test_negations_and_questions_never_cancel(text):
+    assert intent.classify(text, llm_fallback=False).intent != "cancellation"
+
+
+@pytest.mark.parametrize("text", [
+    "Cancella la prenotazione di Mario Rossi",
+    "annulla il mio volo per milano",
+    "voglio disdire la prenotazione",
+])
+def test_explicit_cancellation_clears_the_stricter_threshold(text):
+    result = intent.classify(text, llm_fallback=False)
+    assert result.intent == "cancellation"
+    assert result.confidence >= intent.threshold_for("cancellation")
@@ -0,0 +1,82 @@
+import pytest
+
+from weflai.tools import sql_guard
+from weflai.tools.sql_guard import SqlRejected, classify
+
+
+@pytest.mark.parametrize("query, kind", [
+    ("SELECT id_volo FROM we_flai.voli WHERE id_volo = 1;", "select"),
+    ("select 'a; delete from x' as testo", "select"),
+    ("SELECT E'it\\'s; DELETE FROM x' AS testo", "select"),
+    ("SELECT $$; DROP TABLE x$$, $tag$ ; $tag$", "select"),
+    ("SELECT 1 -- ; DELETE FROM x\n", "select"),
+    ("SELECT 1 /* ; DELETE FROM x */", "select"),
+    ("SELECT \"into\" FROM we_flai.voli", "select"),
+    ("VALUES (1), (2)", "select"),
+    ("INSERT INTO we_flai.prenotazioni (nome_utente) VALUES ('Mario')", "insert"),
+    ("INSERT INTO we_flai.prenotazioni (nome_utente) SELECT nome_utente FROM we_flai.prenotazioni", "insert"),
+    ("WITH v AS (SELECT id_volo FROM we_flai.voli) SELECT * FROM v", "select"),
+    ("WITH d AS (DELETE FROM we_flai.prenotazioni RETURNING *) SELECT count(*) FROM d", "delete"),
+    ("WITH v AS (SELECT 1) UPDATE we_flai.voli SET prezzo = 1", "update"),
+])
+def test_classify_kind(query, kind):
+    assert classify(query)[0] == kind
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT 1; DELETE FROM we_flai.prenotazioni",
+    "SELECT 1;; SELECT 2",
+    # Il ' dopo il backslash di una stringa E'...' non la chiude: il DELETE è una seconda istruzione
+    "INSERT INTO we_flai.prenotazioni (nome_utente) VALUES (E'\\''); DELETE FROM we_flai.prenotazioni; SELECT ''''",
+    "SELECT e'\\\\'; DELETE FROM we_flai.prenotazioni",
+])
+def test_classify_rejects_multiple_statements(query):
+    with pytest.raises(SqlRejected, match="Una sola istruzione"):
+        classify(query)
+
+
+@pytest.mark.parametrize("query", [
+    "DROP TABLE we_flai.voli",
+    "SET statement_timeout = 0",
+    "COPY we_flai.voli TO '/tmp/voli'",
+    "WITH x AS (DROP TABLE we_flai.voli) SELECT 1",
+    "WITH x AS (SELECT 1) COPY we_flai.voli TO STDOUT",
+])
+def test_classify_rejects_other_statements(query):
+    with pytest.raises(SqlRejected):
+        classify(query)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * INTO copia FROM we_flai.voli",
+    "WITH v AS (SELECT 1) SELECT * INTO copia FROM v",
+])
+def test_classify_rejects_select_into(query):
+    with pytest.raises(SqlRejected, match="INTO"):
+        classify(query)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT pg_sleep(10)",
+    "SELECT set_config('statement_timeout', '0', false)",
+    "SELECT * FROM we_flai.voli WHERE pg_terminate_backend(1)",
+    "WITH x AS (SELECT pg_read_file('/etc/passwd')) SELECT * FROM x",
+])
+def test_classify_rejects_forbidden_functions(query):
+    with pytest.raises(SqlRejected, match="Funzioni non ammesse"):
+        classify(query)
+
+
+def test_single_statement_gate_quotes_the_body():
+    class Conn:
+        def exec_driver_sql(self, sql):
+            self.sql = sql
+
+    body = "SELECT $q$ ; $q$, E'\\'' FROM we_flai.voli"
+    conn = Conn()
+    sql_guard.check_single_statement(conn, body)
+    # Il testo resta dentro un dollar quoting con un delimitatore che non vi compare
+    _, _, rest = conn.sql.partition("'EXPLAIN ' || ")
+    tag = rest[:rest.index("$", 1) + 1]
+    assert tag not in body
+    assert rest.startswith(f"{tag}{body}{tag} LOOP")